@@ -9,16 +9,358 @@ handle basic authentication support.
 
 import uuid
 import hashlib
+import hmac
+import os
+import threading
+import time
+import traceback
+
+from collections import OrderedDict
 
 from util.module import ModuleBase
 from util.database import Database
+from util import sysargs
+
+# the prefix of the password hashes computed on the server
+HASH_SCHEME = 'pbkdf2_sha256'
+
+def hash_password(password_hash, iterations=None, salt=None):
+    ''' Returns the salted PBKDF2 hash to store for the MD5 password hash sent by the clients,
+        in "scheme$iterations$salt$hash" form (hexadecimal salt and hash). '''
+    if iterations is None:
+        iterations = sysargs.auth.hash_iterations
+    if salt is None:
+        salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password_hash, salt, iterations)
+    return '$'.join( (HASH_SCHEME, str(iterations), salt.encode('hex'), digest.encode('hex')) )
+
+def verify_password(password_hash, stored):
+    ''' Checks the MD5 password hash sent by a client against the stored one.
+        Returns whether it matches and whether the stored hash should be upgraded
+        (legacy MD5 hashes and hashes with fewer iterations than configured). '''
+    if not stored.startswith(HASH_SCHEME + '$'):
+        return hmac.compare_digest(str(stored), str(password_hash)), True # legacy plain MD5 hash
+    
+    scheme, iterations, salt, digest = stored.split('$')  # @UnusedVariable
+    expected = hashlib.pbkdf2_hmac('sha256', str(password_hash), salt.decode('hex'), int(iterations))
+    return hmac.compare_digest(expected, digest.decode('hex')), int(iterations) < sysargs.auth.hash_iterations
+
+class CredentialCache(object):
+    ''' Thread-safe LRU cache of the credentials verified recently, keyed by a digest
+        salted with a per-process secret, so repeated logins skip the database and the
+        password hashing. Only successful verifications are cached. '''
+    
+    def __init__(self, max_entries=1024):
+        self.__max_entries = max_entries
+        self.__secret      = os.urandom(32)
+        self.__lock        = threading.Lock()
+        self.__entries     = OrderedDict()   # key -> (user identifier, administrator), least recently used first
+        self.__generation  = 0               # incremented on every invalidation
+        
+        self.hits   = 0
+        self.misses = 0
+    
+    def key(self, username, password_hash):
+        ''' Returns the cache key of the credentials. '''
+        return hmac.new(self.__secret, username + '\0' + password_hash, hashlib.sha256).digest()
+    
+    def generation(self):
+        ''' Returns the token to pass to "put" after reading the credentials from the database. '''
+        with self.__lock:
+            return self.__generation
+    
+    def get(self, key):
+        ''' Returns the user identifier and administrator flag of the credentials or None. '''
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.__entries[key] = entry   # most recently used
+            self.hits += 1
+            return entry
+    
+    def put(self, key, userid, admin, generation):
+        ''' Caches verified credentials, unless the users changed since "generation". '''
+        if not self.__max_entries:
+            return
+        with self.__lock:
+            if generation != self.__generation:
+                return # read before an invalidation, may be stale
+            self.__entries[key] = (userid, admin)
+            while len(self.__entries) > self.__max_entries:
+                self.__entries.popitem(last=False)
+    
+    def invalidate(self, userid):
+        ''' Removes the cached credentials of the user with the given identifier. '''
+        with self.__lock:
+            self.__generation += 1
+            for key, entry in self.__entries.items():
+                if entry[0] == userid:
+                    del self.__entries[key]
+    
+    def __len__(self):
+        with self.__lock:
+            return len(self.__entries)
+
+class UserDirectory(object):
+    ''' Thread-safe in-memory copy of the user list kept current on every change.
+        Registered listeners receive the changes as lists of (uid, username, administrator)
+        tuples, username and administrator are None for deleted users. '''
+    
+    def __init__(self):
+        self.__lock      = threading.RLock()
+        self.__users     = { }   # uid -> (uid, username, administrator)
+        self.__listeners = []
+    
+    def load(self, users):
+        ''' Replaces the directory with the given (uid, username, administrator) tuples. '''
+        with self.__lock:
+            self.__users = dict( (uid, (uid, username, admin)) for uid, username, admin in users )
+    
+    def put(self, uid, username, admin=None):
+        ''' Adds or modifies a user (keeping its administrator flag, if None). '''
+        with self.__lock:
+            if admin is None:
+                admin = self.__users[uid][2] if uid in self.__users else 0
+            self.__users[uid] = (uid, username, admin)
+            self.__notify( [ (uid, username, admin) ] )
+    
+    def remove(self, uid):
+        ''' Removes a user. '''
+        with self.__lock:
+            if self.__users.pop(uid, None) is not None:
+                self.__notify( [ (uid, None, None) ] )
+    
+    def __notify(self, changes):
+        ''' Passes the changes to the listeners, in the order of the changes. '''
+        for listener in self.__listeners:
+            try:
+                listener(changes)
+            except Exception as ex:
+                print 'Exception received on user change listener:', ex
+                traceback.print_exc()
+    
+    def users(self):
+        ''' Returns the users, administrators first, ordered by their names. '''
+        with self.__lock:
+            return sorted(self.__users.itervalues(), key=lambda user: (not user[2], user[1]))
+    
+    def is_admin(self, uid):
+        ''' Returns True, if the user with the given identifier is an administrator. '''
+        with self.__lock:
+            return uid in self.__users and bool(self.__users[uid][2])
+    
+    def add_listener(self, listener):
+        ''' Registers a listener of the changes. '''
+        with self.__lock:
+            self.__listeners.append(listener)
+    
+    def remove_listener(self, listener):
+        ''' Unregisters a listener of the changes. '''
+        with self.__lock:
+            self.__listeners.remove(listener)
 
 class Session(object):
     ''' Class storing data of a client session. '''
     
-    def __init__(self, userid):
+    def __init__(self, userid, session_id=None, created=None, last_seen=None):
         self.user_id    = userid
-        self.session_id = uuid.uuid4().get_hex()
+        self.session_id = session_id if session_id is not None else uuid.uuid4().get_hex()
+        self.created    = created if created is not None else time.time()
+        self.last_seen  = last_seen if last_seen is not None else self.created
+        self.persisted  = self.last_seen   # the last activity written to the database
+
+class SessionStore(object):
+    ''' Thread-safe store of the client sessions. Sessions expire after "idle_timeout"
+        seconds without use or "max_age" seconds after the login, the least recently
+        used ones are evicted above "max_sessions". If a database is given,
+        the sessions are persisted so they survive restarts. Registered listeners
+        receive the identifiers of the removed sessions as lists. '''
+    
+    __tablename__   = 'auth_session'
+    __exists_query  = 'SELECT 1 FROM ' + __tablename__ + ' LIMIT 1'
+    __create_stmt   = 'CREATE TABLE ' + __tablename__ + ' (session_id PRIMARY KEY, uid, created, last_seen)'
+    __load_query    = 'SELECT session_id, uid, created, last_seen FROM ' + __tablename__ + ' ORDER BY last_seen ASC'
+    __insert_stmt   = 'INSERT OR REPLACE INTO ' + __tablename__ + ' (session_id, uid, created, last_seen) VALUES (?, ?, ?, ?)'
+    __touch_stmt    = 'UPDATE ' + __tablename__ + ' SET last_seen = ? WHERE session_id = ?'
+    __delete_stmt   = 'DELETE FROM ' + __tablename__ + ' WHERE session_id = ?'
+    
+    def __init__(self, database=None, idle_timeout=3600.0, max_age=86400.0, max_sessions=10000):
+        self.__database     = database
+        self.__idle_timeout = idle_timeout
+        self.__max_age      = max_age
+        self.__max_sessions = max_sessions
+        
+        self.__lock     = threading.RLock()
+        self.__sessions = OrderedDict()   # session identifier -> Session, least recently used first
+        self.__removed  = []              # identifiers of the removed sessions, not notified yet
+        self.__listeners = []
+        
+        self.expired    = 0   # sessions removed for inactivity or age
+        self.evicted    = 0   # sessions removed for the size limit
+        
+        if database is not None:
+            self.__load(database)
+            self.__removed = []
+    
+    def __load(self, database):
+        ''' Creates the session table or loads the sessions still valid from it. '''
+        try:
+            database.select(SessionStore.__exists_query)
+        except:
+            database.write(SessionStore.__create_stmt)
+            return
+        
+        now = time.time()
+        with database.writer():
+            for session_id, uid, created, last_seen in database.select(SessionStore.__load_query).fetchall():
+                session = Session(uid, session_id, created, last_seen)
+                if self.__is_expired(session, now):
+                    database.write(SessionStore.__delete_stmt, session_id)
+                    self.expired += 1
+                else:
+                    self.__sessions[session_id] = session
+            
+            while len(self.__sessions) > self.__max_sessions:
+                self.__remove(next(iter(self.__sessions)))
+                self.evicted += 1
+    
+    def __is_expired(self, session, now):
+        return ( (self.__idle_timeout and session.last_seen + self.__idle_timeout <= now) or
+                 (self.__max_age and session.created + self.__max_age <= now) )
+    
+    def create(self, userid):
+        ''' Creates and returns a new session for the user with the given identifier. '''
+        session = Session(userid)
+        with self.__lock:
+            self.__expire(session.created)
+            
+            self.__sessions[session.session_id] = session
+            if self.__database is not None:
+                self.__database.write(SessionStore.__insert_stmt, session.session_id,
+                                      session.user_id, session.created, session.last_seen)
+            
+            while len(self.__sessions) > self.__max_sessions:
+                self.__remove(next(iter(self.__sessions)))
+                self.evicted += 1
+            self.__notify()
+        return session
+    
+    def get(self, session_id, now=None):
+        ''' Returns the valid session with the given identifier and records its use
+            or returns None if the session is unknown or has expired. '''
+        if now is None:
+            now = time.time()
+        
+        with self.__lock:
+            session = self.__sessions.pop(session_id, None)
+            if session is None:
+                return None
+            
+            if self.__is_expired(session, now):
+                self.__remove(session_id, session)
+                self.expired += 1
+                self.__notify()
+                return None
+            
+            session.last_seen = now
+            self.__sessions[session_id] = session   # most recently used
+            
+            # the activity is written only now and then, not on every message
+            if self.__database is not None and self.__idle_timeout and \
+                    session.persisted + self.__idle_timeout / 4.0 <= now:
+                self.__database.write(SessionStore.__touch_stmt, now, session_id)
+                session.persisted = now
+            return session
+    
+    def remove(self, session_id):
+        ''' Removes the session with the given identifier. '''
+        with self.__lock:
+            if session_id in self.__sessions:
+                self.__remove(session_id)
+                self.__notify()
+    
+    def remove_user(self, userid):
+        ''' Removes every session of the user with the given identifier. '''
+        with self.__lock:
+            for session_id, session in self.__sessions.items():
+                if session.user_id == userid:
+                    self.__remove(session_id)
+            self.__notify()
+    
+    def __remove(self, session_id, session=None):
+        if session is None:
+            self.__sessions.pop(session_id)
+        if self.__database is not None:
+            self.__database.write(SessionStore.__delete_stmt, session_id)
+        self.__removed.append(session_id)
+    
+    def __notify(self):
+        ''' Passes the identifiers of the sessions removed since the last call to the listeners. '''
+        removed, self.__removed = self.__removed, []
+        if not removed:
+            return
+        
+        for listener in self.__listeners:
+            try:
+                listener(removed)
+            except Exception as ex:
+                print 'Exception received on session listener:', ex
+                traceback.print_exc()
+    
+    def expire(self, now=None):
+        ''' Removes the least recently used sessions idle for longer than the timeout
+            (the ones too old are removed when they are used or evicted).
+            Returns the number of sessions removed. '''
+        if now is None:
+            now = time.time()
+        
+        with self.__lock:
+            removed = self.__expire(now)
+            self.__notify()
+        return removed
+    
+    def __expire(self, now):
+        removed = 0
+        while self.__sessions:
+            session_id, session = next(self.__sessions.iteritems())
+            if not self.__idle_timeout or session.last_seen + self.__idle_timeout > now:
+                break
+            self.__remove(session_id)
+            removed += 1
+        self.expired += removed
+        return removed
+    
+    def add_listener(self, listener):
+        ''' Registers a listener of the removed sessions. '''
+        with self.__lock:
+            self.__listeners.append(listener)
+    
+    def remove_listener(self, listener):
+        ''' Unregisters a listener of the removed sessions. '''
+        with self.__lock:
+            self.__listeners.remove(listener)
+    
+    def flush(self):
+        ''' Writes the last activity of the sessions used since they were last written. '''
+        if self.__database is None:
+            return
+        
+        with self.__lock:
+            with self.__database.writer():
+                for session in self.__sessions.itervalues():
+                    if session.persisted < session.last_seen:
+                        self.__database.write(SessionStore.__touch_stmt, session.last_seen, session.session_id)
+                        session.persisted = session.last_seen
+    
+    def __contains__(self, session_id):
+        with self.__lock:
+            return session_id in self.__sessions
+    
+    def __len__(self):
+        with self.__lock:
+            return len(self.__sessions)
 
 class Authentication(ModuleBase): 
     ''' Very basic module to authenticate client sessions 
@@ -29,16 +371,20 @@ class Authentication(ModuleBase):
     __create_stmt   = 'CREATE TABLE ' + __tablename__ + ' (uid INTEGER PRIMARY KEY AUTOINCREMENT, username, password, administrator)'
     __admin_exists_query = 'SELECT username FROM ' + __tablename__ + ' WHERE administrator = 1'
     __admin_insert_stmt  = 'INSERT INTO ' + __tablename__ + '(username, password, administrator) VALUES (?, ?, 1)'
-    __auth_query    = 'SELECT uid, administrator FROM ' + __tablename__ + ' WHERE username = ? AND password = ?'
+    __auth_query    = 'SELECT uid, password, administrator FROM ' + __tablename__ + ' WHERE username = ?'
+    __password_update_stmt = 'UPDATE ' + __tablename__ + ' SET password = ? WHERE uid = ?'
     __list_query    = 'SELECT uid, username, administrator FROM ' + __tablename__ + ' ORDER BY administrator DESC, username ASC'
     __user_exists_query = 'SELECT uid FROM ' + __tablename__ + ' WHERE username = ?'
+    __user_by_id_query  = 'SELECT 1 FROM ' + __tablename__ + ' WHERE uid = ?'
     __user_create_stmt  = 'INSERT INTO ' + __tablename__ + ' (username, password, administrator) VALUES (?, ?, 0)'
     __user_edit_stmt    = 'UPDATE ' + __tablename__ + ' SET username = ?, password = ? WHERE uid = ?'
     __user_delete_stmt  = 'DELETE FROM ' + __tablename__ + ' WHERE uid = ?'
     
     def initialize(self):
         ModuleBase.initialize(self)
-        self.__sessions = { }
+        self.__sessions    = SessionStore()
+        self.__credentials = CredentialCache(sysargs.auth.credential_cache)
+        self.users         = UserDirectory()
     
     def configure(self, database):
         ModuleBase.configure(self, database)
@@ -55,31 +401,84 @@ class Authentication(ModuleBase):
             if not admin_username:
                 database.write(
                        Authentication.__admin_insert_stmt, 
-                       'admin', hashlib.md5('admin').hexdigest())
+                       'admin', hash_password(hashlib.md5('admin').hexdigest()))
                 print 'AUTH| Created default administrator user'
+        
+        # Loading the user list, it is served from memory afterwards
+        self.users.load( (uid, username, admin) for uid, username, admin in
+                         database.select(Authentication.__list_query).fetchall() )
+        
+        # Loading the sessions of the previous run
+        self.__sessions = SessionStore(database,
+                                       idle_timeout=sysargs.auth.session_idle_timeout,
+                                       max_age=sysargs.auth.session_max_age,
+                                       max_sessions=sysargs.auth.max_sessions)
+        print 'AUTH| Sessions restored:', len(self.__sessions)
+    
+    def stop(self):
+        self.__sessions.flush()
+        ModuleBase.stop(self)
     
     def authenticate(self, username, password_hash):
         ''' Executes authentication with the given credentials,
             returns the session information if it succeeds. '''
-        userid, admin = Database.instance().select(Authentication.__auth_query, username.lower(), password_hash).fetchone()
-        if userid:
-            return (self.__initialize_session(userid), admin)
+        username = username.lower()
+        key = self.__credentials.key(username, password_hash)
+        
+        credentials = self.__credentials.get(key)
+        if credentials is None:
+            generation = self.__credentials.generation()
+            credentials = self.__verify(username, password_hash)
+            if credentials is None:
+                return None
+            self.__credentials.put(key, credentials[0], credentials[1], generation)
+        
+        userid, admin = credentials
+        return (self.__initialize_session(userid), admin)
+    
+    def __verify(self, username, password_hash):
+        ''' Checks the credentials in the database, upgrades outdated password hashes.
+            Returns the user identifier and the administrator flag if they are valid. '''
+        db = Database.instance()
+        row = db.select(Authentication.__auth_query, username).fetchone()
+        if row is None:
+            return None
+        
+        userid, stored, admin = row
+        valid, outdated = verify_password(password_hash, stored)
+        if not valid:
+            return None
+        
+        if outdated:
+            db.write(Authentication.__password_update_stmt, hash_password(password_hash), userid)
+            print 'AUTH| Upgraded the password hash of user', userid
+        return userid, admin
     
     def __initialize_session(self, userid):
         ''' Creates a new session for the user with the given identifier. '''
-        session = Session(userid)
-        self.__sessions[session.session_id] = session
-        return session.session_id
+        return self.__sessions.create(userid).session_id
     
     def get_session(self, sessionid):
         ''' Returns the session parameters for the given identifier. '''
-        if sessionid in self.__sessions:
-            return self.__sessions[sessionid]
+        return self.__sessions.get(sessionid)
+    
+    def validate_session(self, sessionid):
+        ''' Returns True, if the session with the given identifier is valid. '''
+        return self.__sessions.get(sessionid) is not None
+    
+    def add_session_listener(self, listener):
+        ''' Registers a listener of the removed (expired, evicted or deleted) sessions. '''
+        self.__sessions.add_listener(listener)
+    
+    def remove_session_listener(self, listener):
+        ''' Unregisters a listener of the removed sessions. '''
+        self.__sessions.remove_listener(listener)
         
     def list_users(self):
-        ''' Lists parameters of all known users in the database. '''
-        for uid, username, admin in Database.instance().select(Authentication.__list_query):
+        ''' Lists parameters of all known users. '''
+        for uid, username, admin in self.users.users():
             yield (uid, username, admin)
+    
             
     def create_user(self, username, password):
         ''' Inserts a new user into the database with the given credentials. '''
@@ -87,25 +486,35 @@ class Authentication(ModuleBase):
         with db.writer():
             if db.select(Authentication.__user_exists_query, username.lower()).fetchone():
                 return False
-            else:
-                db.write(Authentication.__user_create_stmt, username.lower(), password)
-                return True
+            uid = db.write(Authentication.__user_create_stmt, username.lower(), hash_password(password))
+        
+        # the listeners are notified out of the writer lock
+        self.users.put(uid, username.lower(), 0)
+        return True
     
     def edit_user(self, uid, username, password):
         ''' Modifies the credentials of the user with the given identifier. '''
         db = Database.instance()
         with db.writer():
-            existing_uid = db.select(Authentication.__user_exists_query, username.lower()).fetchone()[0]
-            if existing_uid and existing_uid != uid:
+            if not db.select(Authentication.__user_by_id_query, uid).fetchone():
+                return False
+            existing = db.select(Authentication.__user_exists_query, username.lower()).fetchone()
+            if existing and existing[0] != uid:
                 return False
-            else:
-                db.write(Authentication.__user_edit_stmt, username.lower(), password, uid)
-                return True
+            db.write(Authentication.__user_edit_stmt, username.lower(), hash_password(password), uid)
+        
+        self.__credentials.invalidate(uid)
+        self.users.put(uid, username.lower())
+        return True
     
     def delete_user(self, uid):
         ''' Deletes the user with the given identifier. '''
         db = Database.instance()
         with db.writer():
             db.write(Authentication.__user_delete_stmt, uid)
+        
+        self.users.remove(uid)
+        self.__credentials.invalidate(uid)
+        self.__sessions.remove_user(uid)
 
 Authentication.register()
@@ -15,7 +15,15 @@ from util import sysargs
 
 from modules.comm.udp import UDPHandler
 from modules.comm.tcp import TCPHandler
-from modules.comm import Header
+from modules.comm.evtcp import EventTCPHandler
+from modules.comm.evloop import EventLoop
+from modules.comm.executor import HandlerExecutor
+from modules.comm.prefork import PreforkTCPHandler
+from modules.comm import Header, StateUpdate, ClientOptions
+from modules.comm import schema
+from modules.comm.payload import Payload
+from modules.comm.subscription import Subscription
+from modules.comm.coalescing import StateCoalescer
 from modules.radio import DeviceHandler, RFModule
 from modules.auth import Authentication
 
@@ -72,12 +80,24 @@ class ClientModule(ModuleBase):
     DEFAULT_BIND_ADDRESS  = '0.0.0.0'
     DEFAULT_BCAST_ADDRESS = '255.255.255.255'
     DEFAULT_MCAST_GROUP   = '227.1.1.10'
+    
+    # read-only requests served by the worker processes in prefork mode
+    WORKER_HEADERS        = ( Header.MSG_A_KEEPALIVE, Header.MSG_A_LIST_DEVICE_TYPES, Header.MSG_A_LIST_DEVICES,
+                              Header.MSG_A_SUBSCRIBE, Header.MSG_A_LOAD_TYPE_IMAGE,
+                              Header.MSG_A_COUNT_HISTORY, Header.MSG_A_LIST_HISTORY )
 
     def configure(self, database):
         ModuleBase.configure(self, database)
         
+        Payload.THRESHOLD = sysargs.communication.compression_threshold
+        
         self.__radio_handler = RadioHandler()
         self.__handlers = []
+        self.__loop     = None  # event loop shared by the event loop based handlers
+        self.__executor = None  # threads processing their messages
+        self.__coalescer = StateCoalescer(self.__broadcast_states,
+                                          window=sysargs.communication.coalesce_window,
+                                          max_latency=sysargs.communication.coalesce_latency)
         
         # register communication handlers
         for idx in xrange(len(sysargs.communication.modes)):
@@ -89,46 +109,126 @@ class ClientModule(ModuleBase):
                 if port is None: port = ClientModule.DEFAULT_PORT
                 if host is None: host = ClientModule.DEFAULT_MCAST_GROUP
                 
-                handler = UDPHandler(host, port, handler=self.handle_received_message, multicast=True)
+                handler = UDPHandler(host, port, handler=self.handle_received_message, multicast=True, group_send=True,
+                                     session_timeout=sysargs.communication.idle_timeout,
+                                     receive_buffer=sysargs.communication.receive_buffer)
                 self.__handlers.append(handler)
                 
             elif mode.lower() == 'bcast':
                 if port is None: port = ClientModule.DEFAULT_PORT
                 if host is None: host = ClientModule.DEFAULT_BCAST_ADDRESS
                 
-                handler = UDPHandler(host, port, handler=self.handle_received_message, broadcast=True)
+                handler = UDPHandler(host, port, handler=self.handle_received_message, broadcast=True, group_send=True,
+                                     session_timeout=sysargs.communication.idle_timeout,
+                                     receive_buffer=sysargs.communication.receive_buffer)
                 self.__handlers.append(handler)
                 
             elif mode.lower() == 'udp':
                 if port is None: port = ClientModule.DEFAULT_PORT
                 if host is None: host = ClientModule.DEFAULT_BIND_ADDRESS
                 
-                handler = UDPHandler(host, port, handler=self.handle_received_message)
+                handler = UDPHandler(host, port, handler=self.handle_received_message,
+                                     session_timeout=sysargs.communication.idle_timeout,
+                                     receive_buffer=sysargs.communication.receive_buffer)
                 self.__handlers.append(handler)
                 
             elif mode.lower() == 'tcp':
                 if port is None: port = ClientModule.DEFAULT_PORT
                 if host is None: host = ClientModule.DEFAULT_BIND_ADDRESS
                 
-                handler = TCPHandler(host, port, handler=self.handle_received_message)
+                handler = TCPHandler(host, port, handler=self.handle_received_message,
+                                     send_queue_limit=sysargs.communication.send_queue_limit,
+                                     slow_consumer_policy=sysargs.communication.slow_consumer_policy,
+                                     max_connections=sysargs.communication.max_connections,
+                                     max_per_address=sysargs.communication.max_connections_per_address,
+                                     idle_timeout=sysargs.communication.idle_timeout)
+                self.__handlers.append(handler)
+                
+            elif mode.lower() == 'evtcp':
+                if port is None: port = ClientModule.DEFAULT_PORT
+                if host is None: host = ClientModule.DEFAULT_BIND_ADDRESS
+                
+                handler = EventTCPHandler(host, port, handler=self.handle_received_message,
+                                          send_queue_limit=sysargs.communication.send_queue_limit,
+                                          slow_consumer_policy=sysargs.communication.slow_consumer_policy,
+                                          max_connections=sysargs.communication.max_connections,
+                                          max_per_address=sysargs.communication.max_connections_per_address,
+                                          idle_timeout=sysargs.communication.idle_timeout,
+                                          loop=self.__event_loop(), executor=self.__executor)
+                self.__handlers.append(handler)
+                
+            elif mode.lower() == 'evudp':
+                if port is None: port = ClientModule.DEFAULT_PORT
+                if host is None: host = ClientModule.DEFAULT_BIND_ADDRESS
+                
+                handler = UDPHandler(host, port, handler=self.handle_received_message,
+                                     session_timeout=sysargs.communication.idle_timeout,
+                                     receive_buffer=sysargs.communication.receive_buffer,
+                                     loop=self.__event_loop(), executor=self.__executor)
+                self.__handlers.append(handler)
+                
+            elif mode.lower() == 'ptcp':
+                if port is None: port = ClientModule.DEFAULT_PORT
+                if host is None: host = ClientModule.DEFAULT_BIND_ADDRESS
+                
+                handler = PreforkTCPHandler(host, port, handler=self.handle_received_message,
+                                            workers=sysargs.communication.workers,
+                                            local_headers=ClientModule.WORKER_HEADERS,
+                                            send_queue_limit=sysargs.communication.send_queue_limit,
+                                            slow_consumer_policy=sysargs.communication.slow_consumer_policy,
+                                            max_connections=sysargs.communication.max_connections,
+                                            max_per_address=sysargs.communication.max_connections_per_address,
+                                            idle_timeout=sysargs.communication.idle_timeout)
                 self.__handlers.append(handler)
                 
             else:
                 print 'Unsupported communication mode:', mode
+        
+        for handler in self.__handlers:
+            handler.session_validator = Authentication.instance().validate_session
+        
+        # the worker processes are forked before any module starts its threads
+        for handler in self.__handlers:
+            if isinstance(handler, PreforkTCPHandler):
+                handler.fork_workers()
+    
+    def __event_loop(self):
+        ''' Returns the event loop shared by the event loop based handlers,
+            creates it and the executor of the message handlers on first use. '''
+        if self.__loop is None:
+            self.__loop     = EventLoop('Client|EventLoop')
+            self.__executor = HandlerExecutor(sysargs.communication.executor_threads, 'Client|Executor')
+        return self.__loop
                 
     def start(self):
         ModuleBase.start(self)
         
+        if self.__loop is not None:
+            self.__executor.start()
+            self.__loop.start()
+        
         for handler in self.__handlers:
             handler.start()
+        
+        self.__coalescer.start()
             
         RFModule.instance().register_device_handler(self.__radio_handler)
+        Authentication.instance().users.add_listener(self.__push_user_changes)
+        Authentication.instance().add_session_listener(self.__revoke_sessions)
         
     def stop(self):
+        Authentication.instance().remove_session_listener(self.__revoke_sessions)
+        Authentication.instance().users.remove_listener(self.__push_user_changes)
         RFModule.instance().unregister_device_handler(self.__radio_handler)
         
+        self.__coalescer.stop()
+        
         for handler in self.__handlers:
             handler.stop()
+        
+        if self.__loop is not None:
+            self.__executor.stop()
+            self.__loop.stop()
             
         ModuleBase.stop(self)
     
@@ -140,11 +240,33 @@ class ClientModule(ModuleBase):
                 print 'Login Message received from', sender, ':', header, message
             
             try:
-                username, password = message.split(':')
+                # format: username:password or username:password:options
+                credentials = message.split(':')
+                if len(credentials) > 2:
+                    username, password, requested = credentials
+                    options = ClientOptions.parse(requested)
+                else:
+                    username, password = credentials
+                    options = None
+                
                 session_id, admin = Authentication.instance().authenticate(username, password)
                 if session_id is not None:
                     handler.authentication_succeeded(session_id, sender)
-                    self.respond(handler, header, session_id + ('*' if admin else ''), sender)
+                    
+                    rsp = session_id + ('*' if admin else '')
+                    if options is not None:
+                        group_key = handler.group_key()
+                        if group_key is None:
+                            options = options.without(ClientOptions.GROUP)
+                        if not admin:
+                            options = options.without(ClientOptions.USERS)
+                        
+                        handler.set_options(sender, options)
+                        rsp = rsp + ';' + options.serialize()
+                        if options.group():
+                            rsp = rsp + ';' + group_key
+                    
+                    self.respond(handler, header, rsp, sender)
                 else:
                     handler.authentication_failed(sender)
             except:
@@ -161,16 +283,13 @@ class ClientModule(ModuleBase):
                 print '\'' + message + '\'',
                 print '| original was', '\'' + original_message + '\''
             
+            codec = handler.options_of(sender).codec()
+            
             if header == Header.MSG_A_KEEPALIVE:
                 self.respond(handler, header, None, sender)
             
             elif header == Header.MSG_A_LIST_DEVICE_TYPES:
-                rsp = ''
-                for t in EntityType.all():
-                    rsp = rsp + t.serialize() + ','
-                if len(rsp) > 0:
-                    rsp = rsp[0:-1]
-                rsp = '[' + rsp + ']'
+                rsp = codec.encode(schema.TYPE_LIST, EntityType.all())
                 
                 self.respond(handler, header, rsp, sender)
                 
@@ -184,24 +303,33 @@ class ClientModule(ModuleBase):
                 elif len(message) > 0:
                     name_pattern = message
                 
-                rsp = ''
-                for e in Entity.list(typeid, name_pattern):
-                    rsp = rsp + e.serialize() + ','
-                if len(rsp) > 0:
-                    rsp = rsp[0:-1]
-                rsp = '[' + rsp + ']'
+                rsp = codec.encode(schema.ENTITY_LIST, Entity.list(typeid, name_pattern))
                 
                 self.respond(handler, header, rsp, sender)
                 
+            elif header == Header.MSG_A_SUBSCRIBE:
+                if len(message) > 0:
+                    # format: type ids;entity ids;name pattern -- lists are comma separated
+                    parts = message.split(';', 2)
+                    parts.extend([''] * (3 - len(parts)))
+                    type_ids, entity_ids, name_pattern = parts
+                    
+                    type_ids   = [ int(t) for t in type_ids.split(',') if t ]
+                    entity_ids = [ e for e in entity_ids.split(',') if e ]
+                    
+                    handler.subscribe(sender, Subscription(type_ids, entity_ids, name_pattern if name_pattern else None))
+                else:
+                    handler.unsubscribe(sender)
+                
+                self.respond(handler, header, None, sender)
+                
             elif header == Header.MSG_A_SEND_COMMAND:
-                entity_id, cmd = message.split('#')
-                cmd_param = None
-                if ';' in cmd:
-                    cmd, cmd_param = cmd.split(';')
+                request = codec.decode(schema.COMMAND_REQUEST, message)
+                entity_id, cmd, cmd_param = request['entity_id'], request['command_id'], request['parameter']
                 
                 entity = Entity.find(entity_id)
                 if entity:
-                    command = EntityCommand.find( int(cmd) )
+                    command = EntityCommand.find(cmd)
                     if command:
                         entity.control(self, command, cmd_param)
                         self.respond(handler, header, None, sender)
@@ -264,16 +392,14 @@ class ClientModule(ModuleBase):
                     time_to = int(ts_to) / 1000.0
                 eid = None if len(entity_id) == 0 else entity_id
                 
-                rsp = ''
-                for h in EntityHistory.query(time_from, time_to, eid, int(limit), int(offset)):
-                    rsp = rsp + '#' + str(h.timestamp) + ';' + str(h.entity_id) + ';' + str(h.entity_name) + ';' + str(h.action) + ';' + str(h.action_type)
+                rsp = codec.encode(schema.HISTORY_LIST, EntityHistory.query(time_from, time_to, eid, int(limit), int(offset)))
                 
                 self.respond(handler, header, rsp, sender)
                 
             elif header == Header.MSG_A_LIST_USERS:
                 rsp_items = []
                 for uid, username, administrator in Authentication.instance().list_users():
-                    rsp_items.append(str(uid) + ('*' if administrator else '#') + str(username))
+                    rsp_items.append(self.__user_item(uid, username, administrator))
                 
                 self.respond(handler, header, ';'.join(rsp_items), sender)
                 
@@ -301,19 +427,44 @@ class ClientModule(ModuleBase):
             print 'Auth failed for (raw) message: \'' + str(message) + '\''
             handler.authentication_failed(sender)
         
+    def __user_item(self, uid, username, administrator):
+        ''' Returns the representation of a user in user list messages. '''
+        return str(uid) + ('*' if administrator else '#') + str(username)
+    
+    def __revoke_sessions(self, session_ids):
+        ''' Passes the removed sessions to the handlers, for the ones caching them. '''
+        for handler in self.__handlers:
+            handler.revoke_sessions(session_ids)
+    
+    def __push_user_changes(self, changes):
+        ''' Pushes the changes of the user list to the administrators requesting them.
+            Format: the changed users like in user list responses, "-uid" for deleted ones. '''
+        delta = ';'.join(self.__user_item(uid, username, administrator) if username is not None else '-' + str(uid)
+                         for uid, username, administrator in changes)
+        
+        for handler in self.__handlers:
+            for target in handler.broadcast_targets():
+                if handler.options_of(target).user_changes():
+                    handler.push(Header.MSG_A_USERS_DELTA, delta, target)
+    
     def respond(self, handler, header, response, destination):
         ''' Responds to an incoming client message. '''        
         if ClientModule.DEBUG:
-            print 'Responding to', destination, ':', header, '\'' + ('' if response is None else response) + '\''
+            print 'Responding to', destination, ':', header, repr('' if response is None else response)
         
         handler.send(header, response, destination)
     
     def send_state_change(self, entity):
-        ''' Broadcast state change of an entity on all communication handlers. ''' 
-        message = str(entity.serialize())
-            
+        ''' Broadcast state change of an entity on all communication handlers. 
+            Changes arriving in a short burst are coalesced into a single message. ''' 
+        self.__coalescer.submit(entity.unique_id, entity)
+    
+    def __broadcast_states(self, entities):
+        ''' Broadcasts the latest states of the given entities to the interested clients. '''
+        updates = [ StateUpdate(e.unique_id, e.entity_type.type_id, e.name, e) for e in entities ]
+        
         for handler in self.__handlers:
-            handler.broadcast(Header.MSG_A_STATE_CHANGED, message)
+            handler.broadcast_states(updates)
     
     def send_message(self, unique_id, message):
         ''' Sends a message to the entity identified by "unique_id". '''
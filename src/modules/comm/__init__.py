@@ -6,9 +6,14 @@ Basic communication related classes.
 @author: Viktor Adam
 '''
 
+from modules.comm.subscription import SubscriptionIndex
+from modules.comm.payload import Payload
+from modules.comm import schema
+
 class Header(object):
     ''' Message header values used in server-client communication. '''
     
+    MSG_X_EXTENDED              = 0x70  # marker of extended frames (stream based handlers)
     MSG_A_LOGIN                 = 0xA1
     MSG_A_LIST_DEVICE_TYPES     = 0xA2
     MSG_A_LIST_DEVICES          = 0xA3
@@ -16,6 +21,7 @@ class Header(object):
     MSG_A_STATE_CHANGED         = 0xA5
     MSG_A_LOAD_TYPE_IMAGE       = 0xA6
     MSG_A_RENAME_DEVICE         = 0xA7
+    MSG_A_SUBSCRIBE             = 0xA8
     MSG_A_COUNT_HISTORY         = 0xB1
     MSG_A_LIST_HISTORY          = 0xB2
     MSG_A_LIST_USERS            = 0xC1
@@ -23,11 +29,106 @@ class Header(object):
     MSG_A_USER_EDIT             = 0xC3
     MSG_A_USER_DELETE           = 0xC4
     MSG_A_USERS_CHANGED         = 0xC5
+    MSG_A_USERS_DELTA           = 0xC6  # changes of the user list pushed to administrators
     MSG_A_KEEPALIVE             = 0xE0
+    MSG_A_NACK                  = 0xE1  # request of the missing fragments of a sequenced UDP message
     MSG_A_ERROR                 = 0xF0
     MSG_A_ERROR_INVALID_SESSION = 0xF1
     MSG_A_EXIT                  = 0xFE
 
+class ClientOptions(object):
+    ''' Protocol options negotiated by a client at login. 
+        The client appends the comma separated list of the requested
+        options to its credentials, the server responds with the
+        list of the enabled ones. '''
+    
+    BINARY    = 'v2'    # compact binary encoding of the transferred objects
+    ZLIB      = 'zlib'  # compression of large messages
+    XLEN      = 'xlen'  # 32 bits length of TCP frames with 64 KiB or more content
+    GROUP     = 'group' # state changes received once for every client on the multicast or broadcast address
+    RELIABLE  = 'rel'   # sequenced UDP messages, missing fragments are requested with NACK messages
+    USERS     = 'users' # changes of the user list pushed to administrators
+    BATCH     = 'batch' # state changes of several entities received in a single message
+    
+    SUPPORTED = ( BINARY, ZLIB, XLEN, GROUP, RELIABLE, USERS, BATCH )
+    
+    def __init__(self, requested=()):
+        self.enabled = frozenset(o for o in requested if o in ClientOptions.SUPPORTED)
+    
+    def has(self, option):
+        ''' Returns True, if the given option is enabled. '''
+        return option in self.enabled
+    
+    def compression(self):
+        ''' Returns True, if large messages can be compressed. '''
+        return ClientOptions.ZLIB in self.enabled
+    
+    def extended_length(self):
+        ''' Returns True, if TCP frames can have 64 KiB or more content. '''
+        return ClientOptions.XLEN in self.enabled
+    
+    def group(self):
+        ''' Returns True, if state changes can be sent to the group address. '''
+        return ClientOptions.GROUP in self.enabled
+    
+    def reliable(self):
+        ''' Returns True, if UDP messages are sequenced and retransmitted on request. '''
+        return ClientOptions.RELIABLE in self.enabled
+    
+    def user_changes(self):
+        ''' Returns True, if the changes of the user list are pushed to the client. '''
+        return ClientOptions.USERS in self.enabled
+    
+    def batch(self):
+        ''' Returns True, if the state changes of several entities can be sent in a single message. '''
+        return ClientOptions.BATCH in self.enabled
+    
+    def without(self, option):
+        ''' Returns a copy of the options with the given one disabled. '''
+        return ClientOptions(self.enabled - set([ option ]))
+    
+    def codec(self):
+        ''' Returns the codec to encode transferred objects with. '''
+        return schema.BINARY if ClientOptions.BINARY in self.enabled else schema.TEXT
+    
+    def serialize(self):
+        ''' Returns a network-compatible string representation of the object. '''
+        return ','.join(sorted(self.enabled))
+    
+    @classmethod
+    def parse(cls, text):
+        ''' Returns the options requested in the given comma separated list. '''
+        return ClientOptions([ o.strip() for o in text.split(',') ])
+
+ClientOptions.DEFAULT = ClientOptions()
+
+class StateUpdate(object):
+    ''' Class holding the state of an entity to broadcast.
+        The entity is encoded at most once with each codec. '''
+    
+    def __init__(self, unique_id, type_id, name, entity):
+        self.unique_id = unique_id
+        self.type_id   = type_id
+        self.name      = name
+        self.entity    = entity
+        self.__encoded = { }
+    
+    def encoded(self, codec):
+        ''' Returns the entity encoded with the given codec. '''
+        if codec.name not in self.__encoded:
+            self.__encoded[codec.name] = codec.encode(schema.ENTITY, self.entity)
+        return self.__encoded[codec.name]
+    
+    @classmethod
+    def join(cls, updates, codec=schema.TEXT):
+        ''' Returns the message for the given updates. In text form a single state
+            is sent as is, more states are sent as a list like in device list responses.
+            In binary form the states are always sent as a list. '''
+        if codec is schema.TEXT and len(updates) == 1:
+            return updates[0].encoded(codec)
+        else:
+            return codec.join(schema.ENTITY_LIST, [ u.encoded(codec) for u in updates ])
+
 class CommunicationHandler(object):
     ''' Abstract communication handler definition used to communicate with remote clients. '''
     
@@ -35,6 +136,10 @@ class CommunicationHandler(object):
         self.host    = host
         self.port    = int(str(port))
         self.handler = handler
+        
+        self.subscriptions = SubscriptionIndex()
+        self.session_validator = None   # returns True for the valid session identifiers
+        self.__client_options = { }
     
     def start(self):
         ''' Starts the handler. '''
@@ -48,10 +153,79 @@ class CommunicationHandler(object):
         ''' Sends a message to the destination. '''
         pass
     
+    def push(self, header, data, destination, key=None):
+        ''' Sends an unsolicited message (not a response to a request) to the destination.
+            A newer message with the same "key" may supersede it, if it was not sent yet. '''
+        self.send(header, data, destination)
+    
     def broadcast(self, header, message):
         ''' Broadcasts a device to all known clients. '''
         pass
     
+    def broadcast_targets(self):
+        ''' Returns the list of all known clients. '''
+        return []
+    
+    def broadcast_states(self, updates, targets=None):
+        ''' Broadcasts the state updates to the interested clients only.
+            Clients without subscription receive every update,
+            subscribed clients receive the matching ones. Clients with
+            the batch option receive them in a single message,
+            the others receive one message for each entity.
+            The updates are sent to every known client, unless "targets" are given. '''
+        
+        if targets is None:
+            targets = self.broadcast_targets()
+        
+        # collect the updates of the subscribed clients
+        filtered = { }
+        for update in updates:
+            for target in self.subscriptions.subscribers(update.unique_id, update.type_id, update.name):
+                filtered.setdefault(target, []).append(update)
+        
+        messages = { } # the same subset of updates is joined only once for each codec
+        for target in targets:
+            if self.subscriptions.is_filtered(target):
+                selected = filtered.get(target)
+                if not selected:
+                    continue
+            else:
+                selected = updates
+            
+            options = self.options_of(target)
+            codec = options.codec()
+            batches = [ selected ] if options.batch() else [ [ u ] for u in selected ]
+            for batch in batches:
+                key = (codec.name, tuple(id(u) for u in batch))
+                if key not in messages:
+                    # newer states of the same entities supersede the message, if not sent yet
+                    messages[key] = ( Payload(StateUpdate.join(batch, codec)), 
+                                      tuple(sorted(u.unique_id for u in batch)) )
+                
+                payload, entities = messages[key]
+                self.push(Header.MSG_A_STATE_CHANGED, payload, target, key=entities)
+    
+    def subscribe(self, sender, subscription):
+        ''' Registers the state change subscription of the sender. '''
+        self.subscriptions.subscribe(sender, subscription)
+    
+    def unsubscribe(self, sender):
+        ''' Removes the state change subscription of the sender. '''
+        self.subscriptions.unsubscribe(sender)
+    
+    def set_options(self, sender, options):
+        ''' Stores the protocol options negotiated by the sender. '''
+        self.__client_options[sender] = options
+    
+    def options_of(self, sender):
+        ''' Returns the protocol options negotiated by the sender. '''
+        return self.__client_options.get(sender, ClientOptions.DEFAULT)
+    
+    def release(self, sender):
+        ''' Releases every information stored for a client that has left. '''
+        self.unsubscribe(sender)
+        self.__client_options.pop(sender, None)
+    
     def authentication_succeeded(self, session_id, sender):
         ''' Informs the handler about a successful authentication. '''
         pass
@@ -60,10 +234,27 @@ class CommunicationHandler(object):
         ''' Informs the handler about a failed authentication. '''
         pass
     
+    def group_key(self):
+        ''' Returns the key authenticating the messages sent to the group address
+            (hexadecimal string) or None, if the handler does not send such messages. '''
+        return None
+    
     def is_valid_session(self, message, sender):
         ''' Returns True, if the sender and its message belongs to a valid session. '''
         return False
     
+    def validate_session(self, session_id):
+        ''' Returns True, if the session identifier is accepted by the session validator
+            (every session is accepted if the handler has no validator). '''
+        if self.session_validator is None:
+            return True
+        return session_id is not None and self.session_validator(session_id)
+    
+    def revoke_sessions(self, session_ids):
+        ''' Called with the identifiers of the removed sessions,
+            for the handlers keeping the validated sessions. '''
+        pass
+    
     def strip_session_prefix(self, message):
         ''' Returns the received message without the session identification. '''
         return message
@@ -0,0 +1,97 @@
+'''
+Created on Oct 19, 2026
+
+Helper classes to coalesce bursts of state changes
+before they are broadcast to the clients.
+
+@author: Viktor Adam
+'''
+
+import threading
+import traceback
+
+from collections import OrderedDict
+
+from util.clock import monotonic
+
+class StateCoalescer(object):
+    ''' Collects state changes of entities and flushes them in batches.
+        Only the latest state is kept for each entity, the batch is flushed
+        when no change arrived for "window" seconds or when the first
+        pending change is older than "max_latency" seconds. '''
+
+    def __init__(self, flush, window=0.05, max_latency=0.2):
+        self.__flush        = flush
+        self.__window       = window
+        self.__max_latency  = max(window, max_latency)
+
+        self.__enabled      = False
+        self.__condition    = threading.Condition()
+        self.__pending      = OrderedDict()
+        self.__first_change = None
+        self.__last_change  = None
+
+    def start(self):
+        ''' Starts the flusher thread if coalescing is enabled. '''
+        if self.__window > 0:
+            self.__enabled = True
+            threading.Thread(target=self.__flush_loop, name='Client|Coalescer').start()
+
+    def stop(self):
+        ''' Stops the flusher thread after sending the pending changes. '''
+        with self.__condition:
+            self.__enabled = False
+            self.__condition.notify()
+
+    def submit(self, key, item):
+        ''' Registers the latest state "item" of the entity identified by "key". '''
+
+        with self.__condition:
+            if self.__enabled:
+                now = monotonic()
+                if not self.__pending:
+                    self.__first_change = now
+                self.__last_change = now
+                self.__pending[key] = item
+                self.__condition.notify()
+                return
+
+        # not started or already stopped: the final batch may have been flushed
+        self.__flush([ item ])
+
+    def __next_deadline(self):
+        ''' Returns the time when the pending batch has to be flushed. '''
+        return min(self.__last_change + self.__window, self.__first_change + self.__max_latency)
+
+    def __take_pending(self):
+        ''' Returns the pending items and clears the batch. '''
+        items = self.__pending.values()
+        self.__pending = OrderedDict()
+        self.__first_change, self.__last_change = None, None
+        return items
+
+    def __flush_loop(self):
+        ''' Waits for pending changes and flushes them when they are due. '''
+        while True:
+            with self.__condition:
+                while self.__enabled:
+                    if self.__pending:
+                        remaining = self.__next_deadline() - monotonic()
+                        if remaining <= 0:
+                            break
+                        self.__condition.wait(remaining)
+                    else:
+                        self.__condition.wait()
+
+                enabled = self.__enabled
+                items = self.__take_pending()
+
+            if items:
+                try:
+                    self.__flush(items)
+                except Exception as ex:
+                    print 'Exception received on coalescer thread:', ex
+                    traceback.print_exc()
+
+            if not enabled:
+                break
@@ -0,0 +1,190 @@
+'''
+Created on Oct 19, 2026
+
+Thread-safe registry of client connections with connection
+limits and idle timeouts checked on a timer wheel.
+Times are read from the monotonic clock, the idle deadlines
+do not move when the wall clock is set.
+
+@author: Viktor Adam
+'''
+
+import threading
+import traceback
+
+from modules.comm.evloop import EventLoop
+from util.clock import monotonic
+
+class TimerWheel(object):
+    ''' Hashed timer wheel: timers are placed in the slot of their deadline tick,
+        advancing the wheel visits only the slots of the ticks passed since. '''
+
+    def __init__(self, tick=1.0, slots=64, now=None):
+        self.__tick    = tick
+        self.__slots   = [ [] for x in xrange(slots) ]  # @UnusedVariable
+        self.__current = int((monotonic() if now is None else now) / tick)  # the last tick processed
+
+    def schedule(self, item, deadline):
+        ''' Schedules the item to expire at the given time (in the next tick at the earliest). '''
+        index = max(int(deadline / self.__tick) + 1, self.__current + 1)
+        self.__slots[index % len(self.__slots)].append( (index, item) )
+
+    def advance(self, now=None):
+        ''' Moves the wheel to the given time and returns the expired items. '''
+        target = int((monotonic() if now is None else now) / self.__tick)
+
+        expired = []
+        last = min(target, self.__current + len(self.__slots))
+        for tick in xrange(self.__current + 1, last + 1):
+            slot = self.__slots[tick % len(self.__slots)]
+            if slot:
+                expired.extend(item for index, item in slot if index <= target)
+                slot[:] = [ entry for entry in slot if entry[0] > target ]
+
+        self.__current = max(self.__current, target)
+        return expired
+
+class PeriodicExpiry(object):
+    ''' Calls an expire function every "tick" seconds, from a thread or from
+        the timers of an event loop, and passes the expired items to a callback. '''
+
+    def __init__(self, expire, tick, message, role):
+        self.__expire  = expire
+        self.__tick    = tick
+        self.__message = message   # printed with each expired item
+        self.__role    = role      # printed with the exceptions of the callback
+
+        self.__thread  = None
+        self.__timer   = None
+        self.__stopped = threading.Event()
+
+    def start(self, callback, name):
+        ''' Starts a thread passing the expired items to the callback. '''
+        self.__stopped.clear()
+        self.__thread = threading.Thread(target=self.__run, name=name, args=(callback, ))
+        self.__thread.start()
+
+    def start_on_loop(self, loop, callback):
+        ''' Passes the expired items to the callback from the timers of an event loop. '''
+        self.__stopped.clear()
+        self.__timer = loop.call_later(self.__tick, self.__run_on_loop, loop, callback)
+
+    def stop(self):
+        ''' Stops the thread or the timer. '''
+        self.__stopped.set()
+        if self.__timer is not None:
+            EventLoop.cancel(self.__timer)
+            self.__timer = None
+
+    def __run(self, callback):
+        while not self.__stopped.wait(self.__tick):
+            self.__pass_expired(callback)
+
+    def __run_on_loop(self, loop, callback):
+        if not self.__stopped.is_set():
+            self.__pass_expired(callback)
+            self.__timer = loop.call_later(self.__tick, self.__run_on_loop, loop, callback)
+
+    def __pass_expired(self, callback):
+        for item in self.__expire():
+            try:
+                print self.__message, item
+                callback(item)
+            except Exception as ex:
+                print 'Exception received on ' + self.__role + ':', ex
+                traceback.print_exc()
+
+class ConnectionRegistry(object):
+    ''' Keeps track of the client connections and their last activity.
+        New connections are refused above the global and the per-address
+        limits, connections without activity for "idle_timeout" seconds
+        are handed to the reaper callback. '''
+
+    def __init__(self, max_connections=256, max_per_address=16, idle_timeout=120.0, tick=1.0):
+        self.__max_connections = max_connections
+        self.__max_per_address = max_per_address
+        self.__idle_timeout    = idle_timeout
+
+        self.__lock        = threading.Lock()
+        self.__connections = { }   # connection -> [ last activity, address ]
+        self.__addresses   = { }   # address -> number of connections
+        self.__wheel       = TimerWheel(tick)
+        self.__reaper      = PeriodicExpiry(self.expire, tick, 'Closing idle connection:', 'reaper')
+
+    def add(self, connection, address):
+        ''' Registers a new connection from the address.
+            Returns False if a connection limit does not allow it. '''
+        with self.__lock:
+            if len(self.__connections) >= self.__max_connections:
+                return False
+            if self.__addresses.get(address, 0) >= self.__max_per_address:
+                return False
+
+            now = monotonic()
+            self.__connections[connection] = [ now, address ]
+            self.__addresses[address] = self.__addresses.get(address, 0) + 1
+            if self.__idle_timeout:
+                self.__wheel.schedule(connection, now + self.__idle_timeout)
+            return True
+
+    def remove(self, connection):
+        ''' Removes a closed connection. '''
+        with self.__lock:
+            record = self.__connections.pop(connection, None)
+            if record is not None:
+                address = record[1]
+                self.__addresses[address] -= 1
+                if not self.__addresses[address]:
+                    del self.__addresses[address]
+
+    def touch(self, connection):
+        ''' Registers activity (a received message) on the connection. '''
+        with self.__lock:
+            record = self.__connections.get(connection)
+            if record is not None:
+                record[0] = monotonic()
+
+    def snapshot(self):
+        ''' Returns the list of the registered connections. '''
+        with self.__lock:
+            return self.__connections.keys()
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__connections)
+
+    def expire(self, now=None):
+        ''' Returns the connections idle for longer than the timeout.
+            Timers of the active connections are rescheduled lazily here,
+            so registering activity does not touch the wheel. '''
+        if now is None:
+            now = monotonic()
+
+        expired = []
+        with self.__lock:
+            for connection in self.__wheel.advance(now):
+                record = self.__connections.get(connection)
+                if record is None:
+                    continue # already closed
+
+                deadline = record[0] + self.__idle_timeout
+                if deadline <= now:
+                    expired.append(connection)
+                else:
+                    self.__wheel.schedule(connection, deadline)
+        return expired
+
+    def start_reaper(self, callback, name):
+        ''' Starts a thread passing the idle connections to the callback. '''
+        if self.__idle_timeout:
+            self.__reaper.start(callback, name)
+
+    def start_loop_reaper(self, loop, callback):
+        ''' Passes the idle connections to the callback from the timers
+            of an event loop instead of a thread. '''
+        if self.__idle_timeout:
+            self.__reaper.start_on_loop(loop, callback)
+
+    def stop_reaper(self):
+        ''' Stops the reaper thread or timer. '''
+        self.__reaper.stop()
@@ -0,0 +1,198 @@
+'''
+Created on Oct 19, 2026
+
+Minimal single-threaded event loop built on epoll (or poll
+where epoll is not available) for non-blocking socket handling.
+
+@author: Viktor Adam
+'''
+
+import errno
+import fcntl
+import heapq
+import itertools
+import os
+import select
+import threading
+import traceback
+
+from collections import deque
+
+from util.clock import monotonic
+
+class EventLoop(object):
+    ''' Dispatches readiness events of registered file descriptors
+        and timers to their callbacks on a single thread. Other threads can
+        schedule calls on the loop thread with call_soon_threadsafe(),
+        registrations from other threads are applied on the loop thread. '''
+
+    if hasattr(select, 'epoll'):
+        READ, WRITE, ERROR = select.EPOLLIN, select.EPOLLOUT, select.EPOLLERR | select.EPOLLHUP
+    else:
+        READ, WRITE, ERROR = select.POLLIN, select.POLLOUT, select.POLLERR | select.POLLHUP
+
+    def __init__(self, name='EventLoop'):
+        self.__name      = name
+        self.__epoll     = hasattr(select, 'epoll')
+        self.__poller    = select.epoll() if self.__epoll else select.poll()
+        self.__callbacks = { }       # file descriptor -> callback(events)
+        self.__pending   = deque()   # calls scheduled from other threads
+        self.__timers    = [ ]       # heap of [ deadline, sequence, function, args ] entries
+        self.__sequence  = itertools.count()
+        self.__running   = False
+        self.__thread    = None
+
+        # self-pipe to wake up the loop from other threads
+        self.__wakeup_read, self.__wakeup_write = os.pipe()
+        for fd in (self.__wakeup_read, self.__wakeup_write):
+            self.__set_non_blocking(fd)
+        self.register(self.__wakeup_read, EventLoop.READ, self.__drain_wakeup)
+
+    def __set_non_blocking(self, fd):
+        ''' Switches the file descriptor to non-blocking mode. '''
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def __elsewhere(self, function, *args):
+        ''' Schedules the call on the loop thread if the loop is running on another thread.
+            Returns True if the call was scheduled. '''
+        if self.__running and not self.in_loop_thread():
+            self.call_soon_threadsafe(function, *args)
+            return True
+        return False
+
+    def register(self, fd, events, callback):
+        ''' Registers a file descriptor with the events to watch and their callback. '''
+        if self.__elsewhere(self.register, fd, events, callback):
+            return
+        self.__callbacks[fd] = callback
+        self.__poller.register(fd, events)
+
+    def modify(self, fd, events):
+        ''' Changes the events watched on a registered file descriptor. '''
+        if self.__elsewhere(self.modify, fd, events):
+            return
+        self.__poller.modify(fd, events)
+
+    def unregister(self, fd):
+        ''' Stops watching a file descriptor. '''
+        if self.__elsewhere(self.unregister, fd):
+            return
+        if self.__callbacks.pop(fd, None) is not None:
+            try:
+                self.__poller.unregister(fd)
+            except (IOError, OSError, KeyError):
+                pass # already closed
+
+    def in_loop_thread(self):
+        ''' Returns True, if called on the thread running the loop. '''
+        return threading.current_thread() is self.__thread
+
+    def call_soon_threadsafe(self, function, *args):
+        ''' Schedules a call on the loop thread and wakes it up. '''
+        self.__pending.append( (function, args) )
+        self.wakeup()
+
+    def call_later(self, delay, function, *args):
+        ''' Schedules a call on the loop thread after "delay" seconds.
+            Returns the timer that can be cancelled. '''
+        timer = [ monotonic() + delay, self.__sequence.next(), function, args ]
+        if not self.__elsewhere(self.__add_timer, timer):
+            self.__add_timer(timer)
+        return timer
+
+    def __add_timer(self, timer):
+        heapq.heappush(self.__timers, timer)
+
+    @classmethod
+    def cancel(cls, timer):
+        ''' Cancels a timer returned by call_later(). '''
+        timer[2] = None
+
+    def __run_timers(self):
+        ''' Executes the expired timers, returns the seconds until the next one or None. '''
+        while self.__timers:
+            deadline, sequence, function, args = self.__timers[0]  # @UnusedVariable
+            if function is None:
+                heapq.heappop(self.__timers) # cancelled
+                continue
+
+            remaining = deadline - monotonic()
+            if remaining > 0:
+                return remaining
+
+            heapq.heappop(self.__timers)
+            self.__execute(function, *args)
+
+        return None
+
+    def wakeup(self):
+        ''' Wakes up the loop waiting for events. '''
+        try:
+            os.write(self.__wakeup_write, 'x')
+        except OSError as ex:
+            if ex.errno != errno.EAGAIN and self.__running:
+                raise # a full pipe will wake up the loop anyway
+
+    def __drain_wakeup(self, events):
+        ''' Empties the wakeup pipe. '''
+        try:
+            while os.read(self.__wakeup_read, 4096):
+                pass
+        except OSError as ex:
+            if ex.errno != errno.EAGAIN:
+                raise
+
+    def start(self):
+        ''' Starts running the loop on a new thread. '''
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__run, name=self.__name)
+        self.__thread.start()
+
+    def stop(self):
+        ''' Requests stopping the loop. When called from another thread
+            the calls scheduled before are executed and the loop is waited for. '''
+        if self.in_loop_thread():
+            self.__running = False
+        elif self.__thread:
+            self.call_soon_threadsafe(self.stop)
+            self.__thread.join()
+
+    def __run(self):
+        ''' The main loop: waits for events without timeout and dispatches them. '''
+        while self.__running:
+            timeout = self.__run_timers()
+            if self.__pending:
+                timeout = 0
+            try:
+                if self.__epoll:
+                    events = self.__poller.poll(-1 if timeout is None else timeout)
+                else:
+                    events = self.__poller.poll(None if timeout is None else timeout * 1000.0)
+            except (IOError, OSError, select.error) as ex:
+                if ex.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            for fd, mask in events:
+                callback = self.__callbacks.get(fd)
+                if callback is not None:
+                    self.__execute(callback, mask)
+
+            while self.__pending:
+                function, args = self.__pending.popleft()
+                self.__execute(function, *args)
+
+        self.unregister(self.__wakeup_read)
+        os.close(self.__wakeup_read)
+        os.close(self.__wakeup_write)
+        if hasattr(self.__poller, 'close'):
+            self.__poller.close()
+
+    def __execute(self, function, *args):
+        ''' Executes a callback, exceptions do not stop the loop. '''
+        try:
+            function(*args)
+        except Exception as ex:
+            print 'Exception received on event loop [', self.__name, ']:', ex
+            traceback.print_exc()
@@ -0,0 +1,370 @@
+'''
+Created on Oct 19, 2026
+
+TCP/IP based communication handler implementation serving
+every client connection with non-blocking sockets on a single
+event loop thread, optionally running the message handler
+on an executor.
+
+@author: Viktor Adam
+'''
+
+import errno
+import socket
+import threading
+import traceback
+
+from collections import deque
+
+from modules.comm import CommunicationHandler, Header
+from modules.comm.evloop import EventLoop
+from modules.comm.framing import FrameDecoder, SEND_CHUNK
+from modules.comm.outbound import OutboundQueue, SlowConsumerPolicy
+from modules.comm.connections import ConnectionRegistry
+from modules.comm.payload import Payload
+from modules.comm.tcp import build_frame, unwrap_extended
+
+class Connection(object):
+    ''' Class containing the state of a non-blocking client connection. '''
+
+    def __init__(self, socket, address, queue):
+        self.socket     = socket
+        self.fileno     = socket.fileno()
+        self.address    = address
+        self.session_id = None
+        self.enabled    = True
+
+        self.decoder    = FrameDecoder(4096) # grows for larger frames only
+        self.queue      = queue           # encoded frames not sent yet
+        self.sending    = deque()         # the rest of the frame being sent
+        self.out_lock   = threading.Lock()
+        self.events     = EventLoop.READ  # the events the loop is watching
+        self.in_flight  = 0               # messages submitted to the executor, not processed yet
+        self.flush_scheduled = False      # is a flush scheduled from another thread?
+
+    def __str__(self):
+        return str(self.address)
+
+class EventTCPHandler(CommunicationHandler):
+    ''' Class for the event loop based TCP/IP communication handler implementation.
+        Messages are processed on the loop thread in the order of their arrival,
+        or on the "executor" in the order of their arrival per connection.
+        The loop can be shared with other handlers if it is passed as "loop".
+        Connections with "max_pending" messages in progress or responses not sent yet
+        are not read until they catch up. Every identified request is answered: with
+        an empty message of its header if the message handler sent no response to it. '''
+
+    __would_block = (errno.EAGAIN, errno.EWOULDBLOCK)
+
+    def __init__(self, host, port, handler, backlog=128,
+                 send_queue_limit=64, slow_consumer_policy=SlowConsumerPolicy.COALESCE,
+                 max_connections=256, max_per_address=16, idle_timeout=120.0,
+                 loop=None, executor=None, max_pending=256):
+        CommunicationHandler.__init__(self, host, port, handler)
+
+        self.__backlog      = backlog
+        self.__queue_limit  = send_queue_limit
+        self.__policy       = SlowConsumerPolicy.parse(slow_consumer_policy)
+        self.__loop         = loop
+        self.__own_loop     = loop is None
+        self.__executor     = executor
+        self.__max_pending  = max_pending
+        self.__connections  = { }   # file descriptor -> Connection, used on the loop thread only
+        self.__registry     = ConnectionRegistry(max_connections, max_per_address, idle_timeout)
+        self.__context      = threading.local() # connection and request identifier being processed
+
+    def start(self):
+        CommunicationHandler.start(self)
+        if self.__own_loop:
+            self.__loop = EventLoop('TCP|EventLoop')
+        self.__create_socket()
+        self.__loop.register(self.__server_socket.fileno(), EventLoop.READ, self.__accept)
+        if self.__own_loop:
+            self.__loop.start()
+        self.__registry.start_loop_reaper(self.__loop, self.__close)
+
+    def stop(self):
+        self.__registry.stop_reaper()
+        if self.__own_loop:
+            self.__loop.call_soon_threadsafe(self.__shutdown)
+            self.__loop.stop()
+        else:
+            stopped = threading.Event()
+            self.__loop.call_soon_threadsafe(self.__shutdown, stopped)
+            stopped.wait()
+        CommunicationHandler.stop(self)
+
+    def __create_socket(self):
+        ''' Creates, configures and binds the non-blocking server socket. '''
+        self.__server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+        self.__server_socket.setblocking(0)
+        self.__server_socket.bind( (self.host, self.port) )
+        self.__server_socket.listen( self.__backlog )
+
+        bound_port = self.__server_socket.getsockname()[1]
+
+        print 'TCP (event loop) socket bound on', str(self.host) + ':' + str(bound_port)
+
+    def __shutdown(self, stopped=None):
+        ''' Closes the server socket and every client connection. '''
+        try:
+            for conn in self.__connections.values():
+                self.__close(conn)
+
+            self.__loop.unregister(self.__server_socket.fileno())
+            self.__server_socket.close()
+        finally:
+            if stopped is not None:
+                stopped.set()
+
+    def __accept(self, events):
+        ''' Accepts every pending client connection. '''
+        while True:
+            try:
+                (client_socket, client_address) = self.__server_socket.accept()
+            except socket.error as ex:
+                if ex.args[0] in EventTCPHandler.__would_block:
+                    break
+                raise
+
+            conn = Connection(client_socket, client_address, OutboundQueue(self.__queue_limit, self.__policy))
+            if not self.__registry.add(conn, client_address[0]):
+                print 'Socket refused (connection limit reached) from', client_address
+                client_socket.close()
+                continue
+
+            client_socket.setblocking(0)
+
+            self.__connections[conn.fileno] = conn
+            self.__loop.register(conn.fileno, EventLoop.READ, lambda ev, c=conn: self.__on_events(c, ev))
+
+    def __on_events(self, conn, events):
+        ''' Handles the readiness events of a client connection. '''
+        if events & EventLoop.WRITE:
+            self.__flush(conn)
+        if events & (EventLoop.READ | EventLoop.ERROR) and conn.enabled:
+            self.__read(conn)
+
+    def __read(self, conn):
+        ''' Reads the available data of a connection and processes the complete frames. '''
+        try:
+            count = conn.decoder.receive(conn.socket)
+        except socket.error as ex:
+            if ex.args[0] in EventTCPHandler.__would_block:
+                return
+            print 'TCP socket error:', conn.address, ex
+            self.__close(conn)
+            return
+        except ValueError as ex:
+            print 'TCP protocol error:', conn.address, ex
+            self.__close(conn)
+            return
+
+        if not count:
+            print 'TCP socket closed:', conn.address
+            self.__close(conn)
+            return
+
+        self.__registry.touch(conn) # any message (e.g. keepalive) resets the idle timer
+
+        try:
+            for header, data in conn.decoder.frames():
+                if not conn.enabled:
+                    break
+                self.__dispatch(conn, header, data)
+        except ValueError as ex:
+            print 'TCP protocol error:', conn.address, ex
+            self.__close(conn)
+            return
+
+        self.__update_events(conn)
+
+    def __dispatch(self, conn, header, data):
+        ''' Passes a received message to the message handler, on the executor if there is one. '''
+        if self.__executor is None:
+            self.__handle(conn, header, data)
+        else:
+            conn.in_flight += 1
+            self.__executor.submit(conn, self.__handle, conn, header, data, True)
+
+    def __handle(self, conn, header, data, executed=False):
+        ''' Calls the message handler in the context of the request. '''
+        request_id = None
+        try:
+            if header == Header.MSG_X_EXTENDED:
+                header, data, request_id = unwrap_extended(data)
+
+            self.__context.conn       = conn
+            self.__context.request_id = request_id
+            self.__context.answered   = False
+            self.handler(self, conn, header, data)
+        except Exception as ex:
+            print 'Exception received on TCP message handler [', conn.address, ']:', ex
+            traceback.print_exc()
+            if request_id is not None:
+                self.send(Header.MSG_A_ERROR, str(ex), conn)
+        finally:
+            try:
+                if request_id is not None and not self.__context.answered:
+                    self.send(header, None, conn) # acknowledges the request without response
+            finally:
+                self.__context.conn = None
+                if executed:
+                    self.__loop.call_soon_threadsafe(self.__handled, conn)
+
+    def __handled(self, conn):
+        ''' Registers the completion of a message processed on the executor. '''
+        conn.in_flight -= 1
+        self.__update_events(conn)
+
+    def __update_events(self, conn):
+        ''' Watches the connection for readability unless it has too many messages
+            in progress or waiting to be sent, and for writability while data remains. '''
+        if not conn.enabled:
+            return
+
+        events = 0
+        if conn.in_flight + len(conn.queue) < self.__max_pending:
+            events |= EventLoop.READ
+        if conn.sending:
+            events |= EventLoop.WRITE
+
+        if events != conn.events:
+            conn.events = events
+            self.__loop.modify(conn.fileno, events)
+
+    def __close(self, conn):
+        ''' Closes a client connection and releases its resources. '''
+        if self.__connections.get(conn.fileno) is not conn:
+            return # already closed, the descriptor may belong to a new connection
+
+        conn.enabled = False
+        conn.queue.close()
+        self.__loop.unregister(conn.fileno)
+        del self.__connections[conn.fileno]
+        self.__registry.remove(conn)
+        conn.socket.close()
+
+        self.release(conn)
+
+    def send(self, header, data, conn):
+        ''' Sends a message to the given destination.
+            Responses to identified requests carry the request identifier. '''
+
+        request_id = None
+        if getattr(self.__context, 'conn', None) is conn:
+            request_id = self.__context.request_id
+            self.__context.answered = True
+
+        self.__enqueue(conn, self.__build_frame(header, data, conn, request_id))
+
+    def push(self, header, data, conn, key=None):
+        ''' Sends an unsolicited message to the given destination.
+            Pushed messages are subject to the slow consumer policy. '''
+        frame = self.__build_frame(header, data, conn, push=True)
+        if frame is not None:
+            self.__enqueue(conn, frame, True, key)
+
+    def __build_frame(self, header, data, conn, request_id=None, push=False):
+        ''' Returns the parts of a frame encoded with the options of the connection.
+            A response too long for the connection is replaced with an error,
+            a pushed message too long for it is dropped (None is returned). '''
+        options = self.options_of(conn)
+        try:
+            return build_frame(header, data, options.compression(), request_id, options.extended_length())
+        except ValueError as ex:
+            # 64 KiB or more content for a client without extended length frames
+            print 'TCP message not sent to', conn, ':', ex
+            if push:
+                return None
+            return build_frame(Header.MSG_A_ERROR, str(ex), False, request_id)
+
+    def __enqueue(self, conn, frame, push=False, key=None):
+        ''' Queues an encoded frame on the connection and flushes it on the loop thread. '''
+        if not conn.enabled:
+            return
+
+        if not conn.queue.put(frame, push, key):
+            print 'TCP client is not reading its messages, disconnecting:', conn
+            self.__disconnect(conn)
+            return
+
+        if self.__loop.in_loop_thread():
+            self.__flush(conn)
+        else:
+            with conn.out_lock:
+                schedule = not conn.flush_scheduled
+                conn.flush_scheduled = True
+            if schedule:
+                self.__loop.call_soon_threadsafe(self.__flush, conn)
+
+    def __flush(self, conn):
+        ''' Writes as much of the queued frames as the socket accepts,
+            watches for writability while data remains. '''
+        if not conn.enabled:
+            return
+
+        with conn.out_lock:
+            conn.flush_scheduled = False
+
+        failure = None
+        try:
+            while True:
+                if not conn.sending:
+                    frame = conn.queue.pop()
+                    if frame is None:
+                        break
+                    conn.sending.extend(memoryview(part) for part in frame if part)
+
+                view = conn.sending[0]
+                sent = conn.socket.send(view[:SEND_CHUNK])
+                if sent < len(view):
+                    conn.sending[0] = view[sent:]
+                else:
+                    conn.sending.popleft()
+        except socket.error as ex:
+            if ex.args[0] not in EventTCPHandler.__would_block:
+                failure = ex
+
+        if failure is not None:
+            print 'TCP socket error:', conn.address, failure
+            self.__close(conn)
+        else:
+            self.__update_events(conn)
+
+    def set_options(self, conn, options):
+        ''' Stores the protocol options negotiated by the client. '''
+        CommunicationHandler.set_options(self, conn, options)
+        conn.decoder.extended_length = options.extended_length()
+
+    def broadcast(self, header, message):
+        ''' Sends a message on all registered client connections. '''
+
+        message = Payload.wrap(message) # compressed only once for every target
+
+        for target in self.broadcast_targets():
+            self.push(header, message, target)
+
+    def broadcast_targets(self):
+        ''' Returns the list of registered client connections. '''
+        return self.__registry.snapshot()
+
+    def authentication_succeeded(self, session_id, conn):
+        ''' Sets the session identifier of a client connection. '''
+        conn.session_id = session_id
+
+    def authentication_failed(self, conn):
+        ''' Closes the client connection which authentication failed. '''
+        self.__disconnect(conn)
+
+    def __disconnect(self, conn):
+        ''' Closes the client connection on the loop thread. '''
+        if self.__loop.in_loop_thread():
+            self.__close(conn)
+        else:
+            self.__loop.call_soon_threadsafe(self.__close, conn)
+
+    def is_valid_session(self, message, conn):
+        ''' Returns True, if the session of the client connection is still valid. '''
+        return self.validate_session(conn.session_id)
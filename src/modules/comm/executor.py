@@ -0,0 +1,96 @@
+'''
+Created on Oct 19, 2026
+
+Thread pool running the message handlers (and the database calls
+they make) off the event loop thread.
+
+@author: Viktor Adam
+'''
+
+import threading
+import traceback
+
+from collections import deque
+from Queue import Queue
+
+class HandlerExecutor(object):
+    ''' Runs calls on a pool of threads. Calls submitted with the same key
+        run one after the other in their submission order (so the messages
+        of a client are processed in order), other calls run in parallel. '''
+
+    def __init__(self, workers=4, name='Executor'):
+        self.__worker_count = workers
+        self.__name         = name
+        self.__queue        = Queue()
+        self.__lock         = threading.Lock()
+        self.__idle         = threading.Condition(self.__lock)
+        self.__outstanding  = 0     # calls submitted, not executed yet
+        self.__keys         = { }   # key -> deque of the calls waiting for the running one
+        self.__threads      = []
+
+    def start(self):
+        ''' Starts the worker threads. '''
+        for idx in xrange(self.__worker_count):
+            thread = threading.Thread(target=self.__work, name=self.__name + '|' + str(idx))
+            thread.start()
+            self.__threads.append(thread)
+
+    def stop(self):
+        ''' Stops the worker threads after the calls already submitted. '''
+        with self.__lock:
+            while self.__outstanding:
+                self.__idle.wait()
+
+        for thread in self.__threads:
+            self.__queue.put(None)
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+
+    def submit(self, key, function, *args):
+        ''' Schedules a call, after the previous calls submitted with the same key
+            unless the key is None. '''
+        call = (key, function, args)
+        with self.__lock:
+            self.__outstanding += 1
+            if key is not None:
+                waiting = self.__keys.get(key)
+                if waiting is not None:
+                    waiting.append(call)
+                    return
+                self.__keys[key] = deque()
+
+        self.__queue.put(call)
+
+    def wrap(self, handler):
+        ''' Returns a message handler that runs "handler" on the pool,
+            the messages of the same sender are processed in order. '''
+        def submit_message(comm_handler, sender, header, data):
+            self.submit(sender, handler, comm_handler, sender, header, data)
+        return submit_message
+
+    def __work(self):
+        ''' Executes the submitted calls until stopped. '''
+        while True:
+            call = self.__queue.get()
+            if call is None:
+                break
+
+            key, function, args = call
+            try:
+                function(*args)
+            except Exception as ex:
+                print 'Exception received on executor thread [', threading.current_thread().name, ']:', ex
+                traceback.print_exc()
+
+            with self.__lock:
+                if key is not None:
+                    waiting = self.__keys[key]
+                    if waiting:
+                        self.__queue.put(waiting.popleft()) # the next call of the key, behind the other keys
+                    else:
+                        del self.__keys[key]
+
+                self.__outstanding -= 1
+                if not self.__outstanding:
+                    self.__idle.notify_all()
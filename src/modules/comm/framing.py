@@ -0,0 +1,132 @@
+'''
+Created on Oct 19, 2026
+
+Encoding helpers and incremental decoder of the length-prefixed
+TCP frames reading large chunks into a reusable buffer.
+
+@author: Viktor Adam
+'''
+
+import struct
+
+HEADER_SIZE          = 3        # 8 bits header and 16 bits length
+EXTENDED_LENGTH      = 0xFFFF   # length value followed by the 32 bits length
+EXTENDED_HEADER_SIZE = HEADER_SIZE + 4
+SEND_CHUNK           = 65536    # maximal size of a single socket write
+
+__short_prefix = struct.Struct('!BH')
+__long_prefix  = struct.Struct('!BHI')
+
+def frame_prefix(header, length, extended_length=False):
+    ''' Returns the header and length bytes of a frame.
+        Content of 64 KiB or more needs the negotiated extended length. '''
+    if extended_length and length >= EXTENDED_LENGTH:
+        return __long_prefix.pack(header, EXTENDED_LENGTH, length)
+    elif length > EXTENDED_LENGTH:
+        raise ValueError('Message too long without extended length: ' + str(length) + ' bytes')
+    else:
+        return __short_prefix.pack(header, length)
+
+class FrameDecoder(object):
+    ''' Decodes frames (8 bits header, 16 bits length and content) from a stream.
+        Data is received into a reusable buffer and frames are parsed with
+        memoryview slices, partial frames are kept until the rest arrives.
+        With "extended_length" enabled the 0xFFFF length is followed by
+        the 32 bits length of the content. '''
+
+    MAX_LENGTH = 16 * 1024 * 1024   # upper limit of incoming extended frames
+
+    def __init__(self, size=65536, extended_length=False):
+        self.extended_length = extended_length
+
+        self.__size   = size
+        self.__buffer = bytearray(size)
+        self.__view   = memoryview(self.__buffer)
+        self.__start  = 0   # first byte not processed yet
+        self.__end    = 0   # end of the received data
+
+    def pending(self):
+        ''' Returns the number of received bytes not decoded yet. '''
+        return self.__end - self.__start
+
+    def __reserve(self, size):
+        ''' Makes room for at least "size" bytes after the received data,
+            moving the unprocessed bytes to the front or growing the buffer. '''
+        if len(self.__buffer) - self.__end >= size:
+            return
+
+        remaining = self.__end - self.__start
+        if remaining + size > len(self.__buffer):
+            buf = bytearray(max(len(self.__buffer) * 2, remaining + size))
+            buf[:remaining] = self.__view[self.__start:self.__end]
+            self.__buffer, self.__view = buf, memoryview(buf)
+        else:
+            self.__buffer[:remaining] = self.__buffer[self.__start:self.__end]
+
+        self.__start, self.__end = 0, remaining
+
+    def __next_frame(self):
+        ''' Returns the header size and content length of the next frame
+            or None if its header was not received completely. '''
+        if self.pending() < HEADER_SIZE:
+            return None
+
+        buf, start = self.__buffer, self.__start
+        length = ( buf[start + 1] << 8 ) | buf[start + 2]
+        if length != EXTENDED_LENGTH or not self.extended_length:
+            return HEADER_SIZE, length
+
+        if self.pending() < EXTENDED_HEADER_SIZE:
+            return None
+
+        length = struct.unpack_from('!I', buf, start + HEADER_SIZE)[0]
+        if length > FrameDecoder.MAX_LENGTH:
+            raise ValueError('Incoming frame too long: ' + str(length) + ' bytes')
+        return EXTENDED_HEADER_SIZE, length
+
+    def __free_space(self):
+        ''' Returns the room needed for the next read: at least a quarter of the
+            buffer or the rest of the frame being received. '''
+        needed = len(self.__buffer) // 4
+        frame = self.__next_frame()
+        if frame is not None:
+            needed = max(needed, frame[0] + frame[1] - self.pending())
+        return needed
+
+    def receive(self, sock):
+        ''' Reads the available data from the socket with a single call.
+            Returns the number of bytes read, 0 if the connection was closed. '''
+        if self.__start == self.__end:
+            self.__start = self.__end = 0
+            if len(self.__buffer) > self.__size:
+                # release the room of a large frame processed before
+                self.__buffer = bytearray(self.__size)
+                self.__view   = memoryview(self.__buffer)
+        self.__reserve(self.__free_space())
+
+        count = sock.recv_into(self.__view[self.__end:])
+        self.__end += count
+        return count
+
+    def feed(self, data):
+        ''' Appends already received data to the buffer. '''
+        self.__reserve(len(data))
+        self.__buffer[self.__end:self.__end + len(data)] = data
+        self.__end += len(data)
+
+    def frames(self):
+        ''' Yields the (header, content) pairs of the complete frames received.
+            The content is copied out of the buffer only once, as it is reused. '''
+        while True:
+            frame = self.__next_frame()
+            if frame is None:
+                break
+
+            header_size, length = frame
+            start = self.__start
+            content_start = start + header_size
+            if self.__end - content_start < length:
+                break # wait for the rest of the frame
+
+            self.__start = content_start + length
+            yield self.__buffer[start], self.__view[content_start:content_start + length].tobytes()
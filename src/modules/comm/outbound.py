@@ -0,0 +1,114 @@
+'''
+Created on Oct 19, 2026
+
+Bounded outbound message queues of client connections
+with policies for clients not reading fast enough.
+
+@author: Viktor Adam
+'''
+
+import threading
+
+from collections import deque
+
+class SlowConsumerPolicy(object):
+    ''' What to do with pushed messages above the high-water mark. '''
+
+    DROP_OLDEST = 'drop'        # the oldest pushed message is dropped
+    COALESCE    = 'coalesce'    # a queued push with the same key is replaced, else the oldest is dropped
+    DISCONNECT  = 'disconnect'  # the client connection is closed
+
+    ALL = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+    @classmethod
+    def parse(cls, name):
+        ''' Returns the policy with the given (case-insensitive) name,
+            raises ValueError for an unsupported one. '''
+        policy = name.lower()
+        if policy not in cls.ALL:
+            raise ValueError('Unsupported slow consumer policy: ' + name +
+                             ' (expected one of: ' + ', '.join(cls.ALL) + ')')
+        return policy
+
+class OutboundQueue(object):
+    ''' Queue of encoded frames waiting to be sent on a client connection.
+        Responses are always kept, pushed (unsolicited) messages above
+        the high-water mark are handled according to the policy. '''
+
+    def __init__(self, high_water=64, policy=SlowConsumerPolicy.COALESCE):
+        self.__high_water = high_water
+        self.__policy     = policy
+
+        self.__condition  = threading.Condition()
+        self.__items      = deque()  # [ frame, is push, key ] items
+        self.__pushes     = 0        # number of queued pushed messages
+        self.__closed     = False
+
+        self.dropped      = 0        # number of pushed messages dropped or replaced
+
+    def put(self, frame, push=False, key=None):
+        ''' Queues a frame to send. Returns False if the client
+            should be disconnected for not reading its messages. '''
+        with self.__condition:
+            if self.__closed:
+                return True
+
+            if push and self.__pushes >= self.__high_water:
+                if self.__policy == SlowConsumerPolicy.DISCONNECT:
+                    return False
+
+                if self.__policy == SlowConsumerPolicy.COALESCE and key is not None:
+                    for item in self.__items:
+                        if item[1] and item[2] == key:
+                            item[0] = frame # the newer message supersedes the queued one
+                            self.dropped += 1
+                            return True
+
+                self.__drop_oldest_push()
+
+            self.__items.append([ frame, push, key ])
+            if push:
+                self.__pushes += 1
+            self.__condition.notify()
+            return True
+
+    def __drop_oldest_push(self):
+        ''' Removes the oldest queued pushed message. '''
+        for item in self.__items:
+            if item[1]:
+                self.__items.remove(item)
+                self.__pushes -= 1
+                self.dropped  += 1
+                return
+
+    def pop(self):
+        ''' Returns the next frame to send or None if the queue is empty. '''
+        with self.__condition:
+            return self.__pop()
+
+    def get(self):
+        ''' Waits for and returns the next frame to send, None when the queue was closed. '''
+        with self.__condition:
+            while not self.__items and not self.__closed:
+                self.__condition.wait()
+            return None if self.__closed else self.__pop()
+
+    def __pop(self):
+        if not self.__items:
+            return None
+        frame, push, key = self.__items.popleft()  # @UnusedVariable
+        if push:
+            self.__pushes -= 1
+        return frame
+
+    def close(self):
+        ''' Discards the queued frames and wakes up the waiting writer. '''
+        with self.__condition:
+            self.__closed = True
+            self.__items.clear()
+            self.__pushes = 0
+            self.__condition.notify_all()
+
+    def __len__(self):
+        with self.__condition:
+            return len(self.__items)
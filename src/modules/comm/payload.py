@@ -0,0 +1,62 @@
+'''
+Created on Oct 19, 2026
+
+Helper class to prepare message contents for sending,
+compressing them for the clients that support it.
+
+@author: Viktor Adam
+'''
+
+import zlib
+
+def to_bytes(data):
+    ''' Returns the raw bytes to send for the message content.
+        Text is sent as ASCII, binary content is sent as is. '''
+    if data is None:
+        return ''
+    elif isinstance(data, unicode):
+        return data.encode('ascii', 'ignore')
+    else:
+        return data
+
+class Payload(object):
+    ''' Message content to send. The content is compressed at most once
+        and the result is reused for every client that negotiated compression. '''
+
+    THRESHOLD        = 512          # smaller messages are never compressed
+    LEVEL            = 6            # zlib compression level
+    MAX_DECOMPRESSED = 1024 * 1024  # upper limit of decompressed incoming messages
+
+    def __init__(self, data):
+        self.data = to_bytes(data)
+        self.__compressed = None
+
+    def compressed(self):
+        ''' Returns the compressed content or None if compression does not make it smaller. '''
+        if self.__compressed is None:
+            compressed = zlib.compress(self.data, Payload.LEVEL)
+            self.__compressed = compressed if len(compressed) < len(self.data) else ''
+        return self.__compressed or None
+
+    def content(self, compression):
+        ''' Returns the content to send and whether it is compressed or not.
+            Compression is used only if "compression" is enabled for the client. '''
+        if compression and len(self.data) >= Payload.THRESHOLD:
+            compressed = self.compressed()
+            if compressed is not None:
+                return compressed, True
+        return self.data, False
+
+    @classmethod
+    def wrap(cls, data):
+        ''' Returns the data as a Payload instance. '''
+        return data if isinstance(data, Payload) else Payload(data)
+
+    @classmethod
+    def decompress(cls, data):
+        ''' Decompresses an incoming message refusing oversized results. '''
+        decompressor = zlib.decompressobj()
+        result = decompressor.decompress(data, Payload.MAX_DECOMPRESSED)
+        if decompressor.unconsumed_tail:
+            raise ValueError('Decompressed message exceeds ' + str(Payload.MAX_DECOMPRESSED) + ' bytes')
+        return result + decompressor.flush()
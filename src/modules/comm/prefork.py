@@ -0,0 +1,492 @@
+'''
+Created on Oct 19, 2026
+
+TCP/IP based communication handler implementation serving clients
+from several forked worker processes listening on the same port.
+Requests changing the state are relayed to the parent process,
+read-only requests of logged in clients are served by the workers
+with the sessions validated by the parent and cached in the workers.
+
+@author: Viktor Adam
+'''
+
+import cPickle
+import itertools
+import os
+import signal
+import socket
+import struct
+import threading
+import time
+import traceback
+from Queue import Queue, Empty
+
+from modules.comm import CommunicationHandler, ClientOptions, StateUpdate, schema
+from modules.comm.payload import Payload
+from modules.comm.tcp import TCPHandler, SO_REUSEPORT
+from util.clock import monotonic
+from util.database import Database
+
+class Channel(object):
+    ''' Message channel between the parent and a worker process over a local socket.
+        Messages are tuples, serialized with length prefix. '''
+
+    __length = struct.Struct('!I')
+
+    def __init__(self, sock):
+        self.__socket = sock
+        self.__lock   = threading.Lock()
+
+    def send(self, *message):
+        ''' Sends a message, can be called from any thread. '''
+        data = cPickle.dumps(message, cPickle.HIGHEST_PROTOCOL)
+        with self.__lock:
+            self.__socket.sendall(Channel.__length.pack(len(data)) + data)
+
+    def receive(self):
+        ''' Waits for and returns the next message, None if the channel was closed. '''
+        head = self.__read(Channel.__length.size)
+        if head is None:
+            return None
+        data = self.__read(Channel.__length.unpack(head)[0])
+        return cPickle.loads(data) if data is not None else None
+
+    def __read(self, size):
+        parts, remaining = [], size
+        while remaining > 0:
+            try:
+                chunk = self.__socket.recv(min(remaining, 65536))
+            except socket.error:
+                return None
+            if not chunk:
+                return None
+            parts.append(chunk)
+            remaining -= len(chunk)
+        return ''.join(parts)
+
+    def close(self):
+        ''' Closes this process' descriptor of the channel (the other process keeps its own). '''
+        self.__socket.close()
+
+class WorkerTCPHandler(TCPHandler):
+    ''' TCP handler of a worker process. Read-only requests ("local_headers")
+        of logged in clients are processed by the forked copy of the
+        application handler, other requests are relayed to the parent.
+        The sessions are validated by the parent, the forked copy of the
+        session store would not see the expired and removed sessions.
+        Accepted sessions are trusted for SESSION_TTL seconds or until the
+        parent revokes them, the parent is waited for PARENT_TIMEOUT seconds. '''
+
+    SESSION_TTL    = 5.0
+    PARENT_TIMEOUT = 5.0
+    MAX_SESSIONS   = 1024   # cached sessions before the expired ones are dropped
+
+    def __init__(self, channel, application, local_headers, host, port, **options):
+        TCPHandler.__init__(self, host, port, self.__handle, reuse_port=True, **options)
+
+        self.__channel       = channel
+        self.__application   = application
+        self.__local_headers = frozenset(local_headers)
+
+        self.__lock    = threading.Lock()
+        self.__clients = { }    # connection identifier -> SenderInfo
+        self.__pending = { }    # request token -> Queue of the operations to execute
+        self.__tokens  = itertools.count()
+
+        self.__sessions    = { }   # session identifier -> trusted until (monotonic)
+        self.__revocations = 0     # revocations received from the parent
+
+        self.session_validator = self.__validate_in_parent
+
+    def __ask_parent(self, *message):
+        ''' Sends a message with a new request token to the parent
+            and returns the queue receiving the replies. '''
+        replies = Queue()
+        with self.__lock:
+            token = self.__tokens.next()
+            self.__pending[token] = replies
+        try:
+            self.__channel.send(message[0], token, *message[1:])
+        except:
+            with self.__lock:
+                del self.__pending[token]
+            raise
+        return token, replies
+
+    def __validate_in_parent(self, session_id):
+        ''' Returns True, if the session was accepted by the parent recently
+            or the parent accepts the session identifier now. '''
+        now = monotonic()
+        with self.__lock:
+            if self.__sessions.get(session_id, 0) > now:
+                return True
+            revocations = self.__revocations
+
+        try:
+            token, replies = self.__ask_parent('session', session_id)
+        except socket.error:
+            return False # the parent has stopped
+        try:
+            reply = replies.get(True, WorkerTCPHandler.PARENT_TIMEOUT)
+        except Empty:
+            print 'TCP worker: the parent did not validate a session in time'
+            reply = None
+        finally:
+            with self.__lock:
+                del self.__pending[token]
+
+        valid = reply is not None and reply[0] == 'valid' and reply[1]
+        with self.__lock:
+            if valid and self.__revocations == revocations:  # not revoked while waiting
+                if len(self.__sessions) >= WorkerTCPHandler.MAX_SESSIONS:
+                    for cached, until in self.__sessions.items():
+                        if until <= now:
+                            del self.__sessions[cached]
+                self.__sessions[session_id] = now + WorkerTCPHandler.SESSION_TTL
+        return valid
+
+    def __handle(self, handler, sender, header, data):
+        ''' Processes a received message locally or in the parent process. '''
+        if sender.session_id is not None and header in self.__local_headers:
+            self.__application(self, sender, header, data)
+            return
+
+        with self.__lock:
+            self.__clients[id(sender)] = sender
+        token, replies = self.__ask_parent('request', id(sender), str(sender.address), header, data)
+
+        try:
+            # execute the operations of the parent on this thread to keep the request context
+            while True:
+                operation = replies.get()
+                if operation is None or operation[0] == 'done':
+                    break
+                self.__execute(sender, operation)
+        finally:
+            with self.__lock:
+                del self.__pending[token]
+
+    def __execute(self, sender, operation):
+        ''' Executes an operation requested by the parent on a client connection. '''
+        name, args = operation[0], operation[1:]
+        if name == 'send':
+            self.send(args[0], args[1], sender)
+        elif name == 'push':
+            self.push(args[0], args[1], sender, args[2])
+        elif name == 'auth':
+            self.authentication_succeeded(args[0], sender)
+        elif name == 'fail':
+            self.authentication_failed(sender)
+        elif name == 'options':
+            self.set_options(sender, ClientOptions.parse(args[0]))
+        elif name == 'subscribe':
+            self.subscribe(sender, args[0])
+        elif name == 'unsubscribe':
+            self.unsubscribe(sender)
+
+    def serve(self):
+        ''' Processes the messages of the parent until the channel is closed. '''
+        while True:
+            message = self.__channel.receive()
+            if message is None or message[0] == 'stop':
+                break
+
+            try:
+                kind = message[0]
+                if kind == 'reply':
+                    with self.__lock:
+                        replies = self.__pending.get(message[1])
+                    if replies is not None:
+                        replies.put(message[2])
+                elif kind == 'revoke':
+                    with self.__lock:
+                        self.__revocations += 1
+                        for session_id in message[1]:
+                            self.__sessions.pop(session_id, None)
+                elif kind == 'conn':
+                    sender = self.__clients.get(message[1])
+                    if sender is not None:
+                        self.__execute(sender, message[2])
+                elif kind == 'broadcast':
+                    self.broadcast(message[1], message[2])
+                elif kind == 'states':
+                    targets = None
+                    if message[2] is not None:
+                        with self.__lock:
+                            targets = [ self.__clients[c] for c in message[2] if c in self.__clients ]
+                    self.broadcast_states([ StateUpdate(*update) for update in message[1] ], targets)
+            except Exception as ex:
+                print 'Exception received on TCP worker channel:', ex
+                traceback.print_exc()
+
+        # wake up the requests waiting for the parent
+        with self.__lock:
+            for replies in self.__pending.values():
+                replies.put(None)
+
+    def release(self, sender):
+        TCPHandler.release(self, sender)
+
+        with self.__lock:
+            known = self.__clients.pop(id(sender), None) is not None
+        if known:
+            try:
+                self.__channel.send('closed', id(sender))
+            except socket.error:
+                pass # the parent has stopped
+
+class WorkerProcess(object):
+    ''' Parent side information about a worker process. '''
+
+    def __init__(self, index, pid, channel):
+        self.index   = index
+        self.pid     = pid
+        self.channel = channel
+
+class RemoteClient(object):
+    ''' Parent side representation of a client connected to a worker process. '''
+
+    def __init__(self, worker, conn_id, address):
+        self.worker  = worker
+        self.conn_id = conn_id
+        self.address = address
+        self.session_id = None
+
+    def __str__(self):
+        return self.address + '@' + str(self.worker.index)
+
+class PreforkTCPHandler(CommunicationHandler):
+    ''' Class for the multi-process TCP/IP communication handler implementation.
+        Forks "workers" processes listening on the same port with SO_REUSEPORT,
+        the parent process communicates with them over local sockets.
+        Workers not stopped in STOP_TIMEOUT seconds are killed. '''
+
+    STOP_TIMEOUT = 5.0
+
+    def __init__(self, host, port, handler, workers=4, local_headers=(), relays=4, **tcp_options):
+        CommunicationHandler.__init__(self, host, port, handler)
+
+        self.__worker_count  = workers
+        self.__local_headers = local_headers
+        self.__relay_count   = relays
+        self.__tcp_options   = tcp_options
+
+        self.__workers  = []
+        self.__clients  = { }   # (worker index, connection identifier) -> RemoteClient
+        self.__lock     = threading.Lock()
+        self.__requests = Queue()
+        self.__context  = threading.local() # the request being processed by the thread
+
+    def fork_workers(self):
+        ''' Reserves the port and forks the worker processes. To be called before
+            the process starts any thread: a lock held by another thread at the fork
+            would stay locked in the workers forever. Called by start() if needed. '''
+        if self.__workers:
+            return
+
+        # keeps the port (possibly chosen by the system) reserved for the workers
+        self.__port_holder = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__port_holder.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+        self.__port_holder.bind( (self.host, self.port) )
+        self.port = self.__port_holder.getsockname()[1]
+
+        for index in xrange(self.__worker_count):
+            self.__fork_worker(index)
+
+    def start(self):
+        CommunicationHandler.start(self)
+        self.fork_workers()
+
+        for worker in self.__workers:
+            threading.Thread(target=self.__receive, name='TCP|Prefork|Channel|' + str(worker.index), args=(worker, )).start()
+        for idx in xrange(self.__relay_count):
+            threading.Thread(target=self.__process_requests, name='TCP|Prefork|Relay|' + str(idx)).start()
+
+        print 'TCP (prefork) workers started on', str(self.host) + ':' + str(self.port), '| workers:', self.__worker_count
+
+    def stop(self):
+        for worker in self.__workers:
+            try:
+                worker.channel.send('stop')
+            except socket.error:
+                pass # already stopped
+
+        deadline = monotonic() + PreforkTCPHandler.STOP_TIMEOUT
+        for worker in self.__workers:
+            while os.waitpid(worker.pid, os.WNOHANG)[0] == 0:
+                if monotonic() >= deadline:
+                    print 'TCP worker', worker.index, 'did not stop in time, killing it'
+                    os.kill(worker.pid, signal.SIGKILL)
+                    os.waitpid(worker.pid, 0)
+                    break
+                time.sleep(0.05)
+            worker.channel.close()
+
+        for x in xrange(self.__relay_count):  # @UnusedVariable
+            self.__requests.put(None)
+
+        self.__port_holder.close()
+        CommunicationHandler.stop(self)
+
+    def __fork_worker(self, index):
+        ''' Forks a worker process connected with a local socket pair. '''
+        parent_socket, worker_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        pid = os.fork()
+        if pid == 0:
+            parent_socket.close()
+            self.__run_worker(index, Channel(worker_socket))
+        else:
+            worker_socket.close()
+            self.__workers.append(WorkerProcess(index, pid, Channel(parent_socket)))
+
+    def __run_worker(self, index, channel):
+        ''' The main function of a worker process, never returns. '''
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_IGN) # the parent stops the workers
+            Database.reset_after_fork() # writer sessions of the parent threads are not ours
+            self.__port_holder.close()
+            for worker in self.__workers:
+                worker.channel.close()
+
+            handler = WorkerTCPHandler(channel, self.handler, self.__local_headers,
+                                       self.host, self.port, **self.__tcp_options)
+            handler.start()
+            try:
+                handler.serve()
+            finally:
+                handler.stop()
+        except:
+            traceback.print_exc()
+        finally:
+            os._exit(0)
+
+    def __receive(self, worker):
+        ''' Receives the messages of a worker process. '''
+        while True:
+            message = worker.channel.receive()
+            if message is None:
+                break
+
+            if message[0] == 'request':
+                self.__requests.put( (worker, ) + message[1:] )
+            elif message[0] == 'session':
+                try:
+                    worker.channel.send('reply', message[1], ('valid', self.validate_session(message[2])))
+                except Exception as ex:
+                    print 'Failed to validate session for TCP worker', worker.index, ':', ex
+                    traceback.print_exc()
+            elif message[0] == 'closed':
+                with self.__lock:
+                    client = self.__clients.pop( (worker.index, message[1]), None )
+                if client is not None:
+                    self.release(client)
+
+    def __process_requests(self):
+        ''' Processes the requests relayed by the workers. '''
+        while True:
+            request = self.__requests.get()
+            if request is None:
+                break
+
+            worker, token, conn_id, address, header, data = request
+            with self.__lock:
+                client = self.__clients.get( (worker.index, conn_id) )
+                if client is None:
+                    client = RemoteClient(worker, conn_id, address)
+                    self.__clients[ (worker.index, conn_id) ] = client
+
+            self.__context.client = client
+            self.__context.token  = token
+            try:
+                self.handler(self, client, header, data)
+            except Exception as ex:
+                print 'Exception received on TCP relay thread [', client, ']:', ex
+                traceback.print_exc()
+            finally:
+                self.__context.client = None
+                try:
+                    worker.channel.send('reply', token, ('done', ))
+                except socket.error:
+                    pass # the worker has stopped
+
+    def __route(self, client, *operation):
+        ''' Sends an operation on a client connection to its worker. Operations of the
+            request being processed are executed in the context of the request. '''
+        try:
+            if getattr(self.__context, 'client', None) is client:
+                client.worker.channel.send('reply', self.__context.token, operation)
+            else:
+                client.worker.channel.send('conn', client.conn_id, operation)
+        except socket.error as ex:
+            print 'Failed to reach TCP worker', client.worker.index, ':', ex
+
+    def send(self, header, data, client):
+        ''' Sends a message to the given destination. '''
+        self.__route(client, 'send', header, Payload.wrap(data).data)
+
+    def push(self, header, data, client, key=None):
+        ''' Sends an unsolicited message to the given destination. '''
+        self.__route(client, 'push', header, Payload.wrap(data).data, key)
+
+    def __to_workers(self, *message):
+        ''' Sends a message to every worker process. '''
+        for worker in self.__workers:
+            try:
+                worker.channel.send(*message)
+            except socket.error as ex:
+                print 'Failed to reach TCP worker', worker.index, ':', ex
+
+    def broadcast(self, header, message):
+        ''' Sends a message to the clients of every worker. '''
+        self.__to_workers('broadcast', header, Payload.wrap(message).data)
+
+    def broadcast_states(self, updates, targets=None):
+        ''' Sends the state updates to the workers, they select and encode
+            them for their subscribed clients (for the given "targets" only, if any). '''
+        updates = [ (u.unique_id, u.type_id, u.name, schema.ENTITY.values(u.entity)) for u in updates ]
+        if targets is None:
+            self.__to_workers('states', updates, None)
+            return
+
+        connections = { }   # worker -> connection identifiers
+        for client in targets:
+            connections.setdefault(client.worker, []).append(client.conn_id)
+        for worker, conn_ids in connections.iteritems():
+            try:
+                worker.channel.send('states', updates, conn_ids)
+            except socket.error as ex:
+                print 'Failed to reach TCP worker', worker.index, ':', ex
+
+    def broadcast_targets(self):
+        ''' Returns the clients known by the parent process (the ones that sent requests to it). '''
+        with self.__lock:
+            return self.__clients.values()
+
+    def subscribe(self, client, subscription):
+        ''' Registers the subscription in the worker of the client. '''
+        self.__route(client, 'subscribe', subscription)
+
+    def unsubscribe(self, client):
+        ''' Removes the subscription in the worker of the client. '''
+        self.__route(client, 'unsubscribe')
+
+    def set_options(self, client, options):
+        ''' Stores the options negotiated by the client in its worker. '''
+        CommunicationHandler.set_options(self, client, options)
+        self.__route(client, 'options', options.serialize())
+
+    def authentication_succeeded(self, session_id, client):
+        client.session_id = session_id
+        self.__route(client, 'auth', session_id)
+
+    def authentication_failed(self, client):
+        self.__route(client, 'fail')
+
+    def revoke_sessions(self, session_ids):
+        ''' Removes the sessions from the caches of the workers. '''
+        self.__to_workers('revoke', list(session_ids))
+
+    def is_valid_session(self, message, client):
+        ''' Returns True, if the session of the client connection is still valid. '''
+        return self.validate_session(client.session_id)
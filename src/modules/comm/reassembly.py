@@ -0,0 +1,126 @@
+'''
+Created on Oct 19, 2026
+
+Reassembly of messages received in several UDP datagrams
+with memory budgets and expiry of the incomplete messages.
+
+@author: Viktor Adam
+'''
+
+from collections import OrderedDict
+
+from util.clock import monotonic
+
+class ReassemblyBuffer(object):
+    ''' Collects the fragments of incomplete messages by sender and header.
+        Fragments are kept in lists and joined once when the message completes.
+        A message is dropped when its sender goes above "max_per_sender" bytes,
+        the oldest messages of any sender are evicted above "max_bytes" bytes
+        and messages not completed in "ttl" seconds (on the monotonic clock) expire.
+        Not thread-safe, used by the receiver of a handler. '''
+
+    def __init__(self, max_bytes=1048576, max_per_sender=262144, ttl=10.0):
+        self.__max_bytes      = max_bytes
+        self.__max_per_sender = max_per_sender
+        self.__ttl            = ttl
+
+        self.__messages = OrderedDict()   # (sender, header) -> [ fragments or None if dropped, size, started ]
+        self.__senders  = { }             # sender -> bytes buffered
+        self.__size     = 0               # bytes buffered
+
+        self.dropped    = 0   # messages dropped for going above the per sender budget
+        self.evicted    = 0   # messages evicted for the global budget
+        self.expired    = 0   # messages not completed in time
+
+    def add(self, sender, header, data, finish, now=None):
+        ''' Adds a fragment, returns the complete message when "finish" is set
+            or None if the message is incomplete or was dropped. '''
+        if now is None:
+            now = monotonic()
+        self.__expire(now)
+
+        key = (sender, header)
+        entry = self.__messages.get(key)
+
+        if entry is None:
+            if finish:
+                return data # not fragmented
+            entry = [ [], 0, now ]
+            self.__messages[key] = entry
+        elif entry[0] is None: # dropped, wait for its last fragment
+            if finish:
+                del self.__messages[key]
+            return None
+
+        if finish:
+            self.__remove(key)
+            entry[0].append(data)
+            return ''.join(entry[0])
+
+        if self.__senders.get(sender, 0) + len(data) > self.__max_per_sender:
+            self.__drop(key, entry)
+            self.dropped += 1
+            return None
+
+        while self.__size + len(data) > self.__max_bytes:
+            oldest = self.__oldest_other(key)
+            if oldest is None:
+                self.__drop(key, entry) # larger than the whole budget
+                self.dropped += 1
+                return None
+            self.__drop(oldest, self.__messages[oldest])
+            self.evicted += 1
+
+        entry[0].append(data)
+        entry[1] += len(data)
+        self.__senders[sender] = self.__senders.get(sender, 0) + len(data)
+        self.__size += len(data)
+        return None
+
+    def discard(self, sender):
+        ''' Removes the incomplete messages of a sender. '''
+        for key in [ k for k in self.__messages if k[0] == sender ]:
+            self.__remove(key)
+
+    def __oldest_other(self, key):
+        ''' Returns the oldest message holding bytes other than "key", or None. '''
+        for other, entry in self.__messages.iteritems():
+            if other != key and entry[1]:
+                return other
+        return None
+
+    def __expire(self, now):
+        ''' Removes the messages started more than "ttl" seconds ago,
+            they are ordered by their start. '''
+        while self.__messages:
+            key, entry = next(self.__messages.iteritems())
+            if entry[2] + self.__ttl > now:
+                break
+            self.__remove(key)
+            self.expired += 1
+
+    def __drop(self, key, entry):
+        ''' Discards the fragments of a message, the rest of its fragments
+            are ignored until its last one arrives or it expires. '''
+        self.__release(key, entry)
+        entry[0] = None
+
+    def __remove(self, key):
+        self.__release(key, self.__messages.pop(key))
+
+    def __release(self, key, entry):
+        ''' Returns the bytes of a message to the budgets. '''
+        if entry[1]:
+            sender = key[0]
+            self.__size -= entry[1]
+            self.__senders[sender] -= entry[1]
+            if not self.__senders[sender]:
+                del self.__senders[sender]
+            entry[1] = 0
+
+    def __len__(self):
+        return len(self.__messages)
+
+    def size(self):
+        ''' Returns the number of bytes buffered. '''
+        return self.__size
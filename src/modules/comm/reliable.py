@@ -0,0 +1,199 @@
+'''
+Created on Oct 19, 2026
+
+Reliable delivery of the messages sent in several UDP datagrams.
+Sequenced datagrams carry the sequence number of their message and
+their position in it, receivers request the missing fragments with
+NACK messages and the sender retransmits them from a bounded window.
+NACK messages start with the session identifier like other requests.
+The server keeps a RetransmitWindow, clients use a ReliableReceiver.
+
+@author: Viktor Adam
+'''
+
+import struct
+
+from collections import OrderedDict
+
+from util.clock import monotonic
+
+# message sequence number, fragment index, fragment count
+SEQUENCE = struct.Struct('!IHH')
+
+# message sequence number of a NACK, followed by the missing fragment indexes (none: every fragment)
+NACK_SEQUENCE = struct.Struct('!I')
+NACK_INDEX    = struct.Struct('!H')
+
+def encode_nack(sequence, missing=()):
+    ''' Returns the content of a NACK message. '''
+    return NACK_SEQUENCE.pack(sequence) + ''.join(NACK_INDEX.pack(idx) for idx in missing)
+
+def decode_nack(data):
+    ''' Returns the sequence number and the missing fragment indexes of a NACK message. '''
+    sequence = NACK_SEQUENCE.unpack_from(data)[0]
+    missing = [ NACK_INDEX.unpack_from(data, offset)[0]
+                for offset in xrange(NACK_SEQUENCE.size, len(data) - NACK_INDEX.size + 1, NACK_INDEX.size) ]
+    return sequence, missing
+
+class RetransmitWindow(object):
+    ''' Keeps the datagrams of the last "max_messages" messages sent to each
+        destination for retransmission, the oldest messages of any destination
+        are evicted above "max_bytes" bytes. Thread-safe with the send lock of the handler. '''
+
+    def __init__(self, max_messages=32, max_bytes=1048576):
+        self.__max_messages = max_messages
+        self.__max_bytes    = max_bytes
+
+        self.__destinations = { }           # destination -> OrderedDict of sequence -> datagrams
+        self.__order        = OrderedDict() # (destination, sequence) -> size, oldest first
+        self.__size         = 0
+
+        self.evicted        = 0   # messages evicted for the byte budget
+        self.retransmitted  = 0   # datagrams sent again
+
+    def store(self, destination, sequence, datagrams):
+        ''' Stores the datagrams of a message sent to the destination. '''
+        messages = self.__destinations.setdefault(destination, OrderedDict())
+        size = sum(len(d) for d in datagrams)
+
+        messages[sequence] = datagrams
+        self.__order[(destination, sequence)] = size
+        self.__size += size
+
+        if len(messages) > self.__max_messages:
+            self.__remove(destination, next(iter(messages)))
+
+        while self.__size > self.__max_bytes and len(self.__order) > 1:
+            self.__remove(*next(iter(self.__order)))
+            self.evicted += 1
+
+    def get(self, destination, sequence, missing=()):
+        ''' Returns the datagrams requested again (every one of the message, if "missing" is empty). '''
+        datagrams = self.__destinations.get(destination, { }).get(sequence)
+        if datagrams is None:
+            return []
+
+        if missing:
+            datagrams = [ datagrams[idx] for idx in missing if idx < len(datagrams) ]
+        self.retransmitted += len(datagrams)
+        return datagrams
+
+    def discard(self, destination):
+        ''' Removes the messages of a destination. '''
+        for sequence in list(self.__destinations.get(destination, ())):
+            self.__remove(destination, sequence)
+
+    def __remove(self, destination, sequence):
+        messages = self.__destinations[destination]
+        del messages[sequence]
+        if not messages:
+            del self.__destinations[destination]
+        self.__size -= self.__order.pop( (destination, sequence) )
+
+    def size(self):
+        ''' Returns the number of bytes stored. '''
+        return self.__size
+
+class IncompleteMessage(object):
+    ''' Fragments of a sequenced message received so far. '''
+
+    def __init__(self, now):
+        self.header    = None
+        self.flags     = None   # the flags of the last fragment
+        self.count     = None   # unknown until a fragment arrives
+        self.fragments = { }    # index -> content
+        self.started   = now
+        self.activity  = now
+
+    def missing(self):
+        ''' Returns the indexes of the missing fragments, empty if every fragment is missing. '''
+        if self.count is None:
+            return []
+        return [ idx for idx in xrange(self.count) if idx not in self.fragments ]
+
+class ReliableReceiver(object):
+    ''' Client side reassembly of the sequenced messages of a sender. Missing fragments
+        are requested with NACKs sent by "send_nack(content)" after "nack_delay"
+        seconds without progress, incomplete messages are given up after "ttl" seconds.
+        Sequence numbers wrap around, the ones less than half of their range
+        ahead of the next expected one are newer. '''
+
+    MASK     = 0xFFFFFFFF
+    MAX_GAP  = 1024     # at most this many lost messages are requested again
+    HISTORY  = 1024     # sequence numbers of the delivered messages remembered
+
+    def __init__(self, send_nack, nack_delay=0.05, ttl=5.0, first=0):
+        self.__send_nack  = send_nack
+        self.__nack_delay = nack_delay
+        self.__ttl        = ttl
+
+        self.__incomplete = { }     # sequence -> IncompleteMessage
+        self.__delivered  = set()   # sequence numbers of the recent complete messages
+        self.__next       = first   # the sequence number following the highest one seen
+        self.__tail_nack  = 0       # the time of the last NACK of the next message
+
+    @classmethod
+    def distance(cls, start, end):
+        ''' Returns how far the sequence number "end" is ahead of "start". '''
+        return (end - start) & cls.MASK
+
+    def receive(self, datagram, now=None):
+        ''' Processes a sequenced datagram, returns the header, the flags and the
+            content of the message it completed or None. '''
+        if now is None:
+            now = monotonic()
+
+        header, flags = ord(datagram[0]), ord(datagram[1])
+        sequence, index, count = SEQUENCE.unpack_from(datagram, 2)
+
+        ahead = self.distance(self.__next, sequence)
+        if ahead <= self.MASK // 2:
+            for offset in xrange(max(0, ahead - self.MAX_GAP), ahead): # lost entirely, request them at the next poll
+                message = self.__incomplete.setdefault((self.__next + offset) & self.MASK, IncompleteMessage(now))
+                message.activity = now - self.__nack_delay
+            self.__next = (sequence + 1) & self.MASK
+            self.__delivered = set(s for s in self.__delivered if self.distance(s, sequence) <= self.HISTORY)
+
+        if sequence in self.__delivered:
+            return None # retransmitted again
+
+        message = self.__incomplete.setdefault(sequence, IncompleteMessage(now))
+        message.header = header
+        message.count  = count
+        message.fragments[index] = datagram[2 + SEQUENCE.size:]
+        message.activity = now
+        if index == count - 1:
+            message.flags = flags
+
+        if len(message.fragments) < count:
+            return None
+
+        del self.__incomplete[sequence]
+        self.__delivered.add(sequence)
+        return header, message.flags, ''.join(message.fragments[idx] for idx in xrange(count))
+
+    def poll(self, now=None, awaiting=False):
+        ''' Sends the NACKs of the incomplete messages, and of the next message
+            if a response is "awaiting" (its every datagram may have been lost).
+            Returns the number of NACKs sent. '''
+        if now is None:
+            now = monotonic()
+
+        sent = 0
+        for sequence, message in self.__incomplete.items():
+            if message.started + self.__ttl <= now:
+                del self.__incomplete[sequence] # given up
+            elif message.activity + self.__nack_delay <= now:
+                self.__send_nack(encode_nack(sequence, message.missing()))
+                message.activity = now
+                sent += 1
+
+        if awaiting and not self.__incomplete and self.__tail_nack + self.__nack_delay <= now:
+            self.__send_nack(encode_nack(self.__next))
+            self.__tail_nack = now
+            sent += 1
+        return sent
+
+    def pending(self):
+        ''' Returns the number of incomplete messages. '''
+        return len(self.__incomplete)
@@ -0,0 +1,350 @@
+'''
+Created on Oct 19, 2026
+
+Schema definition of the objects transferred between the server
+and its clients. The same definitions drive the text based (v1)
+and the compact binary (v2) wire encodings.
+
+@author: Viktor Adam
+'''
+
+import struct
+
+def pack_varint(value, out):
+    ''' Appends an unsigned integer to the "out" list using 7 bits per byte. '''
+    while value >= 0x80:
+        out.append(chr((value & 0x7F) | 0x80))
+        value >>= 7
+    out.append(chr(value))
+
+def unpack_varint(data, offset):
+    ''' Reads an unsigned integer written by pack_varint, returns it with the next offset. '''
+    value, shift = 0, 0
+    while True:
+        byte = ord(data[offset])
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+class Field(object):
+    ''' Base class of record fields. The value of the field is read
+        from the attribute (or dict item) with the same name as the field
+        unless a custom getter is given. '''
+
+    def __init__(self, name, getter=None):
+        self.name   = name
+        self.getter = getter
+
+    def value_of(self, obj):
+        ''' Returns the value of this field from the given object. '''
+        if isinstance(obj, dict):
+            return obj[self.name]
+        elif self.getter:
+            return self.getter(obj)
+        else:
+            return getattr(obj, self.name)
+
+    def to_text(self, value):
+        ''' Returns the text representation of the value. '''
+        return str(value)
+
+    def from_text(self, text):
+        ''' Parses the value from its text representation. '''
+        return text
+
+    def pack(self, value, out):
+        ''' Appends the binary representation of the value to the "out" list. '''
+        raise NotImplementedError()
+
+    def unpack(self, data, offset):
+        ''' Reads the value from the binary data, returns the value and the next offset. '''
+        raise NotImplementedError()
+
+class IntField(Field):
+    ''' Non-negative integer field (binary: variable length). '''
+
+    def from_text(self, text):
+        return int(text)
+
+    def pack(self, value, out):
+        pack_varint(value, out)
+
+    def unpack(self, data, offset):
+        return unpack_varint(data, offset)
+
+class FloatField(Field):
+    ''' Floating point field (binary: double). '''
+
+    __struct = struct.Struct('!d')
+
+    def from_text(self, text):
+        return float(text)
+
+    def pack(self, value, out):
+        out.append(FloatField.__struct.pack(value))
+
+    def unpack(self, data, offset):
+        return FloatField.__struct.unpack_from(data, offset)[0], offset + FloatField.__struct.size
+
+class StringField(Field):
+    ''' String field (binary: variable length size and UTF-8 content). '''
+
+    def _encode(self, value):
+        ''' Returns the UTF-8 bytes of the value. '''
+        if isinstance(value, unicode):
+            return value.encode('utf-8')
+        else:
+            return str(value)
+
+    def pack(self, value, out):
+        value = self._encode(value)
+        pack_varint(len(value), out)
+        out.append(value)
+
+    def unpack(self, data, offset):
+        length, offset = unpack_varint(data, offset)
+        return data[offset:offset + length].decode('utf-8'), offset + length
+
+class OptionalField(StringField):
+    ''' Optional string field. The text representation of a missing
+        (or false) value is empty, in binary form the size is stored
+        increased by one and zero marks a missing value. False values
+        (like a zero state value) are missing in both forms, as in the
+        serialized form of the entities sent to v1 clients. '''
+
+    def to_text(self, value):
+        return str(value) if value else ''
+
+    def from_text(self, text):
+        return text if text else None
+
+    def pack(self, value, out):
+        if not value:
+            out.append(chr(0))
+        else:
+            value = self._encode(value)
+            pack_varint(len(value) + 1, out)
+            out.append(value)
+
+    def unpack(self, data, offset):
+        length, offset = unpack_varint(data, offset)
+        if length == 0:
+            return None, offset
+        length -= 1
+        return data[offset:offset + length].decode('utf-8'), offset + length
+
+class ListField(Field):
+    ''' Field containing a list of records. Only the last field of a record can be a list. '''
+
+    def __init__(self, name, list_schema, getter=None):
+        Field.__init__(self, name, getter)
+        self.list_schema = list_schema
+
+    def to_text(self, value):
+        return self.list_schema.encode_text(value)
+
+    def from_text(self, text):
+        return self.list_schema.decode_text(text)
+
+    def pack(self, value, out):
+        self.list_schema.pack(value, out)
+
+    def unpack(self, data, offset):
+        return self.list_schema.unpack(data, offset)
+
+class Record(object):
+    ''' Schema of a record built from fields. In text form the fields
+        are separated by the "separators" (a single string for every gap
+        or a tuple containing the separator for each gap).
+        Decoded records are returned as dictionaries. '''
+
+    def __init__(self, name, fields, separators=';'):
+        self.name       = name
+        self.fields     = fields
+        if isinstance(separators, tuple):
+            self.separators = separators
+        else:
+            self.separators = (separators, ) * (len(fields) - 1)
+
+    def encode_text(self, obj):
+        ''' Returns the text representation of the object. '''
+        parts = []
+        for idx, field in enumerate(self.fields):
+            if idx > 0:
+                parts.append(self.separators[idx - 1])
+            parts.append(field.to_text(field.value_of(obj)))
+        return ''.join(parts)
+
+    def values(self, obj):
+        ''' Returns the field values of the object as a dictionary. '''
+        return dict((field.name, field.value_of(obj)) for field in self.fields)
+
+    def decode_text(self, text):
+        ''' Parses a record from its text representation. '''
+        result = { }
+        rest = text
+        for idx, field in enumerate(self.fields):
+            if idx < len(self.separators):
+                value, _, rest = rest.partition(self.separators[idx])
+            else:
+                value = rest
+            result[field.name] = field.from_text(value)
+        return result
+
+    def pack(self, obj, out):
+        ''' Appends the binary representation of the object to the "out" list. '''
+        for field in self.fields:
+            field.pack(field.value_of(obj), out)
+
+    def unpack(self, data, offset):
+        ''' Reads a record from the binary data, returns it with the next offset. '''
+        result = { }
+        for field in self.fields:
+            result[field.name], offset = field.unpack(data, offset)
+        return result, offset
+
+class ListOf(object):
+    ''' Schema of a list of records. In text form the list is enclosed
+        in "opening" and "closing", items are prefixed with "item_prefix"
+        and separated by "separator". In binary form the items are
+        preceded by their number. '''
+
+    def __init__(self, record, opening='[', item_prefix='', separator=',', closing=']'):
+        self.record      = record
+        self.opening     = opening
+        self.item_prefix = item_prefix
+        self.separator   = separator
+        self.closing     = closing
+
+    def join_text(self, encoded_items):
+        ''' Joins the text representations of the items. '''
+        return self.opening + self.separator.join(self.item_prefix + i for i in encoded_items) + self.closing
+
+    def join_binary(self, encoded_items):
+        ''' Joins the binary representations of the items. '''
+        out = []
+        pack_varint(len(encoded_items), out)
+        out.extend(encoded_items)
+        return ''.join(out)
+
+    def encode_text(self, items):
+        ''' Returns the text representation of the items. '''
+        return self.join_text([ self.record.encode_text(i) for i in items ])
+
+    def decode_text(self, text):
+        ''' Parses the items from their text representation. '''
+        if self.opening and text.startswith(self.opening):
+            text = text[len(self.opening):]
+        if self.closing and text.endswith(self.closing):
+            text = text[:-len(self.closing)]
+
+        if self.separator:
+            parts = self.__split_outside_lists(text) if text else []
+        else:
+            parts = text.split(self.item_prefix)[1:]
+
+        items = []
+        for part in parts:
+            if self.separator and self.item_prefix:
+                part = part[len(self.item_prefix):]
+            items.append(self.record.decode_text(part))
+        return items
+
+    def __split_outside_lists(self, text):
+        ''' Splits the text at the separators which are not part of a nested list. '''
+        parts, depth, start = [], 0, 0
+        for idx, ch in enumerate(text):
+            if ch == '[':
+                depth += 1
+            elif ch == ']':
+                depth -= 1
+            elif depth == 0 and text.startswith(self.separator, idx):
+                parts.append(text[start:idx])
+                start = idx + len(self.separator)
+        parts.append(text[start:])
+        return parts
+
+    def pack(self, items, out):
+        ''' Appends the binary representation of the items to the "out" list. '''
+        items = list(items)
+        pack_varint(len(items), out)
+        for item in items:
+            self.record.pack(item, out)
+
+    def unpack(self, data, offset):
+        ''' Reads the items from the binary data, returns them with the next offset. '''
+        count, offset = unpack_varint(data, offset)
+        items = []
+        for x in xrange(count):  # @UnusedVariable
+            item, offset = self.record.unpack(data, offset)
+            items.append(item)
+        return items, offset
+
+class TextCodec(object):
+    ''' The original, text based (v1) wire encoding. '''
+
+    name = 'v1'
+
+    def encode(self, schema, obj):
+        ''' Encodes the object (or list of objects) with the given schema. '''
+        return schema.encode_text(obj)
+
+    def decode(self, schema, data):
+        ''' Decodes the data with the given schema. '''
+        return schema.decode_text(str(data))
+
+    def join(self, list_schema, encoded_items):
+        ''' Joins already encoded items into a list. '''
+        return list_schema.join_text(encoded_items)
+
+class BinaryCodec(object):
+    ''' The compact, struct packed binary (v2) wire encoding. '''
+
+    name = 'v2'
+
+    def encode(self, schema, obj):
+        ''' Encodes the object (or list of objects) with the given schema. '''
+        out = []
+        schema.pack(obj, out)
+        return ''.join(out)
+
+    def decode(self, schema, data):
+        ''' Decodes the data with the given schema. '''
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return schema.unpack(str(data), 0)[0]
+
+    def join(self, list_schema, encoded_items):
+        ''' Joins already encoded items into a list. '''
+        return list_schema.join_binary(encoded_items)
+
+TEXT   = TextCodec()
+BINARY = BinaryCodec()
+
+# Record definitions
+
+COMMAND         = Record('command', [ IntField('id'), StringField('name'), OptionalField('parameter_type') ])
+
+ENTITY_TYPE     = Record('entity type', [ IntField('type_id'), StringField('type_name'),
+                                          OptionalField('color'), OptionalField('image'),
+                                          ListField('commands', ListOf(COMMAND)) ])
+
+ENTITY          = Record('entity', [ StringField('unique_id'),
+                                     IntField('type_id', lambda e: e.entity_type.type_id),
+                                     StringField('name'),
+                                     IntField('state_id', lambda e: e.state.id),
+                                     StringField('state_name', lambda e: e.state.name),
+                                     OptionalField('state_value'),
+                                     FloatField('last_checkin') ])
+
+HISTORY         = Record('history', [ FloatField('timestamp'), StringField('entity_id'), StringField('entity_name'),
+                                      StringField('action'), StringField('action_type') ])
+
+COMMAND_REQUEST = Record('command request', [ StringField('entity_id'), IntField('command_id'), OptionalField('parameter') ],
+                         separators=('#', ';'))
+
+TYPE_LIST       = ListOf(ENTITY_TYPE)
+ENTITY_LIST     = ListOf(ENTITY)
+HISTORY_LIST    = ListOf(HISTORY, opening='', item_prefix='#', separator='', closing='')
@@ -0,0 +1,145 @@
+'''
+Created on Oct 19, 2026
+
+Thread-safe table of the sessions of connectionless (UDP) clients
+with idle expiry and lookup by session identifier.
+
+@author: Viktor Adam
+'''
+
+import threading
+
+from modules.comm.connections import TimerWheel, PeriodicExpiry
+from util.clock import monotonic
+
+class SessionTable(object):
+    ''' Maps client addresses to their session identifiers and back.
+        Addresses without a valid message for "idle_timeout" seconds
+        are removed by the sweeper and handed to its callback.
+        A client changing its address can be rebound to its session. '''
+
+    def __init__(self, idle_timeout=120.0, tick=1.0):
+        self.__idle_timeout = idle_timeout
+
+        self.__lock      = threading.Lock()
+        self.__addresses = { }   # address -> [ session identifier, last activity ]
+        self.__by_id     = { }   # session identifier -> set of addresses
+        self.__wheel     = TimerWheel(tick)
+        self.__sweeper   = PeriodicExpiry(self.expire, tick, 'Session expired:', 'session sweeper')
+
+        self.expired     = 0     # addresses removed for inactivity
+        self.rebound     = 0     # addresses moved to a session from another address
+
+    def add(self, address, session_id):
+        ''' Registers the session of an address, replacing its previous one. '''
+        with self.__lock:
+            self.__remove(address)
+
+            now = monotonic()
+            self.__addresses[address] = [ session_id, now ]
+            self.__by_id.setdefault(session_id, set()).add(address)
+            if self.__idle_timeout:
+                self.__wheel.schedule(address, now + self.__idle_timeout)
+
+    def remove(self, address):
+        ''' Removes the session of an address, returns its session identifier or None. '''
+        with self.__lock:
+            return self.__remove(address)
+
+    def __remove(self, address):
+        record = self.__addresses.pop(address, None)
+        if record is None:
+            return None
+
+        addresses = self.__by_id[record[0]]
+        addresses.discard(address)
+        if not addresses:
+            del self.__by_id[record[0]]
+        return record[0]
+
+    def touch(self, address, session_id):
+        ''' Registers a message of the session from the address. Returns True if the
+            session belongs to the address, False if the session is unknown. '''
+        with self.__lock:
+            record = self.__addresses.get(address)
+            if record is None or record[0] != session_id:
+                return False
+            record[1] = monotonic()
+            return True
+
+    def rebind(self, address, session_id):
+        ''' Moves a known session to a new address of its client.
+            Returns the previous addresses of the session, None if the session is unknown. '''
+        with self.__lock:
+            previous = self.__by_id.get(session_id)
+            if not previous:
+                return None
+
+            previous = list(previous)
+            for old in previous:
+                self.__remove(old)
+            self.__remove(address)
+
+            now = monotonic()
+            self.__addresses[address] = [ session_id, now ]
+            self.__by_id[session_id] = set([ address ])
+            if self.__idle_timeout:
+                self.__wheel.schedule(address, now + self.__idle_timeout)
+
+            self.rebound += 1
+            return previous
+
+    def session_of(self, address):
+        ''' Returns the session identifier of an address or None. '''
+        with self.__lock:
+            record = self.__addresses.get(address)
+            return record[0] if record is not None else None
+
+    def addresses(self):
+        ''' Returns the list of the addresses with a session. '''
+        with self.__lock:
+            return self.__addresses.keys()
+
+    def __contains__(self, address):
+        with self.__lock:
+            return address in self.__addresses
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__addresses)
+
+    def expire(self, now=None):
+        ''' Removes and returns the addresses idle for longer than the timeout. '''
+        if now is None:
+            now = monotonic()
+
+        expired = []
+        with self.__lock:
+            for address in self.__wheel.advance(now):
+                record = self.__addresses.get(address)
+                if record is None:
+                    continue # already removed
+
+                deadline = record[1] + self.__idle_timeout
+                if deadline <= now:
+                    self.__remove(address)
+                    expired.append(address)
+                else:
+                    self.__wheel.schedule(address, deadline)
+
+            self.expired += len(expired)
+        return expired
+
+    def start_sweeper(self, callback, name):
+        ''' Starts a thread passing the expired addresses to the callback. '''
+        if self.__idle_timeout:
+            self.__sweeper.start(callback, name)
+
+    def start_loop_sweeper(self, loop, callback):
+        ''' Passes the expired addresses to the callback from the timers of an event loop. '''
+        if self.__idle_timeout:
+            self.__sweeper.start_on_loop(loop, callback)
+
+    def stop_sweeper(self):
+        ''' Stops the sweeper thread or timer. '''
+        self.__sweeper.stop()
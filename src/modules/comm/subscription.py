@@ -0,0 +1,125 @@
+'''
+Created on Oct 19, 2026
+
+Classes to filter state change broadcasts
+by client subscriptions.
+
+@author: Viktor Adam
+'''
+
+import re
+import threading
+
+class Subscription(object):
+    ''' Class describing the entities a client is interested in.
+        An entity matches if its type, its identifier or its name
+        matches any of the given filters. '''
+
+    def __init__(self, type_ids=None, entity_ids=None, name_pattern=None):
+        self.type_ids     = frozenset(type_ids) if type_ids else frozenset()
+        self.entity_ids   = frozenset(entity_ids) if entity_ids else frozenset()
+        self.name_pattern = name_pattern
+        self.name_regex   = Subscription.compile_pattern(name_pattern) if name_pattern else None
+
+    @classmethod
+    def compile_pattern(cls, pattern):
+        ''' Compiles an SQL LIKE style pattern (% and _ wildcards)
+            into a case insensitive regular expression. '''
+        regex = ''
+        for ch in pattern:
+            if ch == '%':
+                regex += '.*'
+            elif ch == '_':
+                regex += '.'
+            else:
+                regex += re.escape(ch)
+        return re.compile('^' + regex + '$', re.IGNORECASE | re.DOTALL)
+
+    def __str__(self):
+        return 'types=' + str(sorted(self.type_ids)) + ' ids=' + str(sorted(self.entity_ids)) + ' name=' + str(self.name_pattern)
+
+class SubscriptionIndex(object):
+    ''' Thread-safe index of subscriptions keyed by their targets.
+        The set of subscribers is precomputed for each entity
+        and cached until the subscriptions or the entity's name change. '''
+
+    def __init__(self):
+        self.__lock          = threading.Lock()
+        self.__subscriptions = { }  # target -> Subscription
+        self.__by_type       = { }  # type id -> set of targets
+        self.__by_entity     = { }  # entity id -> set of targets
+        self.__by_pattern    = { }  # target -> compiled name pattern
+        self.__cache         = { }  # entity id -> (type id, name, frozenset of targets)
+
+    def subscribe(self, target, subscription):
+        ''' Registers (or replaces) the subscription of the target. '''
+        with self.__lock:
+            self.__remove(target)
+
+            self.__subscriptions[target] = subscription
+            for type_id in subscription.type_ids:
+                self.__by_type.setdefault(type_id, set()).add(target)
+            for entity_id in subscription.entity_ids:
+                self.__by_entity.setdefault(entity_id, set()).add(target)
+            if subscription.name_regex is not None:
+                self.__by_pattern[target] = subscription.name_regex
+
+            self.__cache.clear()
+
+    def unsubscribe(self, target):
+        ''' Removes the subscription of the target, so it receives every change again. '''
+        with self.__lock:
+            if self.__remove(target):
+                self.__cache.clear()
+
+    def __remove(self, target):
+        ''' Removes the target from the indexes, returns True if it was subscribed. '''
+        subscription = self.__subscriptions.pop(target, None)
+        if subscription is None:
+            return False
+
+        for type_id in subscription.type_ids:
+            self.__discard(self.__by_type, type_id, target)
+        for entity_id in subscription.entity_ids:
+            self.__discard(self.__by_entity, entity_id, target)
+        self.__by_pattern.pop(target, None)
+        return True
+
+    def __discard(self, index, key, target):
+        ''' Removes a target from an index set, dropping the set when it becomes empty. '''
+        targets = index.get(key)
+        if targets is not None:
+            targets.discard(target)
+            if not targets:
+                del index[key]
+
+    def subscription_of(self, target):
+        ''' Returns the subscription of the target or None. '''
+        return self.__subscriptions.get(target)
+
+    def is_filtered(self, target):
+        ''' Returns True, if the target has a registered subscription. '''
+        return target in self.__subscriptions
+
+    def has_subscriptions(self):
+        ''' Returns True, if there is at least one registered subscription. '''
+        return len(self.__subscriptions) > 0
+
+    def subscribers(self, unique_id, type_id, name):
+        ''' Returns the set of subscribed targets interested in the given entity. '''
+        with self.__lock:
+            cached = self.__cache.get(unique_id)
+            if cached is not None and cached[0] == type_id and cached[1] == name:
+                return cached[2]
+
+            targets = set()
+            targets.update(self.__by_type.get(type_id, ()))
+            targets.update(self.__by_entity.get(unique_id, ()))
+            if name is not None:
+                for target, regex in self.__by_pattern.iteritems():
+                    if regex.match(name):
+                        targets.add(target)
+
+            targets = frozenset(targets)
+            self.__cache[unique_id] = (type_id, name, targets)
+            return targets
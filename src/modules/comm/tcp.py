@@ -6,45 +6,129 @@ TCP/IP based communication handler implementation.
 @author: Viktor Adam
 '''
 
+import select
 import socket
+import struct
 import threading
 import traceback
 
-from modules.comm import CommunicationHandler
+from modules.comm import CommunicationHandler, Header
+from modules.comm.payload import Payload
+from modules.comm.framing import FrameDecoder, frame_prefix, SEND_CHUNK
+from modules.comm.outbound import OutboundQueue, SlowConsumerPolicy
+from modules.comm.connections import ConnectionRegistry
+from modules.comm.executor import HandlerExecutor
+
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', 15) # not defined by Python 2.7 on Linux
+
+class Extension(object):
+    ''' Helper class defining the flags of extended frames.
+        The content of a frame with the MSG_X_EXTENDED header starts
+        with these flags, the optional fields and the original header. '''
+    
+    COMPRESSED = 0x01 << 0
+    REQUEST_ID = 0x01 << 1  # followed by a 32 bit request identifier
+    
+    request_id = struct.Struct('!I')
+
+def build_frame(header, data, compression=False, request_id=None, extended_length=False):
+    ''' Returns the parts of a frame: header and length bytes and the content. 
+        Compressed messages and responses to identified requests 
+        are wrapped into extended frames. The content is not copied,
+        writers send it in chunks. '''
+    
+    data, compressed = Payload.wrap(data).content(compression)
+    
+    flags, fields = 0, ''
+    if compressed:
+        flags |= Extension.COMPRESSED
+    if request_id is not None:
+        flags |= Extension.REQUEST_ID
+        fields = Extension.request_id.pack(request_id)
+    if flags:
+        fields = chr(flags) + fields + chr(header)
+        header = Header.MSG_X_EXTENDED
+    
+    prefix = frame_prefix(header, len(fields) + len(data), extended_length)
+    
+    return [ prefix + fields, data ]
+
+def unwrap_extended(data):
+    ''' Returns the original header, content and request identifier of an extended frame. '''
+    flags, offset = ord(data[0]), 1
+    
+    request_id = None
+    if flags & Extension.REQUEST_ID:
+        request_id = Extension.request_id.unpack_from(data, offset)[0]
+        offset += Extension.request_id.size
+    
+    header, data = ord(data[offset]), data[offset + 1:]
+    if flags & Extension.COMPRESSED:
+        data = Payload.decompress(data)
+    return header, data, request_id
 
 class SenderInfo(object):
     ''' Class containing information about a client connection. '''
     
-    def __init__(self, socket, address):
+    def __init__(self, socket, address, queue):
         self.socket     = socket
         self.address    = address
         self.session_id = None
         self.enabled    = True
+        self.queue      = queue # frames waiting to be sent
+        self.unsent     = [ ]   # the parts of the frame being sent, not sent yet
+        self.writing    = threading.Lock() # held by the thread sending the frames
+        self.decoder    = FrameDecoder()
+        self.in_flight  = 0     # messages submitted to the workers, not processed yet
+        self.progress   = threading.Condition() # notified when messages are processed or sent
     
     def __str__(self):
         return str(self.address)
 
 class TCPHandler(CommunicationHandler):
-    ''' Class for the TCP/IP based communication handler implementation. '''
+    ''' Class for the TCP/IP based communication handler implementation.
+        Messages are processed by "workers" threads, the messages of a connection
+        in their order of arrival (requests after a LOGIN see its result).
+        Every identified request is answered: with an empty message of
+        its header if the message handler sent no response to it.
+        Connections with "max_pending" messages in progress or responses not sent yet
+        are not read until they catch up. Frames are sent by the thread queueing them
+        while the socket accepts them without blocking, the receiver thread
+        of the connection sends the rest when the client reads again. '''
     
-    def __init__(self, host, port, handler, read_timeout=0.5, backlog=5):
+    def __init__(self, host, port, handler, read_timeout=0.5, backlog=5, workers=4,
+                 send_queue_limit=64, slow_consumer_policy=SlowConsumerPolicy.COALESCE,
+                 max_connections=256, max_per_address=16, idle_timeout=120.0, reuse_port=False,
+                 max_pending=256):
         CommunicationHandler.__init__(self, host, port, handler)
         
         self.__enabled = True
         
         self.__timeout      = read_timeout
         self.__backlog      = backlog 
-        self.__send_lock    = threading.RLock()
-        self.__connections  = []
+        self.__reuse_port   = reuse_port
+        self.__connections  = ConnectionRegistry(max_connections, max_per_address, idle_timeout)
+        
+        self.__queue_limit  = send_queue_limit
+        self.__policy       = SlowConsumerPolicy.parse(slow_consumer_policy)
+        self.__max_pending  = max_pending
+        
+        self.__executor     = HandlerExecutor(workers, 'TCP|Worker')
+        self.__context      = threading.local() # the request being processed by the thread
     
     def start(self):
         CommunicationHandler.start(self)
         self.__create_socket()
         self.__create_socket_acceptor().start()
+        self.__connections.start_reaper(self.__disconnect, 'TCP|Reaper')
+        self.__executor.start()
         
     def stop(self):
         self.__enabled = False
         self.__server_socket.close()
+        self.__connections.stop_reaper()
+        self.__executor.stop()
+        
         CommunicationHandler.stop(self)
         
     def __create_socket(self):
@@ -52,6 +136,9 @@ class TCPHandler(CommunicationHandler):
         self.__server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         
         self.__server_socket.settimeout( self.__timeout )
+        if self.__reuse_port:
+            # several processes listening on the same port, connections are distributed by the kernel
+            self.__server_socket.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
         self.__server_socket.bind( (self.host, self.port) )
         self.__server_socket.listen( self.__backlog )
         
@@ -64,11 +151,18 @@ class TCPHandler(CommunicationHandler):
         while self.__enabled:
             try:
                 (client_socket, client_address) = self.__server_socket.accept()
+                
+                sender = SenderInfo(client_socket, client_address, OutboundQueue(self.__queue_limit, self.__policy))
+                if not self.__connections.add(sender, client_address[0]):
+                    print 'Socket refused (connection limit reached) from', client_address
+                    client_socket.close()
+                    continue
+                
                 print 'Socket accepted from', client_address
                 
                 client_socket.settimeout(self.__timeout)
                 
-                self.__create_receiver(client_socket, client_address).start()
+                self.__create_receiver(sender).start()
             except socket.timeout:
                 pass # ok, wait for connections until enabled
     
@@ -76,91 +170,220 @@ class TCPHandler(CommunicationHandler):
         ''' Creates a thread for the accept loop of the server socket. '''
         return threading.Thread(target=self.__listen, name='TCP|Listen')
     
-    def __do_receive(self, sock, cli_address):
+    def __do_receive(self, sender):
         ''' Waits incoming data on TCP socket and dispatches it. '''
-        sender = SenderInfo(sock, cli_address)
-        self.__connections.append(sender)
+        sock, cli_address = sender.socket, sender.address
         
         while self.__enabled and sender.enabled:
             try:
-                head   = sock.recv(1)
-                if not head:
-                    print 'TCP socket closed:', cli_address
-                    break
+                if sender.unsent or len(sender.queue):
+                    self.__flush(sender, True) # the frames the other threads could not send
                 
-                header = ord( head )
+                if not self.__wait_for_room(sender):
+                    continue
                 
-                length = sock.recv(2)
-                if len(length) != 2:
+                if not sender.decoder.receive(sock):
                     print 'TCP socket closed:', cli_address
                     break
-                    
-                lhi, llo = ord(length[0]), ord(length[1])
-                length = ( lhi << 8 ) | llo # lhi * 256 + llo
                 
-                data   = ''
+                self.__connections.touch(sender) # any message (e.g. keepalive) resets the idle timer
                 
-                if self.__enabled and length > 0:                
-                    data = sock.recv(length) # TODO: does this return 'length' bytes?
-                    
-                if self.__enabled:
-                    self.handler(self, sender, header, data)
+                for header, data in sender.decoder.frames():
+                    if self.__enabled:
+                        with sender.progress:
+                            sender.in_flight += 1
+                        self.__executor.submit(sender, self.__handle, sender, header, data)
                     
             except socket.timeout:
                 pass # no data received in timeout interval, but it is normal
+            except socket.error as ex:
+                if sender.enabled:
+                    print 'TCP socket error:', cli_address, ex
+                break
+            except ValueError as ex:
+                print 'TCP protocol error:', cli_address, ex
+                break
             except Exception as ex:
                 print 'Exception received on TCP receiver thread [', cli_address, ']:', ex
                 traceback.print_exc()
         
         # main loop exited
+        sender.enabled = False
+        sender.queue.close()
         sock.close()
         
         self.__connections.remove(sender)
+        self.release(sender)
+    
+    def __wait_for_room(self, sender):
+        ''' Waits while the connection has too many messages in progress or responses
+            not sent yet. Returns False if they did not catch up in the read timeout. '''
+        with sender.progress:
+            if sender.in_flight + len(sender.queue) >= self.__max_pending:
+                sender.progress.wait(self.__timeout)
+            return sender.in_flight + len(sender.queue) < self.__max_pending
+    
+    def __handled(self, sender):
+        ''' Registers the completion of a message processed by the workers. '''
+        with sender.progress:
+            sender.in_flight -= 1
+            sender.progress.notify()
+    
+    def __handle(self, sender, header, data):
+        ''' Calls the message handler in the context of the request on a worker thread. '''
+        if not sender.enabled:
+            self.__handled(sender)
+            return
+        
+        request_id = None
+        try:
+            if header == Header.MSG_X_EXTENDED:
+                header, data, request_id = unwrap_extended(data)
+            
+            self.__context.sender     = sender
+            self.__context.request_id = request_id
+            self.__context.answered   = False
+            self.handler(self, sender, header, data)
+        except Exception as ex:
+            print 'Exception received on TCP worker thread [', sender, ']:', ex
+            traceback.print_exc()
+            if request_id is not None:
+                self.send(Header.MSG_A_ERROR, str(ex), sender)
+        finally:
+            try:
+                if request_id is not None and not self.__context.answered:
+                    self.send(header, None, sender) # acknowledges the request without response
+            finally:
+                self.__context.sender     = None
+                self.__context.request_id = None
+                self.__handled(sender)
     
-    def __create_receiver(self, socket, address):
+    def __create_receiver(self, sender):
         ''' Creates a thread to handle the client connection. '''
-        return threading.Thread(target=self.__do_receive, name='TCP|Receiver|' + str(address), args=(socket, address))
+        return threading.Thread(target=self.__do_receive, name='TCP|Receiver|' + str(sender.address), args=(sender, ))
     
     def send(self, header, data, sender):
-        ''' Send a message to the given destination. '''
+        ''' Send a message to the given destination. 
+            Responses to identified requests carry the request identifier. '''
         
-        self.__send_lock.acquire()
+        request_id = None
+        if getattr(self.__context, 'sender', None) is sender:
+            request_id = self.__context.request_id
+            self.__context.answered = True
+        
+        self.__send(header, data, sender, request_id)
+    
+    def push(self, header, data, sender, key=None):
+        ''' Sends an unsolicited message to the given destination. 
+            Pushed messages are subject to the slow consumer policy. '''
+        self.__send(header, data, sender, None, True, key)
+    
+    def __send(self, header, data, sender, request_id, push=False, key=None):
+        ''' Queues a message to the given destination with an extended frame if needed.
+            A response too long for the client is replaced with an error. '''
+        
+        options = self.options_of(sender)
         try:
-            if data is None:
-                data = ''
-                
-            data = data.encode('ascii', 'ignore')
-            length = len(data)
-            
-            lhi, llo = (length & 0xFF00) >> 8, length & 0x00FF
+            frame = build_frame(header, data, options.compression(), request_id, options.extended_length())
+        except ValueError as ex:
+            # 64 KiB or more content for a client without extended length frames
+            print 'TCP message not sent to', sender, ':', ex
+            if push:
+                return # dropped, there is no request to answer
+            frame = build_frame(Header.MSG_A_ERROR, str(ex), False, request_id)
+        
+        if not sender.queue.put(frame, push, key):
+            print 'TCP client is not reading its messages, disconnecting:', sender
+            self.__disconnect(sender)
+        else:
+            self.__flush(sender)
+    
+    def __flush(self, sender, wait=False):
+        ''' Sends the queued frames of a client connection on the calling thread.
+            Without "wait" it stops when the socket would block, with "wait"
+            (on the receiver thread) when the read timeout expires. '''
+        while sender.enabled and (sender.unsent or len(sender.queue)):
+            if not sender.writing.acquire(False):
+                return # another thread is sending, it checks the queue again after releasing
             
-            message = [ chr(header), chr(lhi), chr(llo) ]
-            if len(data) > 0:
-                message.extend(data)
+            try:
+                while sender.enabled:
+                    if not sender.unsent:
+                        frame = sender.queue.pop()
+                        if frame is None:
+                            break
+                        sender.unsent = [ memoryview(part) for part in frame ]
+                    
+                    if not self.__send_unsent(sender, wait):
+                        return # the client is slow, continued by the receiver thread
+                    
+                    with sender.progress:
+                        sender.progress.notify()
+            except Exception as ex:
+                if sender.enabled:
+                    print 'Exception received while sending to TCP client [', sender, ']:', ex
+                self.__disconnect(sender)
+                return
+            finally:
+                sender.writing.release()
+    
+    @staticmethod
+    def __send_unsent(sender, wait):
+        ''' Sends the rest of the current frame, returns False if it would block. '''
+        sock = sender.socket
+        while sender.unsent:
+            view = sender.unsent[0]
+            if not view:
+                sender.unsent.pop(0)
+                continue
             
-            sender.socket.sendall(''.join(message))
-        finally:
-            self.__send_lock.release()
+            if not wait:
+                poller = select.poll()
+                poller.register(sock, select.POLLOUT)
+                if not poller.poll(0):
+                    return False
             
+            try:
+                sender.unsent[0] = view[sock.send(view[:SEND_CHUNK]):]
+            except socket.timeout:
+                return False
+        return True
+    
+    def __disconnect(self, sender):
+        ''' Stops the processing of a client connection, the receiver thread closes it. '''
+        sender.enabled = False
+        sender.queue.close()
+        try:
+            sender.socket.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass # already closed
+    
+    def set_options(self, sender, options):
+        ''' Stores the protocol options negotiated by the sender. '''
+        CommunicationHandler.set_options(self, sender, options)
+        sender.decoder.extended_length = options.extended_length()
+    
     def broadcast(self, header, message):
         ''' Sends a message on all registered client connections. '''
         
-        self.__send_lock.acquire()
-        try:
-            for target in self.__connections:
-                self.send(header, message, target)
-        finally:
-            self.__send_lock.release()
+        message = Payload.wrap(message) # compressed only once for every target
+        
+        for target in self.broadcast_targets():
+            self.push(header, message, target)
             
+    def broadcast_targets(self):
+        ''' Returns the list of registered client connections. '''
+        return self.__connections.snapshot()
+    
     def authentication_succeeded(self, session_id, sender):
         ''' Sets the session identifier of a client connection. '''
         sender.session_id = session_id
     
     def authentication_failed(self, sender):
         ''' Closes the client connection which authentication failed. '''
-        sender.enabled = False
-        sender.socket.close()
+        self.__disconnect(sender)
     
     def is_valid_session(self, message, sender):
-        return True # if the session is not valid than it was closed before
+        ''' Returns True, if the session of the client connection is still valid. '''
+        return self.validate_session(sender.session_id)
     
\ No newline at end of file
@@ -2,28 +2,99 @@
 Created on Dec 4, 2013
 
 UDP based communication handler implementation.
+Datagrams are received on a thread of the handler or on a shared
+event loop, the message handler can run on an executor.
 
 @author: Viktor Adam
 '''
 
+import errno
+import hashlib
+import hmac
+import itertools
+import os
+import select
 import socket
+import struct
 import threading
 import traceback
 
-from modules.comm import CommunicationHandler, Header
+from modules.comm import CommunicationHandler, Header, StateUpdate, schema
+from modules.comm.evloop import EventLoop
+from modules.comm.payload import Payload
+from modules.comm.reassembly import ReassemblyBuffer
+from modules.comm.reliable import RetransmitWindow, SEQUENCE, decode_nack
+from modules.comm.sessions import SessionTable
 
 class Flags(object):
     ''' Helper class defining message flags. '''
      
     MORE_FOLLOWS = 0x01 << 0
+    COMPRESSED   = 0x01 << 1
+    GROUP        = 0x01 << 2    # sent to the group address, authenticated with the group key
+    BINARY       = 0x01 << 3    # group message encoded with the binary codec
+    SEQUENCED    = 0x01 << 4    # message sequence number, fragment index and count follow the flags
+
+class GroupSigner(object):
+    ''' Authenticates the datagrams sent to the group address. Signed datagrams
+        carry a nonce (increasing counter) and a truncated HMAC-SHA256 of the
+        header, the flags, the nonce and the content after the flags:
+        header (1) | flags (1) | nonce (8) | MAC (16) | content
+        Every group client receives the same key at login, so the MAC only proves
+        that the sender is a member of the group: it keeps out the parties that never
+        logged in, but any logged-in client can forge datagrams to the others. '''
+    
+    NONCE_SIZE = 8
+    MAC_SIZE   = 16
+    OVERHEAD   = NONCE_SIZE + MAC_SIZE
+    
+    __nonce = struct.Struct('!Q')
+    
+    def __init__(self, key=None):
+        self.key      = key if key is not None else os.urandom(16)
+        self.__nonces = itertools.count(1)
+    
+    def sign(self, datagram):
+        ''' Fills the nonce and the MAC of a datagram (bytearray) with room for them. '''
+        GroupSigner.__nonce.pack_into(datagram, 2, self.__nonces.next())
+        datagram[2 + GroupSigner.NONCE_SIZE:2 + GroupSigner.OVERHEAD] = self.__mac(datagram)
+    
+    def verify(self, datagram):
+        ''' Returns the nonce and the content of a signed datagram or None if it is not authentic. '''
+        datagram = bytearray(datagram)
+        if len(datagram) < 2 + GroupSigner.OVERHEAD:
+            return None
+        if not hmac.compare_digest(str(datagram[2 + GroupSigner.NONCE_SIZE:2 + GroupSigner.OVERHEAD]), self.__mac(datagram)):
+            return None
+        return GroupSigner.__nonce.unpack_from(datagram, 2)[0], str(datagram[2 + GroupSigner.OVERHEAD:])
+    
+    def __mac(self, datagram):
+        mac = hmac.new(self.key, digestmod=hashlib.sha256)
+        mac.update(buffer(datagram, 0, 2 + GroupSigner.NONCE_SIZE))
+        mac.update(buffer(datagram, 2 + GroupSigner.OVERHEAD))
+        return mac.digest()[:GroupSigner.MAC_SIZE]
 
 class UDPHandler(CommunicationHandler):
-    ''' Class for the UDP based communication handler implementation. '''
+    ''' Class for the UDP based communication handler implementation.
+        If a "loop" is given the socket is watched by it instead of a receiver thread,
+        if an "executor" is given the messages are processed on it.
+        With "group_send" the state changes are sent once to the multicast or broadcast
+        address for the clients that negotiated it, instead of to each of them.
+        Messages to the clients that negotiated reliable delivery are sequenced and the
+        last "retransmit_window" of them are kept to retransmit the fragments they request.
+        Sessions without valid messages for "session_timeout" seconds expire. '''
+    
+    # maximum number of datagrams read at one wakeup of the receiver
+    RECEIVE_BATCH = 64
     
     def __init__(self, host, port, handler=None, \
                  multicast=False, broadcast=False, \
                  ttl=8, loopback=False, reuse_address=True, \
-                 read_timeout=0.5, buffer_size=1500):
+                 read_timeout=0.5, buffer_size=1500, \
+                 loop=None, executor=None, \
+                 max_incomplete_bytes=1048576, max_incomplete_per_sender=262144, incomplete_ttl=10.0, \
+                 group_send=False, retransmit_window=32, retransmit_bytes=1048576, \
+                 session_timeout=120.0, receive_buffer=None):
         
         CommunicationHandler.__init__(self, host, port, handler)
         
@@ -34,25 +105,59 @@ class UDPHandler(CommunicationHandler):
         self.__reuse_address = 1 if reuse_address else 0
         self.__timeout       = read_timeout
         self.__buffer_size   = buffer_size
+        self.__receive_size  = receive_buffer
         self.__send_lock     = threading.RLock()
         
+        # every datagram is received into the same buffer, only its content is copied
+        self.__buffer        = bytearray(buffer_size)
+        self.__view          = memoryview(self.__buffer)
+        
         self.__is_multicast  = multicast
         self.__is_broadcast  = broadcast
         
-        self.__sessions      = { }
+        self.__loop          = loop
+        self.__executor      = executor
+        
+        self.__group_signer  = GroupSigner() if group_send and (multicast or broadcast) else None
+        self.__group_source  = None # the source address of the datagrams sent to the group address
         
-        self.__incomplete_messages  = { }
+        self.retransmit      = RetransmitWindow(retransmit_window, retransmit_bytes)
+        self.__sequences     = { }  # destination -> the sequence number of the next message
+        
+        self.sessions        = SessionTable(session_timeout)
+        
+        # incomplete messages received in several datagrams
+        self.reassembly      = ReassemblyBuffer(max_incomplete_bytes, max_incomplete_per_sender, incomplete_ttl)
         
     def start(self):
         CommunicationHandler.start(self)
         self.__create_socket()
-        self.__receiver = self.__create_receiver()
-        self.__receiver.start()
+        if self.__loop is not None:
+            self.__loop.register(self.__udp_socket.fileno(), EventLoop.READ, self.__on_readable)
+            self.sessions.start_loop_sweeper(self.__loop, self.__session_expired)
+        else:
+            self.__receiver = self.__create_receiver()
+            self.__receiver.start()
+            self.sessions.start_sweeper(self.__session_expired, 'UDP|Sweeper')
     
     def stop(self):
         self.__enabled = False
-        self.__udp_socket.close()
+        self.sessions.stop_sweeper()
+        if self.__loop is not None:
+            stopped = threading.Event()
+            self.__loop.call_soon_threadsafe(self.__detach, stopped)
+            stopped.wait()
+        else:
+            self.__udp_socket.close()
         CommunicationHandler.stop(self)
+    
+    def __detach(self, stopped):
+        ''' Removes the socket from the event loop and closes it. '''
+        try:
+            self.__loop.unregister(self.__udp_socket.fileno())
+            self.__udp_socket.close()
+        finally:
+            stopped.set()
      
     def __create_socket(self):
         ''' Creates, configures and binds the UDP socket. '''
@@ -65,7 +170,9 @@ class UDPHandler(CommunicationHandler):
         
         self.__udp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL,  self.__ttl)
         self.__udp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, self.__loopback)
-        self.__udp_socket.settimeout(self.__timeout)
+        if self.__receive_size:
+            self.__udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.__receive_size)
+        self.__udp_socket.setblocking(0) # the receiver waits for readability and drains the socket
         self.__udp_socket.bind(('0.0.0.0', self.port))
         
         if self.__is_multicast:
@@ -73,101 +180,275 @@ class UDPHandler(CommunicationHandler):
             mreq = struct.pack("4sl", socket.inet_aton(self.host), socket.INADDR_ANY)
             self.__udp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
         
-        bound_port = self.__udp_socket.getsockname()[1]
+        self.port = self.__udp_socket.getsockname()[1] # the port chosen by the system if 0 was given
         
-        print 'UDP socket bound on', str(self.host) + ':' + str(bound_port)
-    
-    def __merge_incomplete(self, header, data, sender, finish):
-        ''' Merges incomplete incoming messages. '''
+        if self.__group_signer is not None:
+            self.__group_source = (self.__route_source(), self.port)
         
-        if sender not in self.__incomplete_messages:
-            self.__incomplete_messages[sender] = { }
+        print 'UDP socket bound on', str(self.host) + ':' + str(self.port), \
+              '| receive buffer:', self.__udp_socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    
+    def __route_source(self):
+        ''' Returns the local address the datagrams to the group address are sent from. '''
+        probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            if self.__is_broadcast:
+                probe.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            probe.connect( (self.host, self.port) )
+            return probe.getsockname()[0]
+        finally:
+            probe.close()
+    
+    def kernel_drops(self):
+        ''' Returns the number of datagrams the kernel dropped for the socket
+            (full receive buffer), None if it is not available (Linux only). '''
+        try:
+            inode = str(os.fstat(self.__udp_socket.fileno()).st_ino)
+            with open('/proc/net/udp') as stats:
+                for line in stats.readlines()[1:]:
+                    fields = line.split()
+                    if len(fields) > 12 and fields[9] == inode:
+                        return int(fields[12])
+        except (IOError, OSError, ValueError, socket.error):
+            pass
+        return None
+    
+    def __process(self, size, sender):
+        ''' Merges a datagram received into the buffer and dispatches the complete messages. '''
+        if self.__enabled and size >= 2:
+            header, flags, message = self.__buffer[0], self.__buffer[1], self.__view[2:size].tobytes()
+            if sender == self.__group_source and flags & Flags.GROUP:
+                return # sent by this handler to the group address
             
-        by_header = self.__incomplete_messages[sender]
-        
-        if header in by_header:
-            merged = by_header[header] + data
-            if finish:
-                del by_header[header]
-            else:
-                by_header[header] = merged
-            return merged
-        else:
-            if not finish:
-                by_header[header] = data
-            return data
+            finish = (flags & Flags.MORE_FOLLOWS) != Flags.MORE_FOLLOWS
+            merged = self.reassembly.add(sender, header, message, finish)
+            
+            if merged is not None:
+                if flags & Flags.COMPRESSED:
+                    merged = Payload.decompress(merged)
+                
+                if header == Header.MSG_A_EXIT:
+                    self.sessions.remove(sender)
+                    self.reassembly.discard(sender)
+                    self.release(sender)
+                elif header == Header.MSG_A_NACK:
+                    # retransmits only for a valid session, spoofed senders could amplify traffic
+                    if self.is_valid_session(merged, sender):
+                        self.__retransmit(sender, self.strip_session_prefix(merged))
+                elif self.__executor is not None:
+                    self.__executor.submit(sender, self.__handle, sender, header, merged)
+                else:
+                    self.handler(self, sender, header, merged)
+    
+    def __handle(self, sender, header, data):
+        ''' Calls the message handler on the executor. '''
+        try:
+            self.handler(self, sender, header, data)
+        except Exception as ex:
+            print 'Exception received on UDP message handler [', sender, ']:', ex
+            traceback.print_exc()
     
     def __do_receive(self):
         ''' Waits data on UDP socket and dispatches it. '''
         while self.__enabled:
             try:
-                data, sender = self.__udp_socket.recvfrom(self.__buffer_size)
-                if self.__enabled and len(data) >= 2:
-                    header, flags, message = ord(data[0]), ord(data[1]), data[2:]
-                    finish = (flags & Flags.MORE_FOLLOWS) != Flags.MORE_FOLLOWS
-                    merged = self.__merge_incomplete(header, message, sender, finish)
-                    
-                    if finish:
-                        if header == Header.MSG_A_EXIT:
-                            del self.__sessions[sender]
-                        else:
-                            self.handler(self, sender, header, merged)
-            except socket.timeout:
-                pass # no data received in timeout interval, but it is normal
+                readable = select.select([ self.__udp_socket ], [], [], self.__timeout)[0]
+                if readable:
+                    self.__drain()
             except Exception as ex:
-                print 'Exception received on UDP receiver thread:', ex
+                if self.__enabled: # the socket is closed when stopped
+                    print 'Exception received on UDP receiver thread:', ex
+                    traceback.print_exc()
+    
+    def __on_readable(self, events):
+        ''' Reads the waiting datagrams when the socket is watched by an event loop. '''
+        self.__drain()
+    
+    def __drain(self):
+        ''' Receives and processes the waiting datagrams, at most RECEIVE_BATCH of them. '''
+        for x in xrange(UDPHandler.RECEIVE_BATCH):  # @UnusedVariable
+            try:
+                size, sender = self.__udp_socket.recvfrom_into(self.__buffer)
+            except socket.error as ex:
+                if ex.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            
+            try:
+                self.__process(size, sender)
+            except Exception as ex:
+                print 'Exception received on UDP receiver:', ex
                 traceback.print_exc()
     
     def __create_receiver(self):
         ''' Creates a thread to handle incoming messages. '''
         return threading.Thread(target=self.__do_receive, name='UDP|Receiver')
     
+    def fragments(self, header, data, compression, flags=0, signer=None, sequence=None):
+        ''' Returns the datagrams of a message broken into several parts if needed.
+            The content is encoded once and every part is copied into its datagram once.
+            Datagrams to the group address are signed by the "signer",
+            datagrams of a "sequence" number carry it with their position. '''
+        
+        prefix = 2
+        if signer is not None:
+            prefix += GroupSigner.OVERHEAD
+        if sequence is not None:
+            prefix += SEQUENCE.size
+            flags  |= Flags.SEQUENCED
+        max_size = self.__buffer_size - prefix # BufferSize - (HeaderLength + FlagsLength [+ signature or sequence])
+        
+        data, compressed = Payload.wrap(data).content(compression)
+        if compressed:
+            flags |= Flags.COMPRESSED
+        
+        view  = memoryview(data)
+        parts = []
+        count = max(1, (len(data) + max_size - 1) // max_size)
+        
+        offset = 0
+        while True:
+            size = min(len(data) - offset, max_size)
+            last = offset + size >= len(data)
+            
+            part = bytearray(prefix + size)
+            part[0] = header
+            part[1] = flags if last else flags | Flags.MORE_FOLLOWS
+            part[prefix:] = view[offset:offset + size]
+            if signer is not None:
+                signer.sign(part)
+            if sequence is not None:
+                SEQUENCE.pack_into(part, 2, sequence, len(parts), count)
+            parts.append(part)
+            
+            offset += size
+            if last:
+                return parts
+    
+    def __send_fragments(self, parts, destination):
+        for part in parts:
+            while True:
+                try:
+                    self.__udp_socket.sendto(part, destination)
+                    break
+                except socket.error as ex:
+                    if ex.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        raise
+                    select.select([], [ self.__udp_socket ], [], self.__timeout) # the send buffer is full
+    
     def send(self, header, data, destination):
         ''' Sends a message to the given destination 
             breaking it into several parts if needed. '''
         
+        options = self.options_of(destination)
+        if not options.reliable():
+            parts = self.fragments(header, data, options.compression())
+        
         self.__send_lock.acquire()
         try:
-            flags    = 0
-            buf_size = self.__buffer_size
-            max_size = buf_size - 2 # BufferSize - (HeaderLength + FlagsLength)
-            
-            # if isinstance(header, (int, long)):
-            header = chr(header)
-            
-            if data is None:
-                data = ''
-                
-            data = data.encode('ascii', 'ignore')
-            data_len = len(data)
+            if options.reliable():
+                sequence = self.__sequences.get(destination, 0)
+                self.__sequences[destination] = (sequence + 1) & 0xFFFFFFFF
+                parts = self.fragments(header, data, options.compression(), sequence=sequence)
+                self.retransmit.store(destination, sequence, parts)
             
-            while len(data) > max_size: # send the splitted parts first
-                flags |= Flags.MORE_FOLLOWS
-                part = header + chr(flags) + data[0:max_size]
-                self.__udp_socket.sendto(part, destination)
-                data = data[max_size:]
-            
-            flags &= ~ Flags.MORE_FOLLOWS
-            
-            if data or data_len == 0: # send the rest of the message
-                part = header + chr(flags) + data
-                self.__udp_socket.sendto(part, destination)
+            self.__send_fragments(parts, destination)
+        finally:
+            self.__send_lock.release()
+    
+    def __retransmit(self, destination, nack):
+        ''' Sends the fragments requested by a NACK message again, if they are still kept. '''
+        sequence, missing = decode_nack(nack)
+        
+        self.__send_lock.acquire()
+        try:
+            self.__send_fragments(self.retransmit.get(destination, sequence, missing), destination)
         finally:
             self.__send_lock.release()
             
     def broadcast(self, header, message):
-        ''' Sends a message to all known client addresses. '''
+        ''' Sends a message to all known client addresses. The datagrams are
+            built once for the targets with and once for the ones without compression. '''
+        
+        message = Payload.wrap(message) # compressed only once for every target
+        encoded = { }                   # compression -> datagrams
         
         self.__send_lock.acquire()
         try:
-            for target in self.__sessions:
-                self.send(header, message, target)
+            for target in self.sessions.addresses():
+                if self.options_of(target).reliable():
+                    self.send(header, message, target) # sequenced for the target
+                    continue
+                
+                compression = self.options_of(target).compression()
+                if compression not in encoded:
+                    encoded[compression] = self.fragments(header, message, compression)
+                self.__send_fragments(encoded[compression], target)
+        finally:
+            self.__send_lock.release()
+    
+    def broadcast_states(self, updates, targets=None):
+        ''' Sends the state updates once to the group address for the clients
+            receiving every update there, and one by one to the other clients.
+            Given "targets" are sent to one by one: every group client would
+            receive a group datagram. '''
+        
+        if self.__group_signer is None or targets is not None:
+            return CommunicationHandler.broadcast_states(self, updates, targets)
+        
+        group, others = [], []
+        for target in self.broadcast_targets():
+            if self.options_of(target).group() and not self.subscriptions.is_filtered(target):
+                group.append(target)
+            else:
+                others.append(target)
+        
+        # one message for each codec, compressed if every client of the codec accepts it,
+        # with every update joined if every client of the codec accepts batches
+        compression, batch = { }, { }
+        for target in group:
+            options = self.options_of(target)
+            codec = options.codec()
+            compression[codec] = compression.get(codec, True) and options.compression()
+            batch[codec] = batch.get(codec, True) and options.batch()
+        
+        for codec, compressed in compression.iteritems():
+            flags = Flags.GROUP | (Flags.BINARY if codec is schema.BINARY else 0)
+            batches = [ updates ] if batch[codec] else [ [ u ] for u in updates ]
+            for selected in batches:
+                parts = self.fragments(Header.MSG_A_STATE_CHANGED, StateUpdate.join(selected, codec),
+                                       compressed, flags, self.__group_signer)
+                self.__send_lock.acquire()
+                try:
+                    self.__send_fragments(parts, (self.host, self.port))
+                finally:
+                    self.__send_lock.release()
+        
+        if others:
+            CommunicationHandler.broadcast_states(self, updates, others)
+    
+    def group_key(self):
+        ''' Returns the key of the messages sent to the group address. '''
+        return self.__group_signer.key.encode('hex') if self.__group_signer is not None else None
+    
+    def broadcast_targets(self):
+        ''' Returns the list of known client addresses. '''
+        return self.sessions.addresses()
+    
+    def release(self, sender):
+        ''' Releases every information stored for a client that has left. '''
+        CommunicationHandler.release(self, sender)
+        
+        self.__send_lock.acquire()
+        try:
+            self.retransmit.discard(sender)
+            self.__sequences.pop(sender, None)
         finally:
             self.__send_lock.release()
     
     def authentication_succeeded(self, session_id, sender):
         ''' Sets the session identifier for the sender. '''
-        self.__sessions[sender] = session_id
+        self.sessions.add(sender, session_id)
     
     def authentication_failed(self, sender):
         ''' Sends invalid session response to the sender. '''
@@ -175,8 +456,36 @@ class UDPHandler(CommunicationHandler):
     
     def is_valid_session(self, message, sender):
         ''' Returns True, if the sender is known and 
-            the message prefix equals the related session identifier. '''
-        return sender in self.__sessions and self.__sessions[sender] == message[0:32]
+            the message prefix equals the related session identifier
+            which is still valid. A client sending from a new address is rebound to its session. '''
+        session_id = message[0:32]
+        if not self.validate_session(session_id):
+            if self.sessions.session_of(sender) == session_id:
+                self.sessions.remove(sender)
+                self.release(sender) # expired or revoked in the session store
+            return False
+        
+        if self.sessions.touch(sender, session_id):
+            return True
+        
+        previous = self.sessions.rebind(sender, session_id)
+        if previous is None:
+            return False
+        
+        # move the state of the client to its new address
+        print 'UDP session rebound from', previous, 'to', sender
+        options = self.options_of(previous[0])
+        subscription = self.subscriptions.subscription_of(previous[0])
+        for address in previous:
+            self.release(address)
+        self.set_options(sender, options)
+        if subscription is not None:
+            self.subscribe(sender, subscription)
+        return True
+    
+    def __session_expired(self, sender):
+        ''' Releases the state of a client that has not sent valid messages for a while. '''
+        self.release(sender) # its incomplete messages expire in the reassembly buffer
     
     def strip_session_prefix(self, message):
         ''' Returns the received string message from its 32th position. '''
@@ -3,17 +3,24 @@ Created on Jul 7, 2013
 
 This module defines classes responsible for the RF communication
 on the Raspberry Pi with the nRF24L01 RF transceiver family.
+The transceiver is accessed through SPI and GPIO transports,
+it can be simulated together with virtual devices (see modules.rf).
 
 @author: Viktor Adam
 '''
 
-import RPi.GPIO as GPIO
-import spidev
-import time
+import errno
+import fcntl
+import os
+import select
 import threading
-from Queue import Queue
+from collections import deque, OrderedDict
+from Queue import Queue, Empty
 
 from util.module import ModuleBase
+from util import sysargs
+from util.clock import monotonic
+from modules.rf.transport import GpioTransport, SpiDevTransport, RPiGpioTransport
 
 class SpiCommand(object):
     ''' Class enumeration SPI command identifiers '''
@@ -188,6 +195,89 @@ class Bits(object):
     FifoStat_RX_FULL    = 1 << 1
     FifoStat_RX_EMPTY   = 1 << 0
 
+class AddressBook(object):
+    ''' Thread-safe bidirectional map between the unique identifiers of the RF devices
+        and their addresses, with a pool of the free addresses. When the pool is empty
+        the address of the device heard least recently is reclaimed, if it was silent
+        for "reclaim_after" seconds (never, if None). The times are read from the
+        monotonic clock, they are not persisted. '''
+    
+    def __init__(self, first=1, last=0xFE, reclaim_after=None):
+        self.__lock          = threading.Lock()
+        self.__addresses     = { }            # unique id -> address
+        self.__unique_ids    = { }            # address -> unique id
+        self.__heard         = OrderedDict()  # address -> time last heard, least recently heard first
+        self.__free          = deque(xrange(first, last + 1))
+        self.__reclaim_after = reclaim_after
+        
+        self.reclaimed       = 0              # addresses taken from silent devices
+    
+    def assign(self, unique_id, now=None):
+        ''' Returns the address of the device, assigning a free one if it has none.
+            Returns None, if there is no address to assign. '''
+        now = now if now is not None else monotonic()
+        with self.__lock:
+            address = self.__addresses.get(unique_id)
+            if address is None:
+                if not self.__free:
+                    self.__reclaim(now)
+                if not self.__free:
+                    return None
+                
+                address = self.__free.popleft()
+                self.__addresses[unique_id] = address
+                self.__unique_ids[address] = unique_id
+            
+            self.__touch(address, now)
+            return address
+    
+    def __reclaim(self, now):
+        ''' Releases the address of the device heard least recently if it is silent for long. '''
+        if self.__reclaim_after is None or not self.__heard:
+            return
+        
+        address, heard = next(self.__heard.iteritems())
+        if heard + self.__reclaim_after <= now:
+            print 'Reclaiming address', address, 'of', self.__unique_ids[address]
+            self.__release(self.__unique_ids[address])
+            self.reclaimed += 1
+    
+    def __touch(self, address, now):
+        self.__heard.pop(address, None)
+        self.__heard[address] = now
+    
+    def heard(self, address, now=None):
+        ''' Records that the device with the address sent a message. '''
+        with self.__lock:
+            if address in self.__unique_ids:
+                self.__touch(address, now if now is not None else monotonic())
+    
+    def release(self, unique_id):
+        ''' Returns the address of the device to the pool. '''
+        with self.__lock:
+            self.__release(unique_id)
+    
+    def __release(self, unique_id):
+        address = self.__addresses.pop(unique_id, None)
+        if address is not None:
+            del self.__unique_ids[address]
+            del self.__heard[address]
+            self.__free.append(address) # reused the latest
+    
+    def address_of(self, unique_id):
+        ''' Returns the address of the device or None. '''
+        return self.__addresses.get(unique_id) # a single dictionary lookup needs no lock
+    
+    def unique_id_of(self, address):
+        ''' Returns the unique identifier of the device with the address or None. '''
+        return self.__unique_ids.get(address)
+    
+    def __len__(self):
+        return len(self.__addresses)
+    
+    def __contains__(self, unique_id):
+        return unique_id in self.__addresses
+
 class NRF24L01P(object):
     ''' Class to manage the nRF24L01/nRF24L01+ transceiver. '''
     
@@ -197,10 +287,24 @@ class NRF24L01P(object):
     MSG_ACK      = 0x80
     MSG_RESET    = MSG_ASSIGN | 0x01
     MSG_DESCRIBE = MSG_ASSIGN | 0x02
+    
+    TX_TIMEOUT    = 0.05   # seconds to wait for the end of a transmission (15 retransmissions)
+    IDLE_TIMEOUT  = 1.0    # seconds between checking the transceiver while no interrupt arrives
+    
+    TX_FIFO_SIZE  = 3      # payloads in the TX FIFO of the transceiver
+    BURST_LENGTH  = 8      # payloads sent at most before listening again
+    WINDOW        = 8      # messages waiting for their (software) acknowledge at most
+    ACK_TIMEOUT   = 0.3    # seconds to wait for the acknowledge of a message
+    SEND_ATTEMPTS = 5      # transmissions of a message before giving it up
+    RX_QUIET      = 0.0015 # seconds without incoming packets before sending (a retransmit delay of the devices)
+    RX_PRIORITY   = 0.02   # seconds to postpone sending at most while packets are incoming
 
-    def __init__(self, addr_rx=None, addr_tx=None, input_pin=11, output_pin=12, payload_length=8, address_length=5, channel=40, debug=False):
-        ''' Constructor '''
-        self.__spi        = spidev.SpiDev(0, 0)
+    def __init__(self, addr_rx=None, addr_tx=None, input_pin=11, output_pin=12, payload_length=8, address_length=5, channel=40, debug=False,
+                 spi=None, gpio=None, reclaim_after=None):
+        ''' Constructor, the SPI and GPIO transports of the Raspberry Pi are used if not given.
+            The addresses of devices silent for "reclaim_after" seconds can be assigned again. '''
+        self.__spi        = spi if spi is not None else SpiDevTransport(0, 0)
+        self.__gpio       = gpio if gpio is not None else RPiGpioTransport()
         self.__input_pin  = input_pin
         self.__output_pin = output_pin
         self.__addr_rx    = addr_rx if addr_rx else [0x12] * address_length
@@ -208,11 +312,23 @@ class NRF24L01P(object):
         self.__pl_len     = payload_length
         self.__channel    = channel
         
-        self.__vconfig = Bits.Config_MASK_MAX_RT | Bits.Config_EN_CRC | Bits.Config_CRCO
+        self.__vconfig = Bits.Config_EN_CRC | Bits.Config_CRCO
         
         # queue for messages to send
         self.__send_queue         = Queue()
         
+        # pipelined sending related variables, used by the handler thread only
+        self.__outstanding        = dict()   # message id -> [ address, payload, transmissions, ack deadline ]
+        self.__retransmit         = deque()  # message ids to send again
+        self.__held               = deque()  # ( address, message, flags ) waiting for an outstanding message to the address
+        self.__plain_packets      = deque()  # payloads sent without (software) acknowledge
+        
+        # self-pipe waking up the handler on interrupts and queued messages
+        self.__wakeup_read, self.__wakeup_write = os.pipe()
+        for fd in (self.__wakeup_read, self.__wakeup_write):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        
         # message id generation related variables
         self.__next_message_id    = 0
         self.__message_id_lock    = threading.Lock()
@@ -221,8 +337,7 @@ class NRF24L01P(object):
         self.__message_receivers  = []
         
         # device registration and address assignment related variables
-        self.__rf_addresses       = dict()
-        self.__addr_assign_lock   = threading.Lock()
+        self.__rf_addresses       = AddressBook(reclaim_after=reclaim_after)
         
         self.__enabled            = False
         self.__debug              = debug
@@ -232,10 +347,9 @@ class NRF24L01P(object):
     
     def __init_gpio(self):
         ''' Initializes the GPIOs of the Raspberry Pi. '''
-        GPIO.setmode(GPIO.BOARD)
-        GPIO.setup(self.__output_pin, GPIO.OUT)
-        GPIO.setup(self.__input_pin, GPIO.IN)
-        GPIO.add_event_detect(self.__input_pin, GPIO.FALLING)
+        self.__gpio.setup_output(self.__output_pin)
+        self.__gpio.setup_input(self.__input_pin)
+        self.__gpio.add_edge_callback(self.__input_pin, self.__interrupted)
     
     def __init_radio(self):
         ''' Initializes the registers of the transceiver. '''
@@ -273,7 +387,7 @@ class NRF24L01P(object):
         self.__write_command(cmd) # Address: 0x1212121212
         # Setup Configuration register
         self.__write_command([SpiCommand.W_REGISTER | Register.CONFIG, 
-                           self.__vconfig]) # MASK_MAX_RT, enable 2 bytes CRC, PWR_UP, PRX
+                           self.__vconfig]) # enable 2 bytes CRC, powered down
     
     def __write_command(self, cmd):
         ''' Writes the command on the SPI bus. '''
@@ -305,60 +419,97 @@ class NRF24L01P(object):
 
     def __configure_for_idle(self):
         ''' Configures the transceiver to be idle. '''
-        conf = Bits.Config_MASK_MAX_RT | Bits.Config_EN_CRC | Bits.Config_CRCO | Bits.Config_PRIM_RX
+        conf = Bits.Config_EN_CRC | Bits.Config_CRCO | Bits.Config_PRIM_RX
         # Setup Configuration register
         self.__write_command([SpiCommand.W_REGISTER | Register.CONFIG, conf])
 
     def __configure_for_reading(self):
         ''' Configures the transceiver to read packets. '''
-        conf = Bits.Config_MASK_MAX_RT | Bits.Config_EN_CRC | Bits.Config_CRCO | \
+        conf = Bits.Config_EN_CRC | Bits.Config_CRCO | \
                 Bits.Config_PWR_UP | Bits.Config_PRIM_RX
         # Setup Configuration register
         self.__write_command([SpiCommand.W_REGISTER | Register.CONFIG, conf])
         
     def __configure_for_sending(self):
         ''' Configures the transceiver to send packets. '''
-        conf = Bits.Config_MASK_MAX_RT | Bits.Config_EN_CRC | Bits.Config_CRCO | Bits.Config_PWR_UP
+        conf = Bits.Config_EN_CRC | Bits.Config_CRCO | Bits.Config_PWR_UP
         # Setup Configuration register
         self.__write_command([SpiCommand.W_REGISTER | Register.CONFIG, conf])
     
-    def __read_message(self, timeout=0):
-        ''' Tries to read a message. '''
-        self.__configure_for_reading()
-        tm_start = time.time()
+    def __interrupted(self, pin):
+        ''' Called by the GPIO transport on the falling edge of the IRQ pin. '''
+        self.__wakeup()
+    
+    def __wakeup(self):
+        ''' Wakes up the handler waiting for an event. '''
+        try:
+            os.write(self.__wakeup_write, 'x')
+        except OSError as ex:
+            if ex.errno != errno.EAGAIN and self.__enabled:
+                raise # a full pipe will wake up the handler anyway
+    
+    def __wait_for_event(self, timeout):
+        ''' Blocks until an interrupt or a queued message wakes up the handler
+            or the timeout expires. Returns True, if it was woken up. '''
+        try:
+            readable = select.select([self.__wakeup_read], [], [], timeout)[0]
+        except select.error as ex:
+            if ex.args[0] == errno.EINTR or not self.__enabled:
+                return False # interrupted or closed by cleanup()
+            raise
         
-        while True:
+        if readable:
             try:
-                stat = self.__read_status()
-                if stat & Bits.Stat_RX_FIFO_Empty != Bits.Stat_RX_FIFO_Empty:
-                    fifoStatus = self.__read_8bit_register_value(Register.FIFO_STATUS)
-                    if fifoStatus & Bits.FifoStat_RX_FULL > 0:
-                        if self.__debug: 
-                            print 'RX FIFO was full!'
-                    
-                    return self.__read_payload()
-                else:
-                    self.__reset_status()
-                    
-                    GPIO.output(self.__output_pin, GPIO.HIGH)
-                    
-                    # time.sleep(0.1)
-                    max_wait = 5 if timeout <= 0 else (time.time()-tm_start) / 0.001
-                    while max_wait > 0 and not GPIO.event_detected(self.__input_pin):
-                        max_wait -= 1
-                        time.sleep(0.001)
-                    
-                    GPIO.output(self.__output_pin, GPIO.LOW)
-                # time.sleep(0.5)
-                # TODO a sleep interval should be shorter than the max transmission interval (with retries)
-            finally:
-                if timeout > 0:
-                    tm = time.time()
-                    if tm - tm_start >= timeout:
-                        break
+                while os.read(self.__wakeup_read, 4096):
+                    pass
+            except OSError as ex:
+                if ex.errno != errno.EAGAIN and self.__enabled:
+                    raise
+        return bool(readable)
+    
+    def __start_listening(self):
+        ''' Switches the transceiver to RX mode until the next transmission. '''
+        self.__configure_for_reading()
+        self.__gpio.output(self.__output_pin, GpioTransport.HIGH)
+    
+    def __receive_payload(self):
+        ''' Reads the next message of the RX FIFO or returns None if it is empty. '''
+        stat = self.__read_status()
+        if stat & Bits.Stat_RX_FIFO_Empty == Bits.Stat_RX_FIFO_Empty:
+            if stat & Bits.Stat_RX_DR:
+                self.__write_command([SpiCommand.W_REGISTER | Register.STATUS, Bits.Stat_RX_DR])
+            return None
+        
+        if self.__debug:
+            fifoStatus = self.__read_8bit_register_value(Register.FIFO_STATUS)
+            if fifoStatus & Bits.FifoStat_RX_FULL > 0:
+                print 'RX FIFO was full!'
+        
+        payload = self.__read_payload()
+        # the FIFO is checked again by the next call: a packet arriving
+        # before clearing RX_DR does not produce a new interrupt
+        self.__write_command([SpiCommand.W_REGISTER | Register.STATUS, Bits.Stat_RX_DR])
+        return payload
     
-    def __send_message(self, message):
-        ''' Tries to send a message. '''
+    def __read_message(self, timeout=0):
+        ''' Tries to read a message, waits at most timeout seconds for its interrupt. '''
+        deadline = monotonic() + timeout
+        
+        while True:
+            message = self.__receive_payload()
+            if message is not None:
+                return message
+            
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return None
+            self.__wait_for_event(remaining)
+    
+    def __send_burst(self, payloads):
+        ''' Sends the payloads keeping the TX FIFO of the transceiver filled.
+            Returns the number of payloads sent before the first one not acknowledged
+            by the radio of the receiver (or when the transmission timed out). '''
+        self.__gpio.output(self.__output_pin, GpioTransport.LOW)
         self.__configure_for_sending()
         self.__reset_status()
         
@@ -366,46 +517,55 @@ class NRF24L01P(object):
         cmd.extend(self.__addr_tx)
         self.__write_command(cmd)
         
-        cmd = [SpiCommand.W_TX_PAYLOAD]
-        cmd.extend(message)
-        self.__spi.writebytes(cmd) 
-        
-        GPIO.output(self.__output_pin, GPIO.HIGH)
-        time.sleep(0.001) # do not stay in CE high for more than 4 ms
-        GPIO.output(self.__output_pin, GPIO.LOW)
-        
-        ack_received = False
-        it = 0
-        max_wait = 10
-        while max_wait > 0:
-            if GPIO.event_detected(self.__input_pin):
-                ack_received = True
-                break
-            it += 1 
-            max_wait -= 1
-            time.sleep(0.001)
-        if self.__debug: 
-            print 'TX waited', it, 'iterations for GPIO event'
-        
-        if not ack_received:
-            status = self.__read_status()
-            if self.__debug: 
-                print 'TX non-ack status:', hex(status)
-            if status & Bits.Stat_TX_DS == Bits.Stat_TX_DS:
-                ack_received = True
-        else:
+        written = sent = 0
+        deadline = monotonic() + NRF24L01P.TX_TIMEOUT
+        while sent < len(payloads):
+            while written < len(payloads) and written - sent < NRF24L01P.TX_FIFO_SIZE:
+                cmd = [SpiCommand.W_TX_PAYLOAD]
+                cmd.extend(payloads[written])
+                self.__spi.writebytes(cmd)
+                written += 1
+            
+            # CE stays high until the FIFO is empty or MAX_RT is signalled on the IRQ pin
+            self.__gpio.output(self.__output_pin, GpioTransport.HIGH)
+            
             status = self.__read_status()
-            if status & Bits.Stat_TX_DS != Bits.Stat_TX_DS:
-                if self.__debug: 
-                    print 'TX ack status:', hex(status)
+            if status & Bits.Stat_TX_DS:
+                # cleared before reading the FIFO: the next payload sent raises an interrupt again
+                self.__write_command([SpiCommand.W_REGISTER | Register.STATUS, Bits.Stat_TX_DS])
+            
+            # TX_DS does not count the payloads sent, the FIFO gives a lower bound
+            fifo = self.__read_8bit_register_value(Register.FIFO_STATUS)
+            if fifo & Bits.FifoStat_TX_EMPTY:
+                remaining = 0
+            elif fifo & Bits.FifoStat_TX_FULL:
+                remaining = NRF24L01P.TX_FIFO_SIZE
+            else:
+                remaining = min(written - sent, NRF24L01P.TX_FIFO_SIZE - 1)
             
+            if written - remaining > sent:
+                sent = written - remaining
+                deadline = monotonic() + NRF24L01P.TX_TIMEOUT
+            elif status & Bits.Stat_MAX_RT:
+                if self.__debug: 
+                    print 'TX non-ack status:', hex(status)
+                break
+            elif not self.__wait_for_event(deadline - monotonic()) and monotonic() >= deadline:
+                break
+        
+        self.__gpio.output(self.__output_pin, GpioTransport.LOW)
+        
+        if sent < written:
+            self.__flush_tx() # the payloads stay in the FIFO after MAX_RT
         self.__reset_status()
         
         cmd = [SpiCommand.W_REGISTER | Register.RX_ADDR_P0]
         cmd.extend(self.__addr_rx)
         self.__write_command(cmd)
         
-        return ack_received
+        self.__start_listening()
+        
+        return sent
     
     def __flush_rx(self):
         ''' Clears the contents of the receive buffer. '''
@@ -422,63 +582,112 @@ class NRF24L01P(object):
         self.__write_command(cmd)
     
     def __generate_next_message_id(self):
-        ''' Generates an identifier for the next message to send. '''
+        ''' Generates an identifier for the next message to send, skipping the ones
+            of the messages still waiting for their acknowledge (at most WINDOW). '''
         with self.__message_id_lock:
-            self.__next_message_id += 1
-            if self.__next_message_id >= 0xFF:
-                self.__next_message_id = 1
-            msgid = self.__next_message_id
-            return msgid
-    
-    def __send_with_acknowledge(self, address, message, flags=MSG_COMMAND):
-        ''' Sends a message and wait for its (software) acknowledge. '''
-        msg_sent     = False
-        ack_received = False
-        retries      = 3
-        
-        msgid = self.__generate_next_message_id()
-        decorated_message = [ address, msgid, flags ]
-        decorated_message.extend([ ord(b) for b in message ])
-        while len(decorated_message) < self.__pl_len:
-            decorated_message.append(0x00)
-        
-        while retries > 0 and (not msg_sent or not ack_received):
-            retries = retries - 1
-            
-            for x in xrange(3):  # @UnusedVariable
-                if self.__send_message(decorated_message):
-                    if self.__debug:
-                        print 'Sent message:', decorated_message
-                    msg_sent = True
+            while True:
+                self.__next_message_id += 1
+                if self.__next_message_id >= 0xFF:
+                    self.__next_message_id = 1
+                if self.__next_message_id not in self.__outstanding:
+                    return self.__next_message_id
+    
+    def __next_burst(self):
+        ''' Collects the payloads of the next burst: acknowledges and other plain packets
+            first, then the retransmissions and the new messages while the window allows.
+            A target receives one message at a time, it does not listen while it answers. 
+            Returns a list of ( message id or None, payload ) pairs. '''
+        burst = []
+        while self.__plain_packets and len(burst) < NRF24L01P.BURST_LENGTH:
+            burst.append( (None, self.__plain_packets.popleft()) )
+        
+        while self.__retransmit and len(burst) < NRF24L01P.BURST_LENGTH:
+            msgid = self.__retransmit.popleft()
+            if msgid in self.__outstanding: # not acknowledged late
+                burst.append( (msgid, self.__outstanding[msgid][1]) )
+        
+        busy = set(entry[0] for entry in self.__outstanding.itervalues())
+        held = len(self.__held)
+        while len(self.__outstanding) < NRF24L01P.WINDOW and len(burst) < NRF24L01P.BURST_LENGTH:
+            if held > 0:
+                held -= 1
+                address, message, flags = self.__held.popleft()
+            elif len(self.__held) < NRF24L01P.WINDOW:
+                try:
+                    address, message, flags = self.__send_queue.get(False)
+                except Empty:
                     break
-                else:
-                    if self.__debug:
-                        print 'Failed to send message', decorated_message
-            
-            if msg_sent:
-                
-                response = self.__read_message(0.3)
-                if self.__debug:
-                    print 'ACK.Response:', response
-                if response:
-                    if response[0] == address and response[1] == msgid and response[2] == NRF24L01P.MSG_ACK:
-                        ack_received = True
-                        if self.__debug:
-                            print 'Acknowledge received for:', decorated_message
-                    else:
-                        if self.__debug:
-                            print 'Bad response for ACK'
-                else:
-                    if self.__debug:
-                        print 'No ACK response'
-                
             else:
-                if self.__debug:
-                    print 'Failed to send message, status:', hex(self.__read_status())
-                
-        self.__flush_tx()
+                break
+            
+            if address in busy:
+                self.__held.append( (address, message, flags) )
+                continue
+            
+            msgid = self.__generate_next_message_id()
+            payload = [ address, msgid, flags ]
+            payload.extend([ ord(b) for b in message ])
+            while len(payload) < self.__pl_len:
+                payload.append(0x00)
+            
+            self.__outstanding[msgid] = [ address, payload, 0, None ]
+            busy.add(address)
+            burst.append( (msgid, payload) )
         
-        return ack_received
+        return burst
+    
+    def __transmit(self, burst):
+        ''' Sends a burst and schedules the acknowledge timeouts of its messages. '''
+        sent = self.__send_burst([ payload for msgid, payload in burst ])
+        if self.__debug: 
+            print 'Sent', sent, 'of', len(burst), 'payloads'
+        
+        deadline = monotonic() + NRF24L01P.ACK_TIMEOUT
+        for idx, (msgid, payload) in enumerate(burst[:sent + 1]):  # @UnusedVariable
+            if msgid is not None:
+                entry = self.__outstanding[msgid]
+                entry[2] += 1
+                # the one not acknowledged by the radio is retransmitted by the next
+                # expiration check, a plain packet (an acknowledge) is not sent again
+                entry[3] = deadline if idx < sent else 0
+        
+        # the payloads after the failed one were not sent
+        for msgid, payload in reversed(burst[sent + 1:]):
+            if msgid is None:
+                self.__plain_packets.appendleft(payload)
+            else:
+                self.__retransmit.appendleft(msgid)
+    
+    def __expire_messages(self):
+        ''' Retransmits or gives up the messages not acknowledged in time.
+            Returns the seconds until the next acknowledge timeout or None. '''
+        now = monotonic()
+        nearest = None
+        for msgid, entry in self.__outstanding.items():
+            deadline = entry[3]
+            if deadline is None:
+                continue # waiting for its retransmission
+            
+            if deadline <= now:
+                if entry[2] >= NRF24L01P.SEND_ATTEMPTS:
+                    del self.__outstanding[msgid]
+                    if self.__debug: 
+                        print 'Message was not sent:', entry[1]
+                else:
+                    entry[3] = None
+                    self.__retransmit.append(msgid)
+            elif nearest is None or deadline < nearest:
+                nearest = deadline
+        
+        return None if nearest is None else nearest - now
+    
+    def __acknowledged(self, address, msgid):
+        ''' Handles the (software) acknowledge of a message. '''
+        entry = self.__outstanding.get(msgid)
+        if entry is not None and entry[0] == address:
+            del self.__outstanding[msgid]
+            if self.__debug: 
+                print 'Acknowledge received for:', entry[1]
     
     def __send_acknowledge(self, address, message_id):
         ''' Sends acknowledge to an incoming message with the given parameters. '''
@@ -486,7 +695,7 @@ class NRF24L01P(object):
         msg.extend([0x00] * (self.__pl_len - 3))
         if self.__debug: 
             print 'Sending acknowledge:', msg
-        self.__send_message(msg)
+        self.__plain_packets.append(msg)
         
     def __send_reset(self):
         ''' Sends a reset message to all RF devices. '''
@@ -495,7 +704,7 @@ class NRF24L01P(object):
         msg.extend([0x00] * (self.__pl_len - 3))
         if self.__debug: 
             print 'Sending reset:', msg
-        self.__send_message(msg) 
+        self.__plain_packets.append(msg)
     
     def __dispatch_received_message(self, address, flags, data):
         ''' Handle and dispatch an incoming message. ''' 
@@ -503,98 +712,93 @@ class NRF24L01P(object):
         if address == 0xFF and flags & NRF24L01P.MSG_ASSIGN:
             ''' Device registration, first step. '''
             
-            addr = -1
             sn = ''.join( [chr(d) if d > 0 else '' for d in data] )
+            addr = self.__rf_addresses.assign(sn)
                 
-            self.__addr_assign_lock.acquire()
-            try:
-                if sn in self.__rf_addresses:
-                    addr = self.__rf_addresses[sn]
-                else:
-                    current_addresses = self.__rf_addresses.values()
-                    for a in xrange(1, 255):
-                        if a not in current_addresses:
-                            addr = a
-                            break
-                        
-            finally:
-                self.__addr_assign_lock.release()
-                
-            if addr > 0:
+            if addr is not None:
                 # if self.__debug: 
                 print 'Registering', sn, 'with address:', addr
-                self.__rf_addresses[sn] = addr
-                self.__send_with_acknowledge(addr, sn, NRF24L01P.MSG_ASSIGN)
+                self.__enqueue_message(addr, sn, NRF24L01P.MSG_ASSIGN)
             else:
                 # if self.__debug: 
                 print 'Can not register', sn
         elif flags & NRF24L01P.MSG_DESCRIBE:
             ''' Device registration, seconds step. '''
             
-            unique_id = None
-            for addr in self.__rf_addresses:
-                if self.__rf_addresses[addr] == address:
-                    unique_id = addr
-                    break
-            
+            unique_id = self.__rf_addresses.unique_id_of(address)
             if unique_id:
                 for receiver in self.__message_receivers:
                     receiver.describe(address, unique_id, data)
         else:
             ''' Every other incoming message. '''
-            unique_id = None
-            for addr in self.__rf_addresses:
-                if self.__rf_addresses[addr] == address:
-                    unique_id = addr
-                    break
-            
+            unique_id = self.__rf_addresses.unique_id_of(address)
             if unique_id:
                 for receiver in self.__message_receivers:
                     receiver.receive(address, unique_id, flags, data)
     
-    def __enqueue_message(self, address, message):
+    def __enqueue_message(self, address, message, flags=MSG_COMMAND):
         ''' Enqueues a message which will be sent to the target. '''
         msg = [m for m in message]
         msg.extend([ chr(0x00) ] * (self.__pl_len - len(message) - 3))
-        self.__send_queue.put( (address, msg) )
+        self.__send_queue.put( (address, msg, flags) )
+        self.__wakeup()
     
     def __main_loop(self):
-        ''' The synchronous executor of the RF handler. '''
+        ''' The synchronous executor of the RF handler, sleeps until
+            an interrupt of the transceiver or a queued message wakes it up. '''
         
-        # reset RF devices to initialize them again
-        self.__send_reset()
-        
-        while self.__enabled:
-            target = None
-            msg    = None
+        try:
+            self.__start_listening()
             
-            # if there is an incoming message, handle it
-            incoming = self.__read_message(0.3)
-            if incoming:
-                address, msgid, flags, data = incoming[0], incoming[1], incoming[2], incoming[3:]
-                if self.__debug: 
-                    print 'DBG|Message from', address, '#' + str(msgid), 'Flags:', hex(flags), ':', data
-                if 0 < address < 0xFF:
-                    self.__send_acknowledge(address, msgid)
-                self.__dispatch_received_message(address, flags, data)
-                continue
-            else:
-                pass # Nothing received
-                
-            # if no message was received check for outgoing messages
-            try:
-                target, msg = self.__send_queue.get(False)
-            except:
-                pass
+            # reset RF devices to initialize them again
+            self.__send_reset()
             
-            # if there is one, send it
-            if target and msg:
-                if self.__send_with_acknowledge(target, msg):
-                    if self.__debug: 
-                        print 'Message successfully sent'
-                else:
+            last_received = postponed = 0
+            while self.__enabled:
+                # handle the incoming messages (at most a FIFO full before sending)
+                for x in xrange(NRF24L01P.TX_FIFO_SIZE):  # @UnusedVariable
+                    incoming = self.__read_message()
+                    if not incoming:
+                        break
+                    
+                    last_received = monotonic()
+                    address, msgid, flags, data = incoming[0], incoming[1], incoming[2], incoming[3:]
                     if self.__debug: 
-                        print 'Message was not sent'
+                        print 'DBG|Message from', address, '#' + str(msgid), 'Flags:', hex(flags), ':', data
+                    if 0 < address < 0xFF:
+                        self.__rf_addresses.heard(address, last_received)
+                    if flags == NRF24L01P.MSG_ACK:
+                        self.__acknowledged(address, msgid)
+                        continue
+                    if 0 < address < 0xFF:
+                        self.__send_acknowledge(address, msgid)
+                    self.__dispatch_received_message(address, flags, data)
+                
+                # the devices do not hear their answers while sending: 
+                # keep listening until the air is quiet or for a while at most
+                now = monotonic()
+                if now < last_received + NRF24L01P.RX_QUIET:
+                    if not postponed:
+                        postponed = now
+                    if now < postponed + NRF24L01P.RX_PRIORITY:
+                        self.__wait_for_event(last_received + NRF24L01P.RX_QUIET - now)
+                        continue
+                postponed = 0
+                
+                # send the acknowledges, retransmissions and queued messages in a burst
+                timeout = self.__expire_messages()
+                burst = self.__next_burst()
+                if burst:
+                    self.__transmit(burst)
+                    continue
+                
+                # nothing to do: the RX FIFO is empty with RX_DR cleared,
+                # so the next packet raises an interrupt
+                if timeout is None or timeout > NRF24L01P.IDLE_TIMEOUT:
+                    timeout = NRF24L01P.IDLE_TIMEOUT
+                self.__wait_for_event(timeout)
+        finally:
+            self.__gpio.output(self.__output_pin, GpioTransport.LOW)
         
     def debugSingleRegister(self, name, address, length):
         ''' Prints the contents of a single register. '''
@@ -632,18 +836,22 @@ class NRF24L01P(object):
     def stop(self):
         ''' Requests stopping of the handlers execution. '''
         self.__enabled = False
+        self.__wakeup()
         
     def cleanup(self):
         ''' Turns off the tranceiver and cleans up GPIO related resources. '''
         try:
             self.__write_command([SpiCommand.W_REGISTER | Register.CONFIG, 0x00])
         finally:
-            GPIO.cleanup()
+            self.__gpio.cleanup()
+            os.close(self.__wakeup_read)
+            os.close(self.__wakeup_write)
         
     def send_message(self, target, message):
         ''' Initiates sending a message to the given target. '''
-        if target in self.__rf_addresses:
-            self.__enqueue_message(self.__rf_addresses[target], message)
+        address = self.__rf_addresses.address_of(target)
+        if address is not None:
+            self.__enqueue_message(address, message)
         else:
             # if self.__debug: 
             print 'There is no known address for', target
@@ -684,7 +892,23 @@ class RFModule(ModuleBase):
     
     def initialize(self):
         ModuleBase.initialize(self)
-        self.__rf = NRF24L01P(payload_length=8, debug=False)
+        self.__ether   = None   # the simulated air in simulated mode
+        self.__devices = []     # its virtual devices
+        
+        if sysargs.radio.mode == 'sim':
+            from modules.rf.simulator import Ether, SimulatedNRF24L01P
+            from modules.rf.devices import VirtualDevice
+            
+            self.__ether = Ether(loss=sysargs.radio.loss, latency=sysargs.radio.latency)
+            transceiver = SimulatedNRF24L01P(self.__ether)
+            self.__rf = NRF24L01P(payload_length=8, debug=False, spi=transceiver, gpio=transceiver,
+                                  reclaim_after=sysargs.radio.reclaim_after)
+            self.__devices = [ VirtualDevice(self.__ether, 'V%04d' % idx, 101 if idx % 2 else 100)
+                               for idx in xrange(sysargs.radio.virtual_devices) ]
+            print 'RF| Simulated transceiver with', len(self.__devices), 'virtual devices'
+        else:
+            self.__rf = NRF24L01P(payload_length=8, debug=False, reclaim_after=sysargs.radio.reclaim_after)
+        
         self.__handlers = []
         
     def configure(self, database):
@@ -693,14 +917,22 @@ class RFModule(ModuleBase):
         
     def start(self):
         ModuleBase.start(self)
+        if self.__ether is not None:
+            self.__ether.start()
         self.__rf.start()
+        for device in self.__devices:
+            device.start()
         
     def stop(self):
         try:
+            for device in self.__devices:
+                device.stop()
             self.__rf.stop()
             ModuleBase.stop(self)
         finally:
             self.__rf.cleanup()
+            if self.__ether is not None:
+                self.__ether.stop()
     
     def register_device_handler(self, handler):
         ''' Registers a device handler instance. '''
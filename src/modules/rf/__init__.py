@@ -0,0 +1,8 @@
+'''
+Created on Oct 19, 2026
+
+This package contains the hardware abstraction of the RF transceiver
+(SPI bus and GPIO pins) and its software simulation with virtual devices.
+
+@author: Viktor Adam
+'''
@@ -0,0 +1,240 @@
+'''
+Created on Oct 19, 2026
+
+Virtual RF devices speaking the ihControl protocol of the device
+firmware (device-development/libraries/ihControl) over the simulated air.
+
+@author: Viktor Adam
+'''
+
+import random
+
+from collections import deque
+
+from modules.comm.evloop import EventLoop
+from modules.radio import NRF24L01P
+from util.clock import monotonic
+
+class VirtualDevice(object):
+    ''' A simulated light (type 101) or power (type 100) device. It registers with its
+        serial identifier, describes its type once it has an address, accepts the off (0),
+        on (1) and level (2) commands and reports its state. Packets to and from the
+        device are lost with the probability "loss" and arrive after "latency" seconds
+        (the settings of the air are used, if None). Runs on the thread of the air. '''
+
+    RX_ADDRESS = ( 0x05, ) * 5   # the devices listen on this address
+    TX_ADDRESS = ( 0x12, ) * 5   # and send to the server on this one
+
+    PAYLOAD_LENGTH = 8
+    DATA_LENGTH    = PAYLOAD_LENGTH - 3
+
+    ON_STATES = { 100: 0x01, 101: 0xFF }
+
+    def __init__(self, ether, serial, type_id=101, loss=None, latency=None,
+                 interval=1.0, state_interval=None, ack_timeout=0.3, retries=3):
+        self.serial         = serial
+        self.type_id        = type_id
+        self.loss           = loss
+        self.latency        = latency
+
+        self.__ether          = ether
+        self.__loop           = ether.loop
+        self.__interval       = interval          # seconds between the registration attempts
+        self.__state_interval = state_interval    # seconds between the repeated state reports (None: never)
+        self.__ack_timeout    = ack_timeout
+        self.__retries        = retries
+
+        self.__started      = False
+        self.__timer        = None
+        self.__outgoing     = deque()   # packets waiting for the radio
+        self.__sending      = False
+        self.__received     = None      # ( sender, pid, payload ) of the last packet, to drop duplicates
+        self.__messages     = deque()   # [ flags, data, attempts ] waiting for their acknowledge in order
+        self.__awaiting     = None      # [ message identifier, ack timer ]
+        self.__last_sent_id = 0
+
+        self.state          = [ 0x00 ] * VirtualDevice.DATA_LENGTH
+        self.__reset()
+
+        self.commands       = 0   # commands received
+        self.reports        = 0   # state reports acknowledged by the server
+        self.failures       = 0   # packets not acknowledged by the radio of the server
+
+    def __reset(self):
+        self.address   = 0xFF
+        self.described = False
+        self.__last_report = 0.0
+
+        self.__messages.clear()
+        if self.__awaiting is not None:
+            EventLoop.cancel(self.__awaiting[1])
+            self.__awaiting = None
+
+    def start(self):
+        ''' Starts the device (from any thread). '''
+        self.__ether.attach(self)
+        self.__loop.call_soon_threadsafe(self.__start)
+
+    def __start(self):
+        self.__started = True
+        self.__timer = self.__loop.call_later(random.random() * self.__interval, self.__check)
+
+    def stop(self):
+        ''' Stops the device (from any thread). '''
+        self.__loop.call_soon_threadsafe(self.__stop)
+        self.__ether.detach(self)
+
+    def __stop(self):
+        self.__started = False
+        if self.__timer is not None:
+            EventLoop.cancel(self.__timer)
+        if self.__awaiting is not None:
+            EventLoop.cancel(self.__awaiting[1])
+
+    def is_ready(self):
+        ''' Returns True, if the device has an address and has described itself. '''
+        return self.address != 0xFF and self.described
+
+    def __check(self):
+        ''' Registers, describes the device or repeats its last state periodically. '''
+        if not self.__started:
+            return
+
+        if self.address == 0xFF:
+            self.__send( [ 0xFF, self.__next_id(), NRF24L01P.MSG_ASSIGN ] + self.__pad(ord(c) for c in self.serial) )
+        elif not self.described:
+            if not self.__messages:
+                self.__send_message(NRF24L01P.MSG_DESCRIBE, [ self.type_id ])
+        elif self.__state_interval and self.__last_report + self.__state_interval <= monotonic():
+            self.report_state()
+
+        self.__timer = self.__loop.call_later(self.__interval, self.__check)
+
+    def __next_id(self):
+        self.__last_sent_id = (self.__last_sent_id + 1) % 0x100
+        return self.__last_sent_id
+
+    def __pad(self, data):
+        data = list(data)[:VirtualDevice.DATA_LENGTH]
+        return data + [ 0x00 ] * (VirtualDevice.DATA_LENGTH - len(data))
+
+    def report_state(self):
+        ''' Sends the current state to the server (on the thread of the air). '''
+        self.__send_message(NRF24L01P.MSG_STATE, self.state)
+
+    # --- software acknowledged messages ---
+
+    def __send_message(self, flags, data):
+        ''' Queues a message to send when the previous ones are acknowledged. '''
+        self.__messages.append( [ flags, self.__pad(data), 0 ] )
+        if self.__awaiting is None:
+            self.__send_next_message()
+
+    def __send_next_message(self):
+        if not self.__messages or not self.__started or self.address == 0xFF:
+            return
+
+        message = self.__messages[0]
+        message[2] += 1
+        msgid = self.__next_id()
+        self.__awaiting = [ msgid, self.__loop.call_later(self.__ack_timeout, self.__ack_timeout_expired, msgid) ]
+        self.__send( [ self.address, msgid, message[0] ] + message[1] )
+
+    def __acknowledged(self, msgid):
+        if self.__awaiting is None or self.__awaiting[0] != msgid:
+            return # late or unknown acknowledge
+
+        EventLoop.cancel(self.__awaiting[1])
+        self.__awaiting = None
+        flags = self.__messages.popleft()[0]
+        if flags == NRF24L01P.MSG_DESCRIBE:
+            self.described = True
+            self.report_state()
+        elif flags == NRF24L01P.MSG_STATE:
+            self.reports += 1
+            self.__last_report = monotonic()
+        self.__send_next_message()
+
+    def __ack_timeout_expired(self, msgid):
+        if self.__awaiting is None or self.__awaiting[0] != msgid:
+            return
+
+        self.__awaiting = None
+        if self.__messages[0][2] > self.__retries or self.__messages[0][0] == NRF24L01P.MSG_DESCRIBE:
+            self.__messages.popleft() # given up, the description is sent again by the periodic check
+        self.__send_next_message()
+
+    # --- radio ---
+
+    def __send(self, payload):
+        ''' Sends a packet with automatic acknowledge and retransmission. '''
+        self.__outgoing.append(payload)
+        if not self.__sending:
+            self.__send_next_packet()
+
+    def __send_next_packet(self):
+        if self.__outgoing and self.__started:
+            self.__sending = True
+            self.__ether.transmit(self, VirtualDevice.TX_ADDRESS, self.__outgoing.popleft(), self.__sent,
+                                  ack=True, retries=15, delay=0.001)
+
+    def __sent(self, acknowledged, attempts):
+        self.__sending = False
+        if not acknowledged:
+            self.failures += 1
+        self.__send_next_packet()
+
+    def receive_packet(self, sender, pid, address, payload):
+        ''' Receives a packet from the air, returns True if it is acknowledged. '''
+        if not self.__started or self.__sending or address != VirtualDevice.RX_ADDRESS:
+            return False # not listening while transmitting
+        if len(payload) != VirtualDevice.PAYLOAD_LENGTH:
+            return False
+
+        if self.__received == (sender, pid, payload):
+            return True # retransmission of a packet already received
+        self.__received = (sender, pid, payload)
+
+        self.__loop.call_soon_threadsafe(self.__handle, payload)
+        return True
+
+    def __handle(self, payload):
+        ''' Processes a message from the server like ihControl does. '''
+        address, msgid, flags, data = payload[0], payload[1], payload[2], payload[3:]
+
+        if flags & NRF24L01P.MSG_RESET == NRF24L01P.MSG_RESET:
+            self.__reset()
+        elif flags & NRF24L01P.MSG_ASSIGN:
+            serial = [ ord(c) for c in self.serial ]
+            if data[:len(serial)] == serial:
+                self.address = address
+                self.__send_ack(msgid)
+                self.__check_soon()
+        elif address == self.address:
+            if flags & NRF24L01P.MSG_ACK:
+                self.__acknowledged(msgid)
+            else:
+                self.__send_ack(msgid)
+                self.__command( (data[0] << 8) + data[1], data[2:] )
+
+    def __check_soon(self):
+        ''' Describes the device right after the address is assigned. '''
+        if self.__timer is not None:
+            EventLoop.cancel(self.__timer)
+        self.__timer = self.__loop.call_later(0, self.__check)
+
+    def __send_ack(self, msgid):
+        self.__send( [ self.address, msgid, NRF24L01P.MSG_ACK ] + [ 0x00 ] * VirtualDevice.DATA_LENGTH )
+
+    def __command(self, command, params):
+        ''' Executes a command and reports the new state. '''
+        self.commands += 1
+        if command == 0:
+            self.state[0] = 0x00
+        elif command == 1:
+            self.state[0] = VirtualDevice.ON_STATES.get(self.type_id, 0x01)
+        elif command == 2 and params:
+            self.state[0] = params[0]
+        else:
+            return
+        self.report_state()
@@ -0,0 +1,352 @@
+'''
+Created on Oct 19, 2026
+
+Software simulation of the nRF24L01+ transceiver on the register level
+(SPI commands, STATUS and FIFO_STATUS registers, 3 deep TX and RX FIFOs,
+IRQ pin, automatic acknowledge and retransmission) and of the air
+between the transceivers with configurable packet loss and latency.
+
+@author: Viktor Adam
+'''
+
+import random
+import threading
+
+from collections import deque
+
+from modules.comm.evloop import EventLoop
+from modules.radio import SpiCommand, Register, Bits
+from modules.rf.transport import SpiTransport, GpioTransport
+
+class Ether(object):
+    ''' The air between the simulated transceivers. Packets arrive "latency" seconds
+        after they were sent ("latency", unless the sender node has its own), each packet
+        and each acknowledge is lost with the probability of the loss of the link
+        ("loss", unless a node of the link has its own).
+        The events of the simulation are executed on the thread of an event loop. '''
+
+    def __init__(self, loss=0.0, latency=0.0003, seed=None, loop=None):
+        self.loss    = loss
+        self.latency = latency
+
+        self.__random    = random.Random(seed)
+        self.__nodes     = []
+        self.__pids      = { }   # sender -> packet identifier of its last new packet
+        self.__own_loop  = loop is None
+        self.loop        = loop if loop is not None else EventLoop('RF|Ether')
+
+        self.sent        = 0     # packets sent, retransmissions included
+        self.lost        = 0     # packets and acknowledges lost
+
+    def start(self):
+        ''' Starts the simulation. '''
+        if self.__own_loop:
+            self.loop.start()
+
+    def stop(self):
+        ''' Stops the simulation. '''
+        if self.__own_loop:
+            self.loop.stop()
+
+    def attach(self, node):
+        ''' Adds a node receiving packets with "receive_packet(sender, pid, address, payload)"
+            which returns True if the packet is acknowledged. '''
+        self.loop.call_soon_threadsafe(self.__nodes.append, node)
+
+    def detach(self, node):
+        ''' Removes a node. '''
+        self.loop.call_soon_threadsafe(self.__nodes.remove, node)
+
+    def __lost(self, node, other):
+        ''' Decides whether a packet between the nodes is lost. '''
+        loss = getattr(node, 'loss', None)
+        if loss is None:
+            loss = getattr(other, 'loss', None)
+        if loss is None:
+            loss = self.loss
+        if loss and self.__random.random() < loss:
+            self.lost += 1
+            return True
+        return False
+
+    def __latency(self, node):
+        latency = getattr(node, 'latency', None)
+        return latency if latency is not None else self.latency
+
+    def transmit(self, sender, address, payload, callback, ack=True, retries=0, delay=0.00025, hears_ack=True):
+        ''' Sends a packet to the nodes listening on the address, retransmitting it "retries"
+            times after "delay" seconds until it is acknowledged (if "ack" is requested).
+            Calls "callback(acknowledged, attempts)" on the loop thread. '''
+        pid = self.__pids[sender] = (self.__pids.get(sender, 0) + 1) % 4
+        self.loop.call_later(self.__latency(sender), self.__deliver, sender, pid, tuple(address), list(payload),
+                             callback, ack, retries, delay, hears_ack, 1)
+
+    def __deliver(self, sender, pid, address, payload, callback, ack, retries, delay, hears_ack, attempt):
+        self.sent += 1
+
+        acknowledged = False
+        for node in self.__nodes:
+            if node is sender or self.__lost(node, sender):
+                continue
+            if node.receive_packet(sender, pid, address, payload) and not self.__lost(node, sender):
+                acknowledged = True
+
+        if not ack:
+            callback(True, attempt)
+        elif acknowledged and hears_ack:
+            self.loop.call_later(self.__latency(sender), callback, True, attempt)
+        elif attempt <= retries:
+            self.loop.call_later(delay, self.__deliver, sender, pid, address, payload,
+                                 callback, ack, retries, delay, hears_ack, attempt + 1)
+        else:
+            callback(False, attempt)
+
+class SimulatedNRF24L01P(SpiTransport, GpioTransport):
+    ''' Register level simulation of an nRF24L01+ transceiver attached to the
+        simulated air, usable as both the SPI and the GPIO transport of the driver.
+        The chip enable (CE) pin and the IRQ pin are identified by their numbers. '''
+
+    FIFO_SIZE = 3
+
+    # register lengths and reset values
+    __defaults = { Register.CONFIG: [ 0x08 ], Register.EN_AA: [ 0x3F ], Register.EN_RXADDR: [ 0x03 ],
+                   Register.SETUP_AW: [ 0x03 ], Register.SETUP_RETR: [ 0x03 ], Register.RF_CH: [ 0x02 ],
+                   Register.RF_SETUP: [ 0x0F ], Register.OBSERVE_TX: [ 0x00 ], Register.RPD: [ 0x00 ],
+                   Register.RX_ADDR_P0: [ 0xE7 ] * 5, Register.RX_ADDR_P1: [ 0xC2 ] * 5,
+                   Register.RX_ADDR_P2: [ 0xC3 ], Register.RX_ADDR_P3: [ 0xC4 ], Register.RX_ADDR_P4: [ 0xC5 ],
+                   Register.RX_ADDR_P5: [ 0xC6 ], Register.TX_ADDR: [ 0xE7 ] * 5,
+                   Register.RX_PW_P0: [ 0 ], Register.RX_PW_P1: [ 0 ], Register.RX_PW_P2: [ 0 ],
+                   Register.RX_PW_P3: [ 0 ], Register.RX_PW_P4: [ 0 ], Register.RX_PW_P5: [ 0 ],
+                   Register.DYNDP: [ 0x00 ], Register.FEATURE: [ 0x00 ] }
+
+    __interrupts = Bits.Stat_RX_DR | Bits.Stat_TX_DS | Bits.Stat_MAX_RT
+
+    def __init__(self, ether, ce_pin=12, irq_pin=11):
+        self.__ether     = ether
+        self.__ce_pin    = ce_pin
+        self.__irq_pin   = irq_pin
+
+        self.__lock      = threading.RLock()
+        self.__registers = dict( (address, list(value)) for address, value in SimulatedNRF24L01P.__defaults.iteritems() )
+        self.__flags     = 0          # interrupt flags of the STATUS register
+        self.__tx_fifo   = deque()    # ( payload, acknowledge requested )
+        self.__rx_fifo   = deque()    # ( pipe, payload )
+        self.__reuse     = False
+        self.__ce        = False
+        self.__sending   = False
+        self.__irq       = GpioTransport.HIGH
+        self.__edge      = False      # falling edge on the IRQ pin not reported yet
+        self.__callbacks = [ ]        # called on the falling edges of the IRQ pin
+        self.__received  = { }        # pipe -> ( sender, pid, payload ) of the last packet, to drop duplicates
+
+        ether.attach(self)
+
+    # --- SPI transport ---
+
+    def xfer(self, data):
+        with self.__lock:
+            command, args = data[0], list(data[1:])
+            status = self.__status()
+
+            if command == SpiCommand.NOP:
+                response = []
+            elif command & 0xE0 == SpiCommand.R_REGISTER:
+                value = self.__read_register(command & 0x1F)
+                response = (value + [ 0 ] * len(args))[:len(args)]
+            elif command & 0xE0 == SpiCommand.W_REGISTER:
+                self.__write_register(command & 0x1F, args)
+                response = [ 0 ] * len(args)
+            elif command == SpiCommand.R_RX_PAYLOAD:
+                payload = self.__rx_fifo.popleft()[1] if self.__rx_fifo else []
+                response = (payload + [ 0 ] * len(args))[:len(args)]
+            elif command == SpiCommand.R_RX_PL_WID:
+                response = [ len(self.__rx_fifo[0][1]) if self.__rx_fifo else 0 ]
+            elif command in (SpiCommand.W_TX_PAYLOAD, SpiCommand.W_TX_PAYLOAD_NOACK):
+                if len(self.__tx_fifo) < SimulatedNRF24L01P.FIFO_SIZE:
+                    self.__tx_fifo.append( (args, command == SpiCommand.W_TX_PAYLOAD) )
+                self.__reuse = False
+                response = [ 0 ] * len(args)
+                self.__transmit()
+            elif command == SpiCommand.FLUSH_TX:
+                self.__tx_fifo.clear()
+                self.__reuse = False
+                response = []
+            elif command == SpiCommand.FLUSH_RX:
+                self.__rx_fifo.clear()
+                response = []
+            elif command == SpiCommand.REUSE_TX_PL:
+                self.__reuse = True
+                response = []
+            else:
+                response = [ 0 ] * len(args)
+
+            return [ status ] + response
+
+    def readbytes(self, length):
+        # the bytes sent while reading are zeros: reading the CONFIG register
+        return self.xfer([ SpiCommand.R_REGISTER | Register.CONFIG ] + [ SpiCommand.NOP ] * (length - 1))
+
+    def __status(self):
+        status = self.__flags
+        status |= (self.__rx_fifo[0][0] << 1) if self.__rx_fifo else Bits.Stat_RX_FIFO_Empty
+        if len(self.__tx_fifo) >= SimulatedNRF24L01P.FIFO_SIZE:
+            status |= Bits.Stat_TX_Full
+        return status
+
+    def __fifo_status(self):
+        status = 0
+        if self.__reuse:
+            status |= Bits.FifoStat_TX_REUSE
+        if len(self.__tx_fifo) >= SimulatedNRF24L01P.FIFO_SIZE:
+            status |= Bits.FifoStat_TX_FULL
+        if not self.__tx_fifo:
+            status |= Bits.FifoStat_TX_EMPTY
+        if len(self.__rx_fifo) >= SimulatedNRF24L01P.FIFO_SIZE:
+            status |= Bits.FifoStat_RX_FULL
+        if not self.__rx_fifo:
+            status |= Bits.FifoStat_RX_EMPTY
+        return status
+
+    def __read_register(self, address):
+        if address == Register.STATUS:
+            return [ self.__status() ]
+        elif address == Register.FIFO_STATUS:
+            return [ self.__fifo_status() ]
+        return list(self.__registers.get(address, [ 0 ]))
+
+    def __write_register(self, address, value):
+        if address == Register.STATUS:
+            if value: # the interrupt flags are cleared by writing 1 to them
+                self.__flags &= ~(value[0] & SimulatedNRF24L01P.__interrupts)
+            self.__update_irq()
+            self.__transmit() # a cleared MAX_RT lets the transmission continue
+        elif address in self.__registers:
+            current = self.__registers[address]
+            self.__registers[address] = (list(value) + current[len(value):])[:len(current)]
+            if address == Register.OBSERVE_TX:
+                self.__registers[address] = current # read-only
+            elif address == Register.CONFIG:
+                self.__update_irq()
+                self.__transmit()
+
+    # --- GPIO transport ---
+
+    def output(self, pin, value):
+        if pin == self.__ce_pin:
+            with self.__lock:
+                self.__ce = bool(value)
+                self.__transmit()
+
+    def input(self, pin):
+        with self.__lock:
+            return self.__irq if pin == self.__irq_pin else GpioTransport.LOW
+
+    def event_detected(self, pin):
+        with self.__lock:
+            if pin == self.__irq_pin and self.__edge:
+                self.__edge = False
+                return True
+            return False
+
+    def add_edge_callback(self, pin, callback):
+        ''' The callbacks are called on the thread of the air, like the
+            edge detection thread of RPi.GPIO calls them. '''
+        if pin == self.__irq_pin:
+            with self.__lock:
+                self.__callbacks.append(callback)
+
+    def __update_irq(self):
+        ''' Drives the IRQ pin low while an interrupt flag not masked in CONFIG is set. '''
+        active = self.__flags & ~self.__registers[Register.CONFIG][0] & SimulatedNRF24L01P.__interrupts
+        level = GpioTransport.LOW if active else GpioTransport.HIGH
+        if level == GpioTransport.LOW and self.__irq == GpioTransport.HIGH:
+            self.__edge = True
+            for callback in self.__callbacks:
+                self.__ether.loop.call_soon_threadsafe(callback, self.__irq_pin)
+        self.__irq = level
+
+    # --- radio ---
+
+    def __address_width(self):
+        return (self.__registers[Register.SETUP_AW][0] & 0x03) + 2
+
+    def __powered(self):
+        return self.__registers[Register.CONFIG][0] & Bits.Config_PWR_UP
+
+    def __receiving(self):
+        return self.__powered() and self.__registers[Register.CONFIG][0] & Bits.Config_PRIM_RX and self.__ce
+
+    def __transmit(self):
+        ''' Sends the first packet of the TX FIFO in TX mode while CE is high. '''
+        if self.__sending or not self.__ce or not self.__powered() or \
+                self.__registers[Register.CONFIG][0] & Bits.Config_PRIM_RX or \
+                not self.__tx_fifo or self.__flags & Bits.Stat_MAX_RT:
+            return
+
+        payload, ack = self.__tx_fifo[0]
+        width = self.__address_width()
+        address = self.__registers[Register.TX_ADDR][:width]
+        ack = ack and bool(self.__registers[Register.EN_AA][0] & 0x01)
+        retries = self.__registers[Register.SETUP_RETR][0] & 0x0F
+        delay = ((self.__registers[Register.SETUP_RETR][0] >> 4) + 1) * 0.00025
+        # the acknowledge is received on pipe 0 with the transmit address
+        hears_ack = self.__registers[Register.RX_ADDR_P0][:width] == address
+
+        self.__sending = True
+        self.__ether.transmit(self, address, payload, self.__transmitted, ack, retries, delay, hears_ack)
+
+    def __transmitted(self, acknowledged, attempts):
+        ''' Completes the transmission of the first packet of the TX FIFO. '''
+        with self.__lock:
+            self.__sending = False
+            lost = self.__registers[Register.OBSERVE_TX][0] >> 4
+            if acknowledged:
+                self.__flags |= Bits.Stat_TX_DS
+                if self.__tx_fifo and not self.__reuse:
+                    self.__tx_fifo.popleft()
+            else:
+                self.__flags |= Bits.Stat_MAX_RT # the packet stays in the FIFO
+                lost = min(lost + 1, 0x0F)
+            self.__registers[Register.OBSERVE_TX] = [ (lost << 4) | min(attempts - 1, 0x0F) ]
+            self.__update_irq()
+            self.__transmit()
+
+    def __pipe_of(self, address):
+        ''' Returns the enabled pipe receiving on the address or None. '''
+        width = self.__address_width()
+        enabled = self.__registers[Register.EN_RXADDR][0]
+        for pipe in xrange(6):
+            if not enabled & (1 << pipe):
+                continue
+            if pipe < 2:
+                own = self.__registers[Register.RX_ADDR_P0 + pipe][:width]
+            else: # the other bytes are shared with pipe 1
+                own = self.__registers[Register.RX_ADDR_P0 + pipe][:1] + self.__registers[Register.RX_ADDR_P1][1:width]
+            if tuple(own) == address:
+                return pipe
+        return None
+
+    def receive_packet(self, sender, pid, address, payload):
+        ''' Receives a packet from the air in RX mode, returns True if it is acknowledged. '''
+        with self.__lock:
+            if not self.__receiving():
+                return False
+
+            pipe = self.__pipe_of(address)
+            if pipe is None:
+                return False
+            width = self.__registers[Register.RX_PW_P0 + pipe][0]
+            if not width or width != len(payload):
+                return False # static payload width mismatch fails like a bad CRC
+
+            auto_ack = bool(self.__registers[Register.EN_AA][0] & (1 << pipe))
+            if self.__received.get(pipe) == (sender, pid, payload):
+                return auto_ack # retransmission of a packet already received
+            if len(self.__rx_fifo) >= SimulatedNRF24L01P.FIFO_SIZE:
+                return False # lost, not acknowledged
+
+            self.__received[pipe] = (sender, pid, payload)
+            self.__rx_fifo.append( (pipe, list(payload)) )
+            self.__flags |= Bits.Stat_RX_DR
+            self.__update_irq()
+            return auto_ack
@@ -0,0 +1,115 @@
+'''
+Created on Oct 19, 2026
+
+Interfaces of the SPI bus and the GPIO pins the nRF24L01+ transceiver
+is connected to, and their implementations on the Raspberry Pi.
+The Raspberry Pi libraries are imported only when they are used.
+
+@author: Viktor Adam
+'''
+
+class SpiTransport(object):
+    ''' Interface of the SPI bus of the transceiver. '''
+
+    def xfer(self, data):
+        ''' Writes the bytes and returns the bytes read at the same time
+            (the first one is the STATUS register of the transceiver). '''
+        raise NotImplementedError()
+
+    def writebytes(self, data):
+        ''' Writes the bytes. '''
+        self.xfer(data)
+
+    def readbytes(self, length):
+        ''' Reads the given number of bytes. '''
+        raise NotImplementedError()
+
+    def close(self):
+        ''' Releases the bus. '''
+        pass
+
+class GpioTransport(object):
+    ''' Interface of the GPIO pins of the transceiver: the chip enable (CE)
+        output and the active low interrupt request (IRQ) input. '''
+
+    LOW  = 0
+    HIGH = 1
+
+    def setup_output(self, pin):
+        ''' Configures an output pin. '''
+        pass
+
+    def setup_input(self, pin):
+        ''' Configures an input pin with falling edge detection. '''
+        pass
+
+    def output(self, pin, value):
+        ''' Sets the level of an output pin. '''
+        raise NotImplementedError()
+
+    def input(self, pin):
+        ''' Returns the level of an input pin. '''
+        raise NotImplementedError()
+
+    def event_detected(self, pin):
+        ''' Returns True, if a falling edge was detected on the input pin
+            since the last call. '''
+        raise NotImplementedError()
+
+    def add_edge_callback(self, pin, callback):
+        ''' Calls "callback(pin)" on a thread of the transport whenever
+            a falling edge is detected on the input pin. '''
+        raise NotImplementedError()
+
+    def cleanup(self):
+        ''' Releases the pins. '''
+        pass
+
+class SpiDevTransport(SpiTransport):
+    ''' SPI bus of the Raspberry Pi accessed with the spidev library. '''
+
+    def __init__(self, bus=0, device=0):
+        import spidev
+        self.__spi = spidev.SpiDev(bus, device)
+
+    def xfer(self, data):
+        return self.__spi.xfer(data)
+
+    def writebytes(self, data):
+        self.__spi.writebytes(data)
+
+    def readbytes(self, length):
+        return self.__spi.readbytes(length)
+
+    def close(self):
+        self.__spi.close()
+
+class RPiGpioTransport(GpioTransport):
+    ''' GPIO pins of the Raspberry Pi (board numbering) accessed with the RPi.GPIO library. '''
+
+    def __init__(self):
+        import RPi.GPIO as GPIO
+        self.__gpio = GPIO
+        self.__gpio.setmode(GPIO.BOARD)
+
+    def setup_output(self, pin):
+        self.__gpio.setup(pin, self.__gpio.OUT)
+
+    def setup_input(self, pin):
+        self.__gpio.setup(pin, self.__gpio.IN)
+        self.__gpio.add_event_detect(pin, self.__gpio.FALLING)
+
+    def output(self, pin, value):
+        self.__gpio.output(pin, self.__gpio.HIGH if value else self.__gpio.LOW)
+
+    def input(self, pin):
+        return GpioTransport.HIGH if self.__gpio.input(pin) else GpioTransport.LOW
+
+    def event_detected(self, pin):
+        return self.__gpio.event_detected(pin)
+
+    def add_edge_callback(self, pin, callback):
+        self.__gpio.add_event_callback(pin, callback)
+
+    def cleanup(self):
+        self.__gpio.cleanup()
@@ -0,0 +1,54 @@
+'''
+Created on Oct 19, 2026
+
+Monotonic clock for timeouts and deadlines. Unlike time.time() it does not
+jump when the wall clock is set, e.g. at the NTP synchronization of
+a Raspberry Pi without real-time clock.
+
+@author: Viktor Adam
+'''
+
+import ctypes
+import ctypes.util
+import time
+
+CLOCK_MONOTONIC = 1 # clock identifier on Linux
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [ ('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long) ]
+
+def __load_clock_gettime():
+    ''' Returns the clock_gettime function of the C library or None if it is not available. '''
+    for name in ('c', 'rt'):
+        try:
+            library = ctypes.CDLL(ctypes.util.find_library(name), use_errno=True)
+            function = library.clock_gettime
+            function.argtypes = [ ctypes.c_int, ctypes.POINTER(_Timespec) ]
+            return function
+        except (OSError, AttributeError, TypeError):
+            pass
+    return None
+
+def __create_monotonic():
+    ''' Returns the best available monotonic clock function, time.time as the last resort. '''
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+
+    clock_gettime = __load_clock_gettime()
+    if clock_gettime is None:
+        return time.time
+
+    def monotonic():
+        spec = _Timespec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(spec)) != 0:
+            raise OSError(ctypes.get_errno(), 'clock_gettime failed')
+        return spec.tv_sec + spec.tv_nsec * 1e-9
+
+    try:
+        monotonic()
+        return monotonic
+    except OSError:
+        return time.time
+
+''' Returns the seconds elapsed since an arbitrary point in the past (float). '''
+monotonic = __create_monotonic()
@@ -83,6 +83,17 @@ class Database(object):
             Database.__static_instances[mname] = instance
             return instance
     
+    @classmethod
+    def reset_after_fork(cls):
+        ''' Drops the writer sessions inherited by a forked child process. The lock and the
+            connection of a writer session are copied in their state at the fork, even if
+            the parent thread holding them does not exist in the child. The child opens
+            its own connections on the next statement. '''
+        for instance in Database.__static_instances.values():
+            instance.__wr_lock  = threading.RLock()
+            instance.__wr_conn  = None
+            instance.__wr_count = 0
+    
     def __init__(self, path):
         self.__db_path = path               # Database path
         self.__wr_lock = threading.RLock()  # Write lock (reentrant)
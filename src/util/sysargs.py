@@ -20,6 +20,33 @@ communication = __ArgData()
 communication.modes = [ 'mcast' ]
 communication.ports = [ None   ]
 communication.hosts = [ None    ]
+communication.coalesce_window  = 0.05 # seconds without changes before a batch is sent
+communication.coalesce_latency = 0.2  # maximal delay of a state change in seconds
+communication.compression_threshold = 512 # minimal size of compressed messages in bytes
+communication.send_queue_limit = 64 # pushed messages queued for a TCP client before the policy applies
+communication.slow_consumer_policy = 'coalesce' # drop, coalesce or disconnect
+communication.max_connections = 256 # maximal number of TCP client connections
+communication.max_connections_per_address = 16 # maximal number of TCP connections from one address
+communication.idle_timeout = 120.0 # seconds without messages before a TCP connection is closed or a UDP session expires
+communication.workers = 4 # number of worker processes in prefork TCP mode
+communication.executor_threads = 4 # threads processing the messages of the event loop based modes
+communication.receive_buffer = None # UDP socket receive buffer size in bytes (system default if None)
+
+''' Parameters for authentication. '''
+auth = __ArgData()
+auth.session_idle_timeout = 3600.0 # seconds without messages before a login session expires
+auth.session_max_age = 86400.0 # seconds after the login before a session expires
+auth.max_sessions = 10000 # sessions kept, the least recently used ones are evicted above
+auth.hash_iterations = 100000 # PBKDF2 iterations of the stored password hashes
+auth.credential_cache = 1024 # credentials verified recently kept in memory (0 disables the cache)
+
+''' Parameters of the RF communication. '''
+radio = __ArgData()
+radio.mode = 'hw' # hw: nRF24L01+ on the Raspberry Pi, sim: simulated transceiver with virtual devices
+radio.virtual_devices = 0 # number of virtual devices in simulated mode
+radio.loss = 0.0 # probability of losing a packet in simulated mode
+radio.latency = 0.0003 # seconds of packet delivery in simulated mode
+radio.reclaim_after = 86400.0 * 7 # seconds of silence before the address of a device can be assigned to another one
 
 ''' Parameters for entities. '''
 entities = __ArgData()
@@ -48,11 +75,83 @@ def __initialize():
             localizations.search_path = arg[len('--loc='):].split(';')
         elif arg.lower().startswith('--lang='):
             localizations.default = arg[len('--lang='):]
+        elif arg.lower().startswith('--coalesce='):
+            # --coalesce=window_ms
+            # --coalesce=window_ms:max_latency_ms
+            params = arg[len('--coalesce='):].split(':')
+            communication.coalesce_window = int(params[0]) / 1000.0
+            if len(params) > 1:
+                communication.coalesce_latency = int(params[1]) / 1000.0
+        elif arg.lower().startswith('--compress='):
+            # --compress=threshold_bytes
+            communication.compression_threshold = int(arg[len('--compress='):])
+        elif arg.lower().startswith('--sendqueue='):
+            # --sendqueue=limit
+            # --sendqueue=limit:policy
+            params = arg[len('--sendqueue='):].split(':')
+            communication.send_queue_limit = int(params[0])
+            if len(params) > 1:
+                communication.slow_consumer_policy = params[1].lower()
+        elif arg.lower().startswith('--connections='):
+            # --connections=max
+            # --connections=max:max_per_address
+            # --connections=max:max_per_address:idle_timeout_seconds
+            params = arg[len('--connections='):].split(':')
+            communication.max_connections = int(params[0])
+            if len(params) > 1:
+                communication.max_connections_per_address = int(params[1])
+            if len(params) > 2:
+                communication.idle_timeout = float(params[2])
+        elif arg.lower().startswith('--workers='):
+            # --workers=count
+            communication.workers = int(arg[len('--workers='):])
+        elif arg.lower().startswith('--rcvbuf='):
+            # --rcvbuf=bytes
+            communication.receive_buffer = int(arg[len('--rcvbuf='):])
+        elif arg.lower().startswith('--executor='):
+            # --executor=threads
+            communication.executor_threads = int(arg[len('--executor='):])
+        elif arg.lower().startswith('--sessions='):
+            # --sessions=idle_timeout_seconds
+            # --sessions=idle_timeout_seconds:max_age_seconds
+            # --sessions=idle_timeout_seconds:max_age_seconds:max_sessions
+            params = arg[len('--sessions='):].split(':')
+            auth.session_idle_timeout = float(params[0])
+            if len(params) > 1:
+                auth.session_max_age = float(params[1])
+            if len(params) > 2:
+                auth.max_sessions = int(params[2])
+        elif arg.lower().startswith('--hashing='):
+            # --hashing=iterations
+            # --hashing=iterations:credential_cache_size
+            params = arg[len('--hashing='):].split(':')
+            auth.hash_iterations = int(params[0])
+            if len(params) > 1:
+                auth.credential_cache = int(params[1])
+        elif arg.lower().startswith('--radio='):
+            # --radio=hw
+            # --radio=sim:virtual_devices
+            # --radio=sim:virtual_devices:loss
+            # --radio=sim:virtual_devices:loss:latency_ms
+            params = arg[len('--radio='):].split(':')
+            radio.mode = params[0].lower()
+            if len(params) > 1:
+                radio.virtual_devices = int(params[1])
+            if len(params) > 2:
+                radio.loss = float(params[2])
+            if len(params) > 3:
+                radio.latency = float(params[3]) / 1000.0
+        elif arg.lower().startswith('--reclaim='):
+            # --reclaim=seconds
+            radio.reclaim_after = float(arg[len('--reclaim='):])
         elif arg.lower().startswith('--communication='):
             # --communication=mcast@host:port
             # --communication=bcast:port
             # --communication=udp:port
             # --communication=tcp:port
+            # --communication=evtcp:port
+            # --communication=evudp:port
+            # --communication=ptcp:port
             
             del communication.modes[:]
             del communication.ports[:]
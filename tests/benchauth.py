@@ -0,0 +1,63 @@
+'''
+Created on Oct 19, 2026
+
+Benchmark of the number of logins per second during a reconnect storm,
+when every client logs in again several times in a short period,
+with and without the cache of the verified credentials.
+Only the first login of a client needs the password hashing with the cache.
+
+Usage: python benchauth.py [clients] [logins per client] [hash iterations]
+
+@author: Viktor Adam
+'''
+
+import hashlib
+import sys
+import time
+
+from modules.auth import Authentication
+from util.database import Database
+from util import sysargs
+
+def storm(auth, clients, logins):
+    ''' Logs in every client "logins" times, one round of every client after the other
+        (the in-memory test database is bound to this thread).
+        Returns the logins per second of the first round and of the rest. '''
+    credentials = [ ('user%d' % idx, hashlib.md5('password%d' % idx).hexdigest()) for idx in xrange(clients) ]
+
+    rates = []
+    for rounds in (1, logins - 1):
+        tm_start = time.time()
+        for x in xrange(rounds):  # @UnusedVariable
+            for username, password in credentials:
+                if auth.authenticate(username, password) is None:
+                    print 'Login failed:', username
+        rates.append(clients * rounds / (time.time() - tm_start))
+    return rates
+
+def main(clients, logins, iterations):
+    Database.TEST_USE_IN_MEMORY_AS_DEFAULT = True
+    sysargs.auth.hash_iterations = iterations
+
+    print 'Clients:', clients, '| Logins per client:', logins, '| Hash iterations:', iterations
+    print '%-16s | %16s | %17s' % ('Credential cache', 'First logins/s', 'Repeated logins/s')
+
+    for cache_size in (0, 1024):
+        sysargs.auth.credential_cache = cache_size
+        database = Database.instance()
+        try:
+            auth = Authentication()
+            auth.initialize()
+            auth.configure(database)
+            for idx in xrange(clients):
+                auth.create_user('user%d' % idx, hashlib.md5('password%d' % idx).hexdigest())
+
+            first, repeated = storm(auth, clients, logins)
+            print '%-16s | %16.1f | %17.1f' % (cache_size or 'disabled', first, repeated)
+        finally:
+            database.close()
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 10,
+         int(sys.argv[3]) if len(sys.argv) > 3 else sysargs.auth.hash_iterations)
@@ -0,0 +1,102 @@
+'''
+Created on Oct 19, 2026
+
+Benchmark of the request throughput of the single process TCP
+handler and of the prefork TCP handler with different numbers
+of worker processes. The requests are served with a CPU bound
+encoding of an entity list, like the device list requests.
+
+Usage: python benchprefork.py [clients] [requests per client] [worker counts, comma separated]
+
+@author: Viktor Adam
+'''
+
+import multiprocessing
+import socket
+import struct
+import sys
+import time
+
+from modules.comm import Header, schema
+from modules.comm.framing import FrameDecoder
+from modules.comm.prefork import PreforkTCPHandler
+from modules.comm.tcp import TCPHandler
+
+ENTITIES = [ { 'unique_id': 'BENCH-%04d' % i, 'type_id': 3, 'name': 'Benchmark device #%d' % i, 'state_id': i % 2,
+               'state_name': 'On' if i % 2 else 'Off', 'state_value': str(i % 100), 'last_checkin': 1389000000.0 + i }
+             for i in xrange(200) ]
+
+def application(handler, sender, header, data):
+    if header == Header.MSG_A_LOGIN:
+        handler.authentication_succeeded('session', sender)
+        handler.send(header, 'session', sender)
+    else:
+        handler.send(header, schema.TEXT.encode(schema.ENTITY_LIST, ENTITIES), sender)
+
+def client(port, requests, window, results):
+    ''' Logs in and sends the requests keeping "window" requests in flight. '''
+    sock = socket.create_connection( ('127.0.0.1', port) )
+    decoder = FrameDecoder()
+
+    def wait_response():
+        while True:
+            for frame in decoder.frames():
+                return frame
+            if not decoder.receive(sock):
+                raise IOError('Connection closed')
+
+    request = struct.pack('!BH', Header.MSG_A_LIST_DEVICES, 0)
+    sock.sendall(struct.pack('!BH', Header.MSG_A_LOGIN, 9) + 'user:pass')
+    wait_response()
+
+    sent = min(window, requests)
+    sock.sendall(request * sent)
+    for x in xrange(requests):  # @UnusedVariable
+        wait_response()
+        if sent < requests:
+            sock.sendall(request)
+            sent += 1
+
+    sock.close()
+    results.put(requests)
+
+def measure(port, clients, requests):
+    ''' Returns the number of requests served per second. '''
+    results = multiprocessing.Queue()
+    processes = [ multiprocessing.Process(target=client, args=(port, requests, 8, results)) for x in xrange(clients) ]  # @UnusedVariable
+
+    tm_start = time.time()
+    for p in processes:
+        p.start()
+    total = sum(results.get() for p in processes)
+    elapsed = time.time() - tm_start
+
+    for p in processes:
+        p.join()
+    return total / elapsed
+
+def main(clients, requests, worker_counts):
+    print 'Clients:', clients, '| Requests per client:', requests
+    print '%-24s | %12s' % ('Handler', 'Requests/s')
+
+    handler = TCPHandler('127.0.0.1', 0, application, max_per_address=clients)
+    handler.start()
+    try:
+        port = handler._TCPHandler__server_socket.getsockname()[1]
+        print '%-24s | %12.1f' % ('tcp (single process)', measure(port, clients, requests))
+    finally:
+        handler.stop()
+
+    for workers in worker_counts:
+        handler = PreforkTCPHandler('127.0.0.1', 0, application, workers=workers,
+                                    local_headers=(Header.MSG_A_LIST_DEVICES, ), max_per_address=clients)
+        handler.start()
+        try:
+            print '%-24s | %12.1f' % ('ptcp (%d workers)' % workers, measure(handler.port, clients, requests))
+        finally:
+            handler.stop()
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 8,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 200,
+         [ int(w) for w in sys.argv[3].split(',') ] if len(sys.argv) > 3 else [ 1, 2, 4 ])
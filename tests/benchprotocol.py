@@ -0,0 +1,55 @@
+'''
+Created on Oct 19, 2026
+
+Benchmark comparing the text (v1) and binary (v2) wire encodings:
+encoding and decoding cost and message sizes.
+
+Usage: python benchprotocol.py [number of entities] [number of iterations]
+
+@author: Viktor Adam
+'''
+
+import sys
+import time
+
+from util.database import Database
+Database.TEST_USE_IN_MEMORY_AS_DEFAULT = True
+
+from entities import Entity, EntityType, EntityHistory, COMMAND_ON, COMMAND_OFF
+from entities import STATE_ON, STATE_OFF
+from modules.comm import schema
+
+def measure(function, iterations):
+    ''' Returns the average execution time of the function in microseconds. '''
+    tm_start = time.time()
+    for x in xrange(iterations):  # @UnusedVariable
+        function()
+    return (time.time() - tm_start) * 1000000.0 / iterations
+
+def main(count, iterations):
+    EntityType.register(197, 'BenchmarkEntity', Entity, [COMMAND_ON, COMMAND_OFF], '#CCCC00', 'light.png')
+    etype = EntityType.find(197)
+
+    entities = [ Entity('BENCH-%04d' % i, etype, 'Benchmark device #%d' % i,
+                        STATE_ON if i % 2 else STATE_OFF, i % 100, 1389000000.0 + i) for i in xrange(count) ]
+    history  = [ EntityHistory(1389000000.0 + i, e.unique_id, e.name, 'State changed to ' + e.describe_state(), EntityHistory.Type_State)
+                 for i, e in enumerate(entities) ]
+    request  = { 'entity_id': 'BENCH-0001', 'command_id': 100, 'parameter': '50' }
+
+    cases = [ ('Entity list',     schema.ENTITY_LIST,     entities),
+              ('History list',    schema.HISTORY_LIST,    history),
+              ('Type list',       schema.TYPE_LIST,       [ etype ] * 10),
+              ('Command request', schema.COMMAND_REQUEST, request) ]
+
+    print 'Items:', count, '| Iterations:', iterations
+    print '%-16s | %-5s | %10s | %12s | %12s' % ('Message', 'Codec', 'Size (B)', 'Encode (us)', 'Decode (us)')
+    for name, message_schema, items in cases:
+        for codec in (schema.TEXT, schema.BINARY):
+            encoded = codec.encode(message_schema, items)
+            encode_us = measure(lambda: codec.encode(message_schema, items), iterations)
+            decode_us = measure(lambda: codec.decode(message_schema, encoded), iterations)
+            print '%-16s | %-5s | %10d | %12.1f | %12.1f' % (name, codec.name, len(encoded), encode_us, decode_us)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 200)
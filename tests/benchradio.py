@@ -0,0 +1,113 @@
+'''
+Created on Oct 19, 2026
+
+Benchmark of the RF handler running against the simulated transceiver:
+the CPU usage of the process while the registered virtual devices are idle,
+the latency between a state report sent by a device and its dispatch
+to the message receivers of the handler, and the commands per second
+when scenes switch every device on and off.
+
+Usage: python benchradio.py [virtual devices] [idle seconds] [state reports] [scenes]
+
+@author: Viktor Adam
+'''
+
+import os
+import sys
+import threading
+import time
+
+from modules.radio import NRF24L01P
+from modules.rf.devices import VirtualDevice
+from modules.rf.simulator import Ether, SimulatedNRF24L01P
+
+class Receiver(object):
+    ''' Records the time of the dispatched messages. '''
+
+    def __init__(self):
+        self.condition  = threading.Condition()
+        self.described  = set()
+        self.dispatched = { }   # unique_id -> time of the last state message
+        self.states     = { }   # unique_id -> last state
+
+    def describe(self, address, unique_id, data):
+        with self.condition:
+            self.described.add(unique_id)
+
+    def receive(self, address, unique_id, flags, data):
+        with self.condition:
+            self.dispatched[unique_id] = time.time()
+            self.states[unique_id] = data[0]
+            self.condition.notify_all()
+
+def cpu_time():
+    times = os.times()
+    return times[0] + times[1]
+
+def main(count, idle, reports, scenes):
+    ether = Ether()
+    ether.start()
+    transceiver = SimulatedNRF24L01P(ether)
+    radio = NRF24L01P(spi=transceiver, gpio=transceiver)
+    receiver = Receiver()
+    radio.register_message_receiver(receiver)
+
+    devices = [ VirtualDevice(ether, 'V%04d' % idx, 101 if idx % 2 else 100, interval=5.0) for idx in xrange(count) ]
+    radio.start()
+    for device in devices:
+        device.start()
+    try:
+        deadline = time.time() + 60.0 + count
+        while len(receiver.dispatched) < count and time.time() < deadline:
+            time.sleep(0.1)
+        print 'Virtual devices:', count, '| registered:', len(receiver.described), '| air latency (ms):', ether.latency * 1000.0
+
+        tm_start, cpu_start = time.time(), cpu_time()
+        time.sleep(idle)
+        print 'Idle CPU usage: %.1f %%' % ((cpu_time() - cpu_start) * 100.0 / (time.time() - tm_start))
+
+        latencies = []
+        for idx in xrange(reports):
+            device = devices[idx % count]
+            with receiver.condition:
+                previous = receiver.dispatched.get(device.serial)
+                sent = time.time()
+                ether.loop.call_soon_threadsafe(device.report_state)
+                while receiver.dispatched.get(device.serial) == previous and time.time() < sent + 2.0:
+                    receiver.condition.wait(2.0)
+                if receiver.dispatched.get(device.serial) != previous:
+                    latencies.append(receiver.dispatched[device.serial] - sent)
+            time.sleep(0.05)
+
+        latencies.sort()
+        if latencies:
+            print 'RX to dispatch latency (ms): median %.2f | 90%% %.2f | max %.2f | lost %d' % (
+                  latencies[len(latencies) / 2] * 1000.0, latencies[len(latencies) * 9 / 10] * 1000.0,
+                  latencies[-1] * 1000.0, reports - len(latencies))
+
+        switched, tm_start = 0, time.time()
+        for idx in xrange(scenes):
+            command = idx % 2 == 0
+            for device in devices:
+                radio.send_message(device.serial, [ chr(0x00), chr(0x01 if command else 0x00) ])
+            expected = dict( (d.serial, d.ON_STATES[d.type_id] if command else 0x00) for d in devices )
+            with receiver.condition:
+                while receiver.states != expected and time.time() < tm_start + 60.0:
+                    receiver.condition.wait(0.002) # short: timed waits poll on Python 2
+                if receiver.states != expected:
+                    break
+            switched += count
+        elapsed = time.time() - tm_start
+        print 'Scenes: %d commands in %.2f s | %.1f commands/s' % (switched, elapsed, switched / elapsed)
+    finally:
+        for device in devices:
+            device.stop()
+        radio.stop()
+        time.sleep(0.5)
+        ether.stop()
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20,
+         float(sys.argv[2]) if len(sys.argv) > 2 else 5.0,
+         int(sys.argv[3]) if len(sys.argv) > 3 else 100,
+         int(sys.argv[4]) if len(sys.argv) > 4 else 10)
@@ -0,0 +1,78 @@
+'''
+Created on Oct 19, 2026
+
+Benchmark of the number of datagrams per second received and
+handled by the UDP handler during a burst of messages from several
+senders, like many clients reconnecting at the same time.
+Datagrams dropped by the kernel (full receive buffer) are reported too.
+
+Usage: python benchudp.py [senders] [datagrams per sender] [receive buffer sizes, comma separated]
+
+@author: Viktor Adam
+'''
+
+import multiprocessing
+import socket
+import sys
+import threading
+import time
+
+from modules.comm import Header
+from modules.comm.evloop import EventLoop
+from modules.comm.udp import UDPHandler
+
+def sender(port, count, start):
+    ''' Sends the datagrams as fast as possible. '''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    datagram = chr(Header.MSG_A_KEEPALIVE) + chr(0) + 'x' * 64
+    start.wait()
+    for x in xrange(count):  # @UnusedVariable
+        sock.sendto(datagram, ('127.0.0.1', port))
+    sock.close()
+
+def measure(senders, count, receive_buffer, loop):
+    ''' Returns the datagrams handled per second, the number of them and the kernel drops. '''
+    handled = [ 0, 0.0 ]
+    def count_message(handler, sender, header, data):
+        handled[0] += 1
+        handled[1] = time.time()
+
+    handler = UDPHandler('127.0.0.1', 0, count_message, receive_buffer=receive_buffer, loop=loop)
+    handler.start()
+    try:
+        start = multiprocessing.Event()
+        processes = [ multiprocessing.Process(target=sender, args=(handler.port, count, start)) for x in xrange(senders) ]  # @UnusedVariable
+        for p in processes:
+            p.start()
+
+        tm_start = time.time()
+        start.set()
+        for p in processes:
+            p.join()
+        time.sleep(0.5) # the rest of the buffered datagrams
+
+        elapsed = max(handled[1] - tm_start, 0.001)
+        return handled[0] / elapsed, handled[0], handler.kernel_drops()
+    finally:
+        handler.stop()
+
+def main(senders, count, receive_buffers):
+    print 'Senders:', senders, '| Datagrams per sender:', count
+    print '%-12s | %-14s | %14s | %10s | %12s' % ('Receiver', 'Receive buffer', 'Datagrams/s', 'Handled', 'Kernel drops')
+
+    for receive_buffer in receive_buffers:
+        rate, total, drops = measure(senders, count, receive_buffer, None)
+        print '%-12s | %-14s | %14.1f | %10d | %12s' % ('thread', receive_buffer or 'default', rate, total, drops)
+
+        loop = EventLoop('Bench|EventLoop')
+        loop.start()
+        try:
+            rate, total, drops = measure(senders, count, receive_buffer, loop)
+            print '%-12s | %-14s | %14.1f | %10d | %12s' % ('event loop', receive_buffer or 'default', rate, total, drops)
+        finally:
+            loop.stop()
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 4,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 50000,
+         [ int(b) or None for b in sys.argv[3].split(',') ] if len(sys.argv) > 3 else [ None, 4194304 ])
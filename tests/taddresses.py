@@ -0,0 +1,75 @@
+'''
+Created on Oct 19, 2026
+
+@author: Viktor Adam
+'''
+
+import time
+import unittest
+
+from modules.radio import AddressBook
+
+class Test(unittest.TestCase):
+
+    def testAssign(self):
+        book = AddressBook()
+        self.assertEquals(book.assign('A', 0), 1)
+        self.assertEquals(book.assign('B', 0), 2)
+        self.assertEquals(book.assign('A', 1), 1)  # registered again
+
+        self.assertEquals(book.address_of('B'), 2)
+        self.assertEquals(book.unique_id_of(2), 'B')
+        self.assertEquals(book.address_of('C'), None)
+        self.assertEquals(book.unique_id_of(3), None)
+        self.assertTrue('A' in book)
+        self.assertEquals(len(book), 2)
+
+    def testRelease(self):
+        book = AddressBook(first=1, last=3)
+        for unique_id in 'ABC':
+            book.assign(unique_id, 0)
+        self.assertEquals(book.assign('D', 0), None)
+
+        book.release('B')
+        self.assertEquals(book.unique_id_of(2), None)
+        self.assertFalse('B' in book)
+        self.assertEquals(book.assign('D', 0), 2)
+        self.assertEquals(book.unique_id_of(2), 'D')
+
+    def testReclaim(self):
+        book = AddressBook(first=1, last=2, reclaim_after=100)
+        book.assign('A', 0)
+        book.assign('B', 10)
+        self.assertEquals(book.assign('C', 50), None)  # nobody is silent for long
+
+        book.heard(1, 60)
+        self.assertEquals(book.assign('C', 100), None)
+        self.assertEquals(book.assign('C', 110), 2)     # B was heard least recently
+        self.assertEquals(book.reclaimed, 1)
+        self.assertEquals(book.address_of('B'), None)
+        self.assertEquals(book.unique_id_of(2), 'C')
+
+        book.heard(7, 120)  # unknown address
+        self.assertEquals(book.assign('D', 159), None)
+        self.assertEquals(book.assign('D', 160), 1)
+
+    def testWallClockStep(self):
+        book = AddressBook(first=1, last=1, reclaim_after=100)
+        book.assign('A')
+
+        original = time.time
+        time.time = lambda: original() + 3600.0     # NTP sets the clock forward
+        try:
+            self.assertEquals(book.assign('B'), None)
+            self.assertEquals(book.reclaimed, 0)
+        finally:
+            time.time = original
+
+    def testNeverReclaim(self):
+        book = AddressBook(first=1, last=1)
+        book.assign('A', 0)
+        self.assertEquals(book.assign('B', 10 ** 9), None)
+        self.assertEquals(book.reclaimed, 0)
+
+if __name__ == "__main__":
+    unittest.main()
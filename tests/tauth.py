@@ -0,0 +1,188 @@
+'''
+Created on Oct 19, 2026
+
+@author: Viktor Adam
+'''
+
+import hashlib
+import threading
+import time
+import unittest
+
+from modules.auth import Authentication, SessionStore, hash_password, verify_password
+from modules.comm.udp import UDPHandler
+from util.database import Database
+from util import sysargs
+
+PASSWORD = hashlib.md5('secret').hexdigest()
+
+class Test(unittest.TestCase):
+
+    def testExpiry(self):
+        store = SessionStore(idle_timeout=10.0, max_age=100.0)
+        now = time.time()
+        idle = store.create(1)
+        active = store.create(2)
+
+        for x in xrange(1, 12):
+            self.assertIsNotNone(store.get(active.session_id, now + x * 9))
+        self.assertIsNone(store.get(idle.session_id, now + 11))
+        self.assertIsNone(store.get(active.session_id, now + 101))   # too old
+        self.assertEquals( (store.expired, len(store)), (2, 0) )
+
+    def testEviction(self):
+        store = SessionStore(max_sessions=3)
+        sessions = [ store.create(uid) for uid in xrange(4) ]
+        self.assertNotIn(sessions[0].session_id, store)
+        self.assertEquals(store.evicted, 1)
+
+        store.get(sessions[1].session_id)                            # used recently
+        store.create(4)
+        self.assertIn(sessions[1].session_id, store)
+        self.assertNotIn(sessions[2].session_id, store)
+
+        store.remove_user(3)
+        self.assertNotIn(sessions[3].session_id, store)
+
+    def testListeners(self):
+        store = SessionStore(idle_timeout=10.0, max_sessions=3)
+        removed = []
+        store.add_listener(removed.append)
+        sessions = [ store.create(uid) for uid in xrange(4) ]
+        store.remove(sessions[1].session_id)
+        store.remove(sessions[1].session_id)                         # unknown: not notified
+        store.remove_user(2)
+        store.expire(time.time() + 11)
+
+        self.assertEquals(removed, [ [ sessions[0].session_id ], [ sessions[1].session_id ],
+                                     [ sessions[2].session_id ], [ sessions[3].session_id ] ])
+
+        store.remove_listener(removed.append)
+        store.remove(store.create(5).session_id)
+        self.assertEquals(len(removed), 4)
+
+    def testPersistence(self):
+        database = Database.in_memory_instance('tauth')
+        try:
+            store = SessionStore(database, idle_timeout=60.0)
+            kept = store.create(1)
+            removed = store.create(2)
+            store.remove(removed.session_id)
+            store.get(kept.session_id, time.time() + 30)
+            store.flush()
+
+            restarted = SessionStore(database, idle_timeout=60.0)
+            self.assertEquals(len(restarted), 1)
+            session = restarted.get(kept.session_id, kept.created + 85)   # active 55 seconds before
+            self.assertEquals(session.user_id, 1)
+
+            time.sleep(0.01)
+            restarted = SessionStore(database, max_age=0.005)         # expired while stopped
+            self.assertEquals( (len(restarted), restarted.expired), (0, 1) )
+        finally:
+            database.close()
+
+    def testHandler(self):
+        store = SessionStore()
+        session = store.create(1)
+
+        handler = UDPHandler('127.0.0.1', 0, lambda h, s, header, data: None)
+        handler.session_validator = lambda session_id: store.get(session_id) is not None
+        handler.start()
+        try:
+            sender = ('127.0.0.1', 1001)
+            handler.authentication_succeeded(session.session_id, sender)
+            self.assertTrue(handler.is_valid_session(session.session_id + 'message', sender))
+
+            store.remove_user(1)
+            self.assertFalse(handler.is_valid_session(session.session_id + 'message', sender))
+            self.assertEquals(handler.broadcast_targets(), [])
+        finally:
+            handler.stop()
+
+    def testHashing(self):
+        stored = hash_password(PASSWORD, iterations=1000)
+        self.assertNotIn(PASSWORD, stored)
+        self.assertEquals(verify_password(PASSWORD, stored), (True, True))   # fewer iterations than configured
+        self.assertEquals(verify_password(PASSWORD, hash_password(PASSWORD)), (True, False))
+        self.assertFalse(verify_password(hashlib.md5('other').hexdigest(), stored)[0])
+        self.assertEquals(verify_password(PASSWORD, PASSWORD), (True, True))  # legacy MD5
+
+    def testCredentials(self):
+        iterations = sysargs.auth.hash_iterations
+        Database.TEST_USE_IN_MEMORY_AS_DEFAULT = True
+        sysargs.auth.hash_iterations = 1000
+        database = Database.instance()
+        try:
+            auth = Authentication()
+            auth.initialize()
+            auth.configure(database)
+
+            self.assertTrue(auth.create_user('User', PASSWORD))
+            uid = [ u for u, name, admin in auth.list_users() if name == 'user' ][0]
+            database.write('UPDATE auth SET password = ? WHERE uid = ?', PASSWORD, uid)   # legacy MD5
+
+            self.assertIsNotNone(auth.authenticate('user', PASSWORD))
+            stored = database.select('SELECT password FROM auth WHERE uid = ?', uid).fetchone()[0]
+            self.assertTrue(stored.startswith('pbkdf2_sha256$'))   # upgraded on login
+
+            self.assertIsNone(auth.authenticate('user', hashlib.md5('other').hexdigest()))
+            self.assertIsNotNone(auth.authenticate('USER', PASSWORD))   # cached
+
+            self.assertTrue(auth.edit_user(uid, 'user', hashlib.md5('new').hexdigest()))
+            self.assertIsNone(auth.authenticate('user', PASSWORD))
+            self.assertIsNotNone(auth.authenticate('user', hashlib.md5('new').hexdigest()))
+
+            auth.delete_user(uid)
+            self.assertIsNone(auth.authenticate('user', hashlib.md5('new').hexdigest()))
+        finally:
+            sysargs.auth.hash_iterations = iterations
+            Database.TEST_USE_IN_MEMORY_AS_DEFAULT = False
+            database.close()
+
+    def testUsers(self):
+        Database.TEST_USE_IN_MEMORY_AS_DEFAULT = True
+        database = Database.instance()
+        try:
+            auth = Authentication()
+            auth.initialize()
+            auth.configure(database)
+            auth.create_user('bob', PASSWORD)
+
+            changes = []
+            auth.users.add_listener(changes.extend)
+            auth.create_user('Alice', PASSWORD)
+            alice = [ u for u, name, admin in auth.list_users() if name == 'alice' ][0]
+            auth.edit_user(alice, 'carol', PASSWORD)
+            auth.delete_user(alice)
+
+            self.assertEquals(changes, [ (alice, 'alice', 0), (alice, 'carol', 0), (alice, None, None) ])
+
+            # unknown users are not edited
+            self.assertFalse(auth.edit_user(999, 'ghost', PASSWORD))
+            self.assertFalse(auth.edit_user(alice, 'ghost', PASSWORD))
+            self.assertEquals(len(changes), 3)
+
+            # the listeners are notified out of the database writer lock
+            blocked, lock = [], database._Database__wr_lock
+            def listener(changes):
+                writer = threading.Thread(target=lambda: lock.acquire() and lock.release())
+                writer.start()
+                writer.join(2.0)
+                blocked.append(writer.is_alive())
+            auth.users.add_listener(listener)
+            auth.create_user('dave', PASSWORD)
+            dave = [ u for u, name, admin in auth.list_users() if name == 'dave' ][0]
+            auth.edit_user(dave, 'erin', PASSWORD)
+            auth.delete_user(dave)
+            self.assertEquals(blocked, [ False, False, False ])
+            self.assertEquals([ (name, admin) for u, name, admin in auth.list_users() ], [ ('admin', 1), ('bob', 0) ])
+            self.assertEquals(list(auth.list_users()),
+                              [ tuple(row) for row in database.select('SELECT uid, username, administrator FROM auth '
+                                                                      'ORDER BY administrator DESC, username ASC') ])
+        finally:
+            Database.TEST_USE_IN_MEMORY_AS_DEFAULT = False
+            database.close()
+
+if __name__ == "__main__":
+    unittest.main()
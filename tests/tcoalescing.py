@@ -0,0 +1,94 @@
+'''
+Created on Oct 19, 2026
+
+@author: Viktor Adam
+'''
+
+import threading
+import time
+import unittest
+
+from modules.comm.coalescing import StateCoalescer
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.batches = []
+        self.flushed = threading.Event()
+
+    def flush(self, items):
+        self.batches.append( (time.time(), items) )
+        self.flushed.set()
+
+    def create(self, window, max_latency):
+        coalescer = StateCoalescer(self.flush, window=window, max_latency=max_latency)
+        coalescer.start()
+        self.addCleanup(coalescer.stop)
+        return coalescer
+
+    def testQuietWindow(self):
+        coalescer = self.create(0.2, 5.0)
+        started = time.time()
+        coalescer.submit('A', 1)
+        time.sleep(0.1)
+        coalescer.submit('B', 2)
+        self.assertEquals(self.batches, [])
+
+        self.assertTrue(self.flushed.wait(2.0))
+        flushed, items = self.batches[0]
+        self.assertEquals(items, [ 1, 2 ])
+        self.assertTrue(flushed - started >= 0.3)   # the window restarted on the second change
+
+    def testMaxLatency(self):
+        coalescer = self.create(0.2, 0.5)
+        started = time.time()
+        while not self.flushed.is_set() and time.time() < started + 2.0:
+            coalescer.submit('A', time.time())      # never quiet for a whole window
+            time.sleep(0.05)
+
+        self.assertTrue(self.flushed.is_set())
+        flushed, _ = self.batches[0]
+        self.assertTrue(0.5 <= flushed - started < 1.0)
+
+    def testLatestStatePerKey(self):
+        coalescer = self.create(0.1, 1.0)
+        for item in [ ('A', 1), ('B', 2), ('A', 3), ('C', 4), ('B', 5) ]:
+            coalescer.submit(*item)
+
+        self.assertTrue(self.flushed.wait(2.0))
+        self.assertEquals(self.batches[0][1], [ 3, 5, 4 ])
+
+    def testFlushOnStop(self):
+        coalescer = self.create(10.0, 10.0)
+        coalescer.submit('A', 1)
+        coalescer.submit('B', 2)
+        coalescer.stop()
+
+        self.assertTrue(self.flushed.wait(2.0))
+        self.assertEquals(self.batches[0][1], [ 1, 2 ])
+
+        # changes after stopping are flushed right away
+        coalescer.submit('C', 3)
+        self.assertEquals(self.batches[-1][1], [ 3 ])
+        self.assertEquals(len(self.batches), 2)
+
+    def testWallClockStep(self):
+        coalescer = self.create(0.1, 0.5)
+        coalescer.submit('A', 1)
+
+        original = time.time
+        time.time = lambda: original() - 3600.0     # NTP sets the clock back
+        try:
+            self.assertTrue(self.flushed.wait(2.0))
+        finally:
+            time.time = original
+        self.assertEquals(self.batches[0][1], [ 1 ])
+
+    def testDisabled(self):
+        coalescer = self.create(0, 0)
+        coalescer.submit('A', 1)
+        coalescer.submit('A', 2)
+        self.assertEquals([ items for _, items in self.batches ], [ [ 1 ], [ 2 ] ])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+'''
+Created on Oct 19, 2026
+
+@author: Viktor Adam
+'''
+
+import socket
+import struct
+import threading
+import time
+import unittest
+
+from modules.comm import Header
+from modules.comm.connections import ConnectionRegistry, TimerWheel, PeriodicExpiry
+from modules.comm.evloop import EventLoop
+from modules.comm.evtcp import EventTCPHandler
+from modules.comm.tcp import TCPHandler
+from util import clock
+
+class Test(unittest.TestCase):
+
+    def testTimerWheel(self):
+        wheel = TimerWheel(tick=1.0, slots=8, now=1000.0)
+        wheel.schedule('a', 1002.5)
+        wheel.schedule('b', 1005.0)
+        wheel.schedule('c', 1030.0)     # more than a revolution ahead
+
+        self.assertEquals(wheel.advance(1002.0), [])
+        self.assertEquals(wheel.advance(1003.0), [ 'a' ])
+        self.assertEquals(wheel.advance(1010.0), [ 'b' ])
+        self.assertEquals(wheel.advance(1029.0), [])
+        self.assertEquals(wheel.advance(1100.0), [ 'c' ])
+
+    def testLimits(self):
+        registry = ConnectionRegistry(max_connections=3, max_per_address=2)
+        self.assertTrue(registry.add('c1', '10.0.0.1'))
+        self.assertTrue(registry.add('c2', '10.0.0.1'))
+        self.assertFalse(registry.add('c3', '10.0.0.1'))
+        self.assertTrue(registry.add('c4', '10.0.0.2'))
+        self.assertFalse(registry.add('c5', '10.0.0.3'))
+
+        registry.remove('c1')
+        self.assertTrue(registry.add('c6', '10.0.0.1'))
+        self.assertEquals(sorted(registry.snapshot()), [ 'c2', 'c4', 'c6' ])
+
+    def testIdleExpiry(self):
+        registry = ConnectionRegistry(idle_timeout=0.4, tick=0.05)
+        registry.add('idle', '10.0.0.1')
+        registry.add('active', '10.0.0.1')
+
+        expired = []
+        for x in xrange(12):  # @UnusedVariable
+            time.sleep(0.05)
+            registry.touch('active')
+            expired.extend(registry.expire())
+
+        self.assertEquals(expired, [ 'idle' ])
+
+    def testPeriodicExpiry(self):
+        def check(start):
+            batches, passed, done = [ [ 'a', 'b' ], [ 'c' ] ], [], threading.Event()
+            def callback(item):
+                passed.append(item)
+                if item == 'a':
+                    raise ValueError('failed')   # the other items are passed anyway
+                if item == 'c':
+                    done.set()
+
+            expiry = PeriodicExpiry(lambda: batches.pop(0) if batches else [], 0.05, 'Expired:', 'test')
+            start(expiry, callback)
+            try:
+                self.assertTrue(done.wait(2.0))
+            finally:
+                expiry.stop()
+            self.assertEquals(passed, [ 'a', 'b', 'c' ])
+
+        check(lambda expiry, callback: expiry.start(callback, 'Test|Expiry'))
+
+        loop = EventLoop('Test|EventLoop')
+        loop.start()
+        try:
+            check(lambda expiry, callback: expiry.start_on_loop(loop, callback))
+        finally:
+            loop.stop()
+
+    def testWallClockJump(self):
+        registry = ConnectionRegistry(idle_timeout=0.4, tick=0.05)
+        registry.add('conn', '10.0.0.1')
+
+        original = time.time
+        time.time = lambda: original() + 3600.0     # NTP sets the clock forward
+        try:
+            time.sleep(0.1)
+            self.assertEquals(registry.expire(), [])
+        finally:
+            time.time = original
+
+        previous = clock.monotonic()
+        for x in xrange(1000):  # @UnusedVariable
+            now = clock.monotonic()
+            self.assertTrue(now >= previous)
+            previous = now
+
+    def checkHandler(self, handler_class, port_attribute):
+        def respond(handler, sender, header, data):
+            handler.send(header, None, sender)
+
+        handler = handler_class('127.0.0.1', 0, respond, max_connections=10, max_per_address=2, idle_timeout=0.5)
+        handler.start()
+        port = getattr(handler, port_attribute).getsockname()[1]
+
+        idle   = socket.create_connection( ('127.0.0.1', port) )
+        active = socket.create_connection( ('127.0.0.1', port) )
+        refused = socket.create_connection( ('127.0.0.1', port) )
+        for c in (idle, active, refused):
+            c.settimeout(3.0)
+        try:
+            self.assertEquals(refused.recv(16), '')    # closed above the per address limit
+
+            for x in xrange(10):  # @UnusedVariable
+                active.sendall(struct.pack('!BH', Header.MSG_A_KEEPALIVE, 0))
+                self.assertEquals(active.recv(16), struct.pack('!BH', Header.MSG_A_KEEPALIVE, 0))
+                time.sleep(0.2)
+
+            self.assertEquals(idle.recv(16), '')       # closed by the reaper
+            self.assertEquals(len(handler.broadcast_targets()), 1)
+        finally:
+            for c in (idle, active, refused):
+                c.close()
+            handler.stop()
+
+    def testHandlerThreaded(self):
+        self.checkHandler(TCPHandler, '_TCPHandler__server_socket')
+
+    def testHandlerEventLoop(self):
+        self.checkHandler(EventTCPHandler, '_EventTCPHandler__server_socket')
+
+if __name__ == "__main__":
+    unittest.main()
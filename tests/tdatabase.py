@@ -5,6 +5,8 @@ Created on Jun 24, 2013
 '''
 
 import os
+import signal
+import threading
 import unittest
 import traceback
 
@@ -114,5 +116,36 @@ class DatabaseTest(unittest.TestCase):
         
         self.assertEquals(len(thread_exceptions), 0, 'Exceptions: ' + str(thread_exceptions))
     
+    def testResetAfterFork(self):
+        ''' a writer session held by a thread at the fork does not block the child '''
+        db = Database.instance(self.path)
+        db.write('create table test(a)')
+        
+        entered, release = threading.Event(), threading.Event()
+        def hold_writer():
+            with db.writer():
+                entered.set()
+                release.wait()
+        holder = threading.Thread(target=hold_writer)
+        holder.start()
+        entered.wait()
+        
+        try:
+            pid = os.fork()
+            if pid == 0:
+                signal.alarm(5)
+                try:
+                    Database.reset_after_fork()
+                    with db.writer():
+                        db.write('insert into test values (1)')
+                finally:
+                    os._exit(0)
+            self.assertEquals(os.waitpid(pid, 0)[1], 0)
+        finally:
+            release.set()
+            holder.join()
+        
+        self.assertEquals(db.select('select count(*) from test').fetchone()[0], 1)
+    
 if __name__ == "__main__":
     unittest.main()
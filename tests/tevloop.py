@@ -0,0 +1,126 @@
+'''
+Created on Oct 19, 2026
+
+@author: Viktor Adam
+'''
+
+import socket
+import struct
+import threading
+import time
+import unittest
+
+from modules.comm import Header
+from modules.comm.evloop import EventLoop
+from modules.comm.evtcp import EventTCPHandler
+from modules.comm.executor import HandlerExecutor
+from modules.comm.udp import UDPHandler
+
+from tevtcp import frame, read_frames
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = EventLoop('Test|EventLoop')
+        self.executor = HandlerExecutor(4, 'Test|Executor')
+        self.loop.start()
+        self.executor.start()
+
+    def tearDown(self):
+        self.executor.stop()
+        self.loop.stop()
+
+    def testTimers(self):
+        fired, done = [], threading.Event()
+        self.loop.call_later(0.2, fired.append, 'late')
+        cancelled = self.loop.call_later(0.1, fired.append, 'cancelled')
+        self.loop.call_later(0.05, fired.append, 'early')
+        self.loop.call_later(0.3, done.set)
+        EventLoop.cancel(cancelled)
+
+        self.assertTrue(done.wait(5.0))
+        self.assertEquals(fired, [ 'early', 'late' ])
+
+    def testWallClockStep(self):
+        done = threading.Event()
+        self.loop.call_later(0.2, done.set)
+        original = time.time
+        time.time = lambda: original() - 3600.0     # NTP sets the clock back
+        try:
+            self.assertTrue(done.wait(2.0))
+        finally:
+            time.time = original
+
+    def testExecutorOrdering(self):
+        results, lock = { }, threading.Lock()
+        def record(key, value):
+            time.sleep(0.001)
+            with lock:
+                results.setdefault(key, []).append( (value, threading.current_thread().name) )
+
+        for value in xrange(50):
+            for key in ('a', 'b', 'c'):
+                self.executor.submit(key, record, key, value)
+        self.executor.stop()
+        self.executor.start()
+
+        threads = set()
+        for key in ('a', 'b', 'c'):
+            self.assertEquals([ value for value, thread in results[key] ], range(50))  # @UnusedVariable
+            threads.update(thread for value, thread in results[key])  # @UnusedVariable
+        self.assertTrue(len(threads) > 1)
+
+    def testSharedLoop(self):
+        threads = set()
+        def echo(handler, sender, header, data):
+            threads.add(threading.current_thread().name)
+            handler.send(header, 'echo:' + data, sender)
+
+        tcp = EventTCPHandler('127.0.0.1', 0, echo, loop=self.loop, executor=self.executor)
+        udp = UDPHandler('127.0.0.1', 0, echo, loop=self.loop, executor=self.executor)
+        tcp.start()
+        udp.start()
+        try:
+            c = socket.create_connection( ('127.0.0.1', tcp._EventTCPHandler__server_socket.getsockname()[1]) )
+            c.sendall(''.join(frame(Header.MSG_A_LIST_DEVICES, str(idx), idx) for idx in xrange(20)))
+            self.assertEquals(read_frames(c, 20), [ (Header.MSG_A_LIST_DEVICES, 'echo:' + str(idx), idx)
+                                                    for idx in xrange(20) ])
+            c.close()
+
+            u = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            u.settimeout(5.0)
+            u.sendto(chr(Header.MSG_A_KEEPALIVE) + chr(0) + 'ping',
+                     ('127.0.0.1', udp._UDPHandler__udp_socket.getsockname()[1]))
+            self.assertEquals(u.recv(1500), chr(Header.MSG_A_KEEPALIVE) + chr(0) + 'echo:ping')
+            u.close()
+        finally:
+            udp.stop()
+            tcp.stop()
+
+        self.assertTrue(threads)
+        self.assertTrue(all(name.startswith('Test|Executor|') for name in threads))
+
+    def testBackpressure(self):
+        handled = [ 0 ]
+        def respond(handler, sender, header, data):
+            handled[0] += 1
+            handler.send(header, 'x' * 60000, sender)
+
+        tcp = EventTCPHandler('127.0.0.1', 0, respond, loop=self.loop, executor=self.executor, max_pending=8)
+        tcp.start()
+        try:
+            c = socket.create_connection( ('127.0.0.1', tcp._EventTCPHandler__server_socket.getsockname()[1]) )
+            request = frame(Header.MSG_A_LIST_DEVICES, 'r' * 1000)
+            sender = threading.Thread(target=c.sendall, args=(request * 400, ))
+            sender.start()              # the responses are not read
+            time.sleep(1.0)
+
+            self.assertTrue(handled[0] < 400, handled[0])   # stopped reading the client
+            self.assertEquals(len(read_frames(c, 400, timeout=20.0)), 400)
+            sender.join()
+            c.close()
+        finally:
+            tcp.stop()
+
+if __name__ == "__main__":
+    unittest.main()
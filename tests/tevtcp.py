@@ -0,0 +1,142 @@
+'''
+Created on Oct 19, 2026
+
+@author: Viktor Adam
+'''
+
+import socket
+import struct
+import threading
+import time
+import unittest
+
+from modules.comm import Header
+from modules.comm.evtcp import EventTCPHandler
+
+def frame(header, data, request_id=None):
+    if request_id is not None:
+        data = chr(0x02) + struct.pack('!I', request_id) + chr(header) + data
+        header = Header.MSG_X_EXTENDED
+    return chr(header) + struct.pack('!H', len(data)) + data
+
+def read_frames(sock, count, timeout=10.0):
+    ''' Reads the given number of frames: (header, data, request_id) tuples. '''
+    sock.settimeout(timeout)
+    buf, frames = '', []
+    while len(frames) < count:
+        if len(buf) >= 3 and len(buf) >= 3 + struct.unpack('!H', buf[1:3])[0]:
+            length = struct.unpack('!H', buf[1:3])[0]
+            header, data, buf = ord(buf[0]), buf[3:3 + length], buf[3 + length:]
+            request_id = None
+            if header == Header.MSG_X_EXTENDED:
+                request_id = struct.unpack('!I', data[1:5])[0]
+                header, data = ord(data[5]), data[6:]
+            frames.append( (header, data, request_id) )
+        else:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            buf += chunk
+    return frames
+
+class Test(unittest.TestCase):
+
+    IDLE_CLIENTS  = 300
+    BUSY_CLIENTS  = 50
+    REQUESTS      = 40
+
+    def setUp(self):
+        self.threads = set()
+
+        def echo(handler, sender, header, data):
+            self.threads.add(threading.current_thread().name)
+            handler.send(header, 'echo:' + data, sender)
+
+        self.handler = EventTCPHandler('127.0.0.1', 0, echo, max_connections=1000, max_per_address=1000)
+        self.handler.start()
+        self.port = self.handler._EventTCPHandler__server_socket.getsockname()[1]
+        self.clients = []
+
+    def tearDown(self):
+        for c in self.clients:
+            c.close()
+        self.handler.stop()
+
+    def connect(self):
+        c = socket.create_connection( ('127.0.0.1', self.port) )
+        self.clients.append(c)
+        return c
+
+    def wait_for_connections(self, count):
+        for x in xrange(100):  # @UnusedVariable
+            if len(self.handler.broadcast_targets()) >= count:
+                return
+            time.sleep(0.05)
+        self.fail('Connections not accepted: ' + str(len(self.handler.broadcast_targets())))
+
+    def testSplitFrames(self):
+        c = self.connect()
+        data = frame(Header.MSG_A_LIST_DEVICES, 'abc', 7) + frame(Header.MSG_A_LIST_DEVICES, 'def')
+        for idx in xrange(len(data)):
+            c.sendall(data[idx])
+            time.sleep(0.002)
+
+        frames = read_frames(c, 2)
+        self.assertEquals(frames, [ (Header.MSG_A_LIST_DEVICES, 'echo:abc', 7),
+                                    (Header.MSG_A_LIST_DEVICES, 'echo:def', None) ])
+
+    def testLoad(self):
+        idle = [ self.connect() for x in xrange(Test.IDLE_CLIENTS) ]  # @UnusedVariable
+        busy = [ self.connect() for x in xrange(Test.BUSY_CLIENTS) ]  # @UnusedVariable
+        self.wait_for_connections(Test.IDLE_CLIENTS + Test.BUSY_CLIENTS)
+
+        # pipelined requests in a single write per client
+        for cidx, c in enumerate(busy):
+            c.sendall(''.join(frame(Header.MSG_A_LIST_DEVICES, '%d-%d' % (cidx, ridx), ridx)
+                              for ridx in xrange(Test.REQUESTS)))
+
+        for cidx, c in enumerate(busy):
+            frames = read_frames(c, Test.REQUESTS)
+            self.assertEquals(frames, [ (Header.MSG_A_LIST_DEVICES, 'echo:%d-%d' % (cidx, ridx), ridx)
+                                        for ridx in xrange(Test.REQUESTS) ])
+
+        self.handler.broadcast(Header.MSG_A_STATE_CHANGED, 'state' * 10)
+        for c in idle + busy:
+            self.assertEquals(read_frames(c, 1), [ (Header.MSG_A_STATE_CHANGED, 'state' * 10, None) ])
+
+        self.assertEquals(self.threads, set([ 'TCP|EventLoop' ]))
+
+    def testDisconnect(self):
+        c = self.connect()
+        self.wait_for_connections(1)
+        c.close()
+        for x in xrange(100):  # @UnusedVariable
+            if not self.handler.broadcast_targets():
+                break
+            time.sleep(0.02)
+        self.assertEquals(self.handler.broadcast_targets(), [])
+
+    def testDeferredCloseAfterReuse(self):
+        c = self.connect()
+        self.wait_for_connections(1)
+        old = self.handler.broadcast_targets()[0]
+        c.close()
+        for x in xrange(100):  # @UnusedVariable
+            if not self.handler.broadcast_targets():
+                break
+            time.sleep(0.02)
+
+        c = self.connect()
+        self.wait_for_connections(1)
+        new = self.handler.broadcast_targets()[0]
+        self.assertEquals(new.fileno, old.fileno) # the descriptor was reused
+
+        # a late close of the old connection (like after a failed authentication)
+        self.handler.authentication_failed(old)
+        time.sleep(0.1) # executed on the loop before the next request
+        c.sendall(frame(Header.MSG_A_LIST_DEVICES, 'alive'))
+        self.assertEquals(read_frames(c, 1), [ (Header.MSG_A_LIST_DEVICES, 'echo:alive', None) ])
+        self.assertEquals(self.handler.broadcast_targets(), [ new ])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+'''
+Created on Oct 19, 2026
+
+@author: Viktor Adam
+'''
+
+import random
+import socket
+import struct
+import threading
+import unittest
+
+from modules.comm import ClientOptions, Header
+from modules.comm.evtcp import EventTCPHandler
+from modules.comm.framing import FrameDecoder, frame_prefix
+from modules.comm.tcp import TCPHandler
+
+def frame(header, data, extended_length=False):
+    return frame_prefix(header, len(data), extended_length) + data
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.random = random.Random(1389)
+        self.messages = [ (0xA0 + (idx % 16), ''.join(chr(self.random.randint(0, 255))
+                                                         for x in xrange(self.random.choice([ 0, 1, 5, 300, 5000, 65535 ]))))  # @UnusedVariable
+                          for idx in xrange(40) ]
+        self.stream = ''.join(frame(h, d) for h, d in self.messages)
+
+    def segments(self):
+        ''' Splits the stream at random positions, including single byte chunks. '''
+        result, offset = [], 0
+        while offset < len(self.stream):
+            size = self.random.choice([ 1, 2, 3, 7, 100, 4096, 70000 ])
+            result.append(self.stream[offset:offset + size])
+            offset += size
+        return result
+
+    def testRandomSegmentation(self):
+        for x in xrange(20):  # @UnusedVariable
+            decoder = FrameDecoder(self.random.choice([ 16, 1024, 65536 ]))
+            decoded = []
+            for segment in self.segments():
+                decoder.feed(segment)
+                decoded.extend(decoder.frames())
+
+            self.assertEquals(decoded, self.messages)
+            self.assertEquals(decoder.pending(), 0)
+
+    def testPartialFrame(self):
+        decoder = FrameDecoder(16)
+        decoder.feed(frame(0xA1, 'complete') + frame(0xA2, 'partial')[:5])
+        self.assertEquals(list(decoder.frames()), [ (0xA1, 'complete') ])
+        self.assertEquals(decoder.pending(), 5)
+
+        decoder.feed(frame(0xA2, 'partial')[5:])
+        self.assertEquals(list(decoder.frames()), [ (0xA2, 'partial') ])
+
+    def testReceive(self):
+        reader, writer = socket.socketpair()
+
+        def write():
+            for segment in self.segments():
+                writer.sendall(segment)
+            writer.close()
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        try:
+            decoder, decoded = FrameDecoder(64), []
+            while decoder.receive(reader):
+                decoded.extend(decoder.frames())
+
+            self.assertEquals(decoded, self.messages)
+            self.assertEquals(decoder.pending(), 0)
+        finally:
+            thread.join()
+            reader.close()
+
+    def testExtendedLength(self):
+        messages = [ (0xA3, 'a' * 65534), (0xA3, 'b' * 65535), (0xA4, 'c' * 300000), (0xA5, 'd') ]
+        stream = ''.join(frame(h, d, True) for h, d in messages)
+        self.assertEquals(stream[65537:65537 + 7], struct.pack('!BHI', 0xA3, 0xFFFF, 65535))
+
+        decoder, decoded = FrameDecoder(1024, extended_length=True), []
+        offset = 0
+        while offset < len(stream):
+            size = self.random.choice([ 1, 4, 1000, 100000 ])
+            decoder.feed(stream[offset:offset + size])
+            decoded.extend(decoder.frames())
+            offset += size
+        self.assertEquals(decoded, messages)
+
+        # without negotiation 0xFFFF is a plain length and longer content is refused
+        decoder = FrameDecoder(1024)
+        decoder.feed(frame(0xA3, 'b' * 65535))
+        self.assertEquals(list(decoder.frames()), [ (0xA3, 'b' * 65535) ])
+        self.assertRaises(ValueError, frame_prefix, 0xA3, 65536)
+
+    def checkLargeResponse(self, handler_class, port_attribute):
+        content = ''.join(chr(self.random.randint(0, 255)) for x in xrange(70000)) * 20  # @UnusedVariable
+
+        def respond(handler, sender, header, data):
+            handler.set_options(sender, ClientOptions([ ClientOptions.XLEN ]))
+            handler.send(header, content, sender)
+
+        handler = handler_class('127.0.0.1', 0, respond)
+        handler.start()
+        client = socket.create_connection( ('127.0.0.1', getattr(handler, port_attribute).getsockname()[1]) )
+        client.settimeout(5.0)
+        try:
+            client.sendall(frame(Header.MSG_A_LIST_DEVICES, ''))
+            decoder, decoded = FrameDecoder(extended_length=True), []
+            while not decoded and decoder.receive(client):
+                decoded.extend(decoder.frames())
+            self.assertEquals(decoded, [ (Header.MSG_A_LIST_DEVICES, content) ])
+        finally:
+            client.close()
+            handler.stop()
+
+    def testLargeResponseThreaded(self):
+        self.checkLargeResponse(TCPHandler, '_TCPHandler__server_socket')
+
+    def testLargeResponseEventLoop(self):
+        self.checkLargeResponse(EventTCPHandler, '_EventTCPHandler__server_socket')
+
+    def checkTooLongResponse(self, handler_class, port_attribute):
+        def respond(handler, sender, header, data):
+            handler.push(Header.MSG_A_STATE_CHANGED, 'p' * 70000, sender)    # dropped
+            handler.send(header, 'r' * 70000, sender)
+
+        handler = handler_class('127.0.0.1', 0, respond)
+        handler.start()
+        client = socket.create_connection( ('127.0.0.1', getattr(handler, port_attribute).getsockname()[1]) )
+        client.settimeout(5.0)
+        try:
+            client.sendall(frame(Header.MSG_A_LIST_DEVICES, '') +
+                           frame(Header.MSG_X_EXTENDED, chr(0x02) + struct.pack('!I', 9) + chr(Header.MSG_A_LIST_DEVICES)))
+            decoder, decoded = FrameDecoder(), []
+            while len(decoded) < 2 and decoder.receive(client):
+                decoded.extend(decoder.frames())
+            self.assertEquals(decoded[0][0], Header.MSG_A_ERROR)
+            header, data = decoded[1]
+            self.assertEquals(header, Header.MSG_X_EXTENDED)
+            self.assertEquals(data[:6], chr(0x02) + struct.pack('!I', 9) + chr(Header.MSG_A_ERROR))
+        finally:
+            client.close()
+            handler.stop()
+
+    def testTooLongResponseThreaded(self):
+        self.checkTooLongResponse(TCPHandler, '_TCPHandler__server_socket')
+
+    def testTooLongResponseEventLoop(self):
+        self.checkTooLongResponse(EventTCPHandler, '_EventTCPHandler__server_socket')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+'''
+Created on Oct 19, 2026
+
+@author: Viktor Adam
+'''
+
+import socket
+import struct
+import time
+import unittest
+
+from modules.comm import Header
+from modules.comm.evtcp import EventTCPHandler
+from modules.comm.outbound import OutboundQueue, SlowConsumerPolicy
+from modules.comm.tcp import TCPHandler
+
+def read_frame(sock):
+    ''' Reads a single (not extended) frame from the socket. '''
+    def read(size):
+        data = ''
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise IOError('Connection closed')
+            data += chunk
+        return data
+    header, length = struct.unpack('!BH', read(3))
+    return header, read(length)
+
+class Test(unittest.TestCase):
+
+    def testResponsesAreKept(self):
+        queue = OutboundQueue(2, SlowConsumerPolicy.DISCONNECT)
+        for idx in xrange(5):
+            self.assertTrue(queue.put('rsp%d' % idx))
+        self.assertTrue(queue.put('push1', True))
+        self.assertTrue(queue.put('push2', True))
+        self.assertFalse(queue.put('push3', True))
+        self.assertEquals(len(queue), 7)
+
+    def testDropOldest(self):
+        queue = OutboundQueue(2, SlowConsumerPolicy.DROP_OLDEST)
+        queue.put('push1', True)
+        queue.put('rsp1')
+        queue.put('push2', True)
+        queue.put('push3', True)
+        self.assertEquals([ queue.pop() for x in xrange(4) ], [ 'rsp1', 'push2', 'push3', None ])  # @UnusedVariable
+        self.assertEquals(queue.dropped, 1)
+
+    def testCoalesce(self):
+        queue = OutboundQueue(2, SlowConsumerPolicy.COALESCE)
+        queue.put('a1', True, 'a')
+        queue.put('b1', True, 'b')
+        queue.put('a2', True, 'a')    # replaces the queued a1 in its place
+        queue.put('c1', True, 'c')    # no queued message for c: the oldest is dropped
+        self.assertEquals([ queue.pop() for x in xrange(3) ], [ 'b1', 'c1', None ])  # @UnusedVariable
+        self.assertEquals(queue.dropped, 2)
+
+    def testPolicyNames(self):
+        self.assertEquals(SlowConsumerPolicy.parse('Drop'), SlowConsumerPolicy.DROP_OLDEST)
+        self.assertEquals(SlowConsumerPolicy.parse('disconnect'), SlowConsumerPolicy.DISCONNECT)
+        self.assertRaises(ValueError, SlowConsumerPolicy.parse, 'block')
+        for handler_class in (TCPHandler, EventTCPHandler):
+            self.assertRaises(ValueError, handler_class, '127.0.0.1', 0, None, slow_consumer_policy='block')
+
+    def testCloseWakesWriter(self):
+        queue = OutboundQueue()
+        queue.put('rsp')
+        self.assertEquals(queue.get(), 'rsp')
+        queue.close()
+        self.assertEquals(queue.get(), None)
+
+    def checkStuckClient(self, handler_class, port_attribute):
+        def echo(handler, sender, header, data):
+            handler.send(header, data, sender)
+
+        handler = handler_class('127.0.0.1', 0, echo, send_queue_limit=8,
+                                slow_consumer_policy=SlowConsumerPolicy.DROP_OLDEST)
+        handler.start()
+        port = getattr(handler, port_attribute).getsockname()[1]
+
+        stuck = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        stuck.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        stuck.connect( ('127.0.0.1', port) )
+        reader = socket.create_connection( ('127.0.0.1', port) )
+        reader.settimeout(5.0)
+        try:
+            for x in xrange(100):  # @UnusedVariable
+                if len(handler.broadcast_targets()) == 2:
+                    break
+                time.sleep(0.02)
+
+            message = 'x' * 60000
+            latencies = []
+            for idx in xrange(200):
+                tm_start = time.time()
+                handler.broadcast(Header.MSG_A_STATE_CHANGED, message[:-len(str(idx))] + str(idx))
+                self.assertEquals(read_frame(reader)[1][-len(str(idx)):], str(idx))
+                latencies.append(time.time() - tm_start)
+
+            # the responses of the reading client are not delayed either
+            tm_start = time.time()
+            reader.sendall(struct.pack('!BH', Header.MSG_A_LIST_DEVICES, 4) + 'ping')
+            self.assertEquals(read_frame(reader), (Header.MSG_A_LIST_DEVICES, 'ping'))
+            latencies.append(time.time() - tm_start)
+
+            self.assertTrue(max(latencies) < 1.0, 'Latency: ' + str(max(latencies)))
+            self.assertTrue(sum(target.queue.dropped for target in handler.broadcast_targets()) > 0)
+        finally:
+            stuck.close()
+            reader.close()
+            handler.stop()
+
+    def testStuckClientThreaded(self):
+        self.checkStuckClient(TCPHandler, '_TCPHandler__server_socket')
+
+    def testStuckClientEventLoop(self):
+        self.checkStuckClient(EventTCPHandler, '_EventTCPHandler__server_socket')
+
+if __name__ == "__main__":
+    unittest.main()
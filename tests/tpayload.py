@@ -0,0 +1,134 @@
+'''
+Created on Oct 19, 2026
+
+@author: Viktor Adam
+'''
+
+import random
+import socket
+import time
+import unittest
+import zlib
+
+from modules.comm import ClientOptions, Header
+from modules.comm import payload as payload_module
+from modules.comm.framing import FrameDecoder
+from modules.comm.payload import Payload
+from modules.comm.tcp import TCPHandler, Extension, build_frame, unwrap_extended
+from modules.comm.udp import UDPHandler, Flags
+
+class CountingZlib(object):
+    ''' Stand-in of the zlib module counting the compressions. '''
+
+    def __init__(self):
+        self.compressions = 0
+
+    def compress(self, data, level):
+        self.compressions += 1
+        return zlib.compress(data, level)
+
+    def __getattr__(self, name):
+        return getattr(zlib, name)
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(29)
+        self.text  = ''.join(rnd.choice('abcdef;') for x in xrange(5000))  # @UnusedVariable
+        self.noise = ''.join(chr(rnd.randint(0, 255)) for x in xrange(5000))  # @UnusedVariable
+
+    def testThreshold(self):
+        small = 'x' * (Payload.THRESHOLD - 1)
+        self.assertEquals(Payload(small).content(True), (small, False))
+
+        data, compressed = Payload('x' * Payload.THRESHOLD).content(True)
+        self.assertTrue(compressed)
+        self.assertEquals(Payload.decompress(data), 'x' * Payload.THRESHOLD)
+
+        self.assertEquals(Payload(self.text).content(False), (self.text, False))
+        self.assertEquals(Payload(self.noise).content(True), (self.noise, False))  # would not be smaller
+
+    def testDecompressedSizeCap(self):
+        limit = Payload.MAX_DECOMPRESSED
+        self.assertEquals(len(Payload.decompress(zlib.compress('x' * limit))), limit)
+
+        bomb = zlib.compress('\0' * (limit * 10), 9)
+        self.assertTrue(len(bomb) < limit / 100)
+        self.assertRaises(ValueError, Payload.decompress, bomb)
+
+    def testSharedPayload(self):
+        counting = CountingZlib()
+        payload_module.zlib = counting
+        try:
+            shared = Payload(self.text)
+            handler = UDPHandler('127.0.0.1', 0)
+            for x in xrange(3):  # @UnusedVariable
+                handler.fragments(Header.MSG_A_LIST_DEVICES, shared, True)
+                build_frame(Header.MSG_A_LIST_DEVICES, shared, compression=True)
+            build_frame(Header.MSG_A_LIST_DEVICES, shared, compression=False)
+            self.assertEquals(counting.compressions, 1)
+        finally:
+            payload_module.zlib = zlib
+
+    def testCompressedFragments(self):
+        received = []
+        handler = UDPHandler('127.0.0.1', 0, lambda h, s, header, data: received.append( (header, data) ),
+                             buffer_size=100)
+        handler.start()
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            parts = handler.fragments(Header.MSG_A_SEND_COMMAND, self.text, True)
+            self.assertTrue(len(parts) > 1)
+            for part in parts:
+                self.assertTrue(part[1] & Flags.COMPRESSED)
+            self.assertEquals([ bool(p[1] & Flags.MORE_FOLLOWS) for p in parts ], [ True ] * (len(parts) - 1) + [ False ])
+            self.assertEquals(Payload.decompress(''.join(str(p[2:]) for p in parts)), self.text)
+
+            for part in parts:
+                client.sendto(part, ('127.0.0.1', handler.port))
+            for x in xrange(100):  # @UnusedVariable
+                if received:
+                    break
+                time.sleep(0.02)
+            self.assertEquals(received, [ (Header.MSG_A_SEND_COMMAND, self.text) ])
+        finally:
+            client.close()
+            handler.stop()
+
+    def testCompressedExtendedFrame(self):
+        rnd = random.Random(34)
+        content = ''.join(rnd.choice('0123456789abcdef') for x in xrange(200000))  # @UnusedVariable
+
+        frame = build_frame(Header.MSG_A_LIST_DEVICES, content, compression=True, request_id=7, extended_length=True)
+        decoder = FrameDecoder(extended_length=True)
+        decoder.feed(''.join(frame))
+        (header, data), = list(decoder.frames())
+        self.assertEquals(header, Header.MSG_X_EXTENDED)
+        self.assertEquals(ord(data[0]), Extension.COMPRESSED | Extension.REQUEST_ID)
+        self.assertTrue(65535 < len(data) < len(content))
+        self.assertEquals(unwrap_extended(data), (Header.MSG_A_LIST_DEVICES, content, 7))
+
+        # compressed request and response through the handler
+        def echo(handler, sender, header, data):
+            handler.set_options(sender, ClientOptions([ ClientOptions.ZLIB, ClientOptions.XLEN ]))
+            handler.send(header, data, sender)
+
+        handler = TCPHandler('127.0.0.1', 0, echo)
+        handler.start()
+        client = socket.create_connection( ('127.0.0.1', handler._TCPHandler__server_socket.getsockname()[1]) )
+        client.settimeout(5.0)
+        try:
+            client.sendall(''.join(build_frame(Header.MSG_A_LIST_HISTORY, self.text, compression=True, request_id=8)))
+            decoder, decoded = FrameDecoder(extended_length=True), []
+            while not decoded and decoder.receive(client):
+                decoded.extend(decoder.frames())
+            header, data = decoded[0]
+            self.assertEquals(header, Header.MSG_X_EXTENDED)
+            self.assertEquals(unwrap_extended(data), (Header.MSG_A_LIST_HISTORY, self.text, 8))
+            self.assertTrue(ord(data[0]) & Extension.COMPRESSED)
+        finally:
+            client.close()
+            handler.stop()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,200 @@
+'''
+Created on Oct 19, 2026
+
+@author: Viktor Adam
+'''
+
+import os
+import signal
+import socket
+import struct
+import time
+import unittest
+
+from modules.comm import Header, StateUpdate
+from modules.comm.framing import FrameDecoder
+from modules.comm.prefork import PreforkTCPHandler, WorkerTCPHandler
+
+revoked = set()   # session identifiers rejected by the parent
+
+def application(handler, sender, header, data):
+    ''' Responds with the process identifier of the process handling the message. '''
+    if header == Header.MSG_A_LOGIN:
+        handler.authentication_succeeded('S-' + data.split(':')[0], sender)
+    elif not handler.is_valid_session(data, sender):
+        handler.send(Header.MSG_A_ERROR_INVALID_SESSION, '', sender)
+        return
+    handler.send(header, str(os.getpid()) + ':' + data, sender)
+
+class Test(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.handler = PreforkTCPHandler('127.0.0.1', 0, application, workers=2,
+                                        local_headers=(Header.MSG_A_LIST_DEVICES, ))
+        cls.handler.session_validator = lambda session_id: session_id not in revoked
+        cls.handler.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.handler.stop()
+
+    def setUp(self):
+        self.clients = []
+
+    def tearDown(self):
+        for c, d in self.clients:  # @UnusedVariable
+            c.close()
+
+    def connect(self, handler=None):
+        port = (handler or self.handler).port
+        for attempt in xrange(50):
+            try:
+                c = socket.create_connection( ('127.0.0.1', port) )
+                break
+            except socket.error:
+                if attempt == 49:
+                    raise
+                time.sleep(0.05)  # the workers are still starting
+        c.settimeout(5.0)
+        self.clients.append( (c, FrameDecoder()) )
+        return len(self.clients) - 1
+
+    def request(self, idx, header, data, request_id=None):
+        c = self.clients[idx][0]
+        if request_id is not None:
+            data = chr(0x02) + struct.pack('!I', request_id) + chr(header) + data
+            header = Header.MSG_X_EXTENDED
+        c.sendall(struct.pack('!BH', header, len(data)) + data)
+        return self.read(idx)
+
+    def read(self, idx):
+        c, decoder = self.clients[idx]
+        while True:
+            for frame in decoder.frames():
+                return frame
+            self.assertTrue(decoder.receive(c) > 0)
+
+    def testLocalAndRelayedRequests(self):
+        parent = str(os.getpid())
+        for idx in xrange(4):
+            self.connect()
+
+            # not logged in: relayed and rejected by the parent
+            self.assertEquals(self.request(idx, Header.MSG_A_LIST_DEVICES, 'early'), (Header.MSG_A_ERROR_INVALID_SESSION, ''))
+
+            header, data = self.request(idx, Header.MSG_A_LOGIN, 'user:pass')
+            self.assertEquals(data, parent + ':user:pass')
+
+            header, data = self.request(idx, Header.MSG_A_LIST_DEVICES, 'list')
+            self.assertNotEquals(data.split(':')[0], parent)
+            self.assertEquals(data.split(':')[1], 'list')
+
+            header, data = self.request(idx, Header.MSG_A_SEND_COMMAND, 'cmd', request_id=77)
+            self.assertEquals( (header, data), (Header.MSG_X_EXTENDED, chr(0x02) + struct.pack('!I', 77) +
+                                                chr(Header.MSG_A_SEND_COMMAND) + parent + ':cmd') )
+
+    def testExpiredSession(self):
+        idx = self.connect()
+        self.request(idx, Header.MSG_A_LOGIN, 'expiring:pass')
+        header, data = self.request(idx, Header.MSG_A_LIST_DEVICES, 'list')
+        self.assertEquals(data.split(':')[1], 'list')
+
+        # expired in the parent: the worker does not serve the next read-only request
+        revoked.add('S-expiring')
+        self.handler.revoke_sessions([ 'S-expiring' ])
+        self.assertEquals(self.request(idx, Header.MSG_A_LIST_DEVICES, 'list'), (Header.MSG_A_ERROR_INVALID_SESSION, ''))
+        self.assertEquals(self.request(idx, Header.MSG_A_SEND_COMMAND, 'cmd'), (Header.MSG_A_ERROR_INVALID_SESSION, ''))
+
+    def testBroadcast(self):
+        for idx in xrange(4):
+            self.connect()
+            self.request(idx, Header.MSG_A_LOGIN, 'user:pass')
+
+        self.handler.broadcast(Header.MSG_A_STATE_CHANGED, 'changed')
+        for idx in xrange(4):
+            self.assertEquals(self.read(idx), (Header.MSG_A_STATE_CHANGED, 'changed'))
+
+        entity = { 'unique_id': 'P-1', 'type_id': 3, 'name': 'Lamp', 'state_id': 1,
+                   'state_name': 'On', 'state_value': None, 'last_checkin': 1.5 }
+        self.handler.broadcast_states([ StateUpdate('P-1', 3, 'Lamp', entity) ])
+        for idx in xrange(4):
+            self.assertEquals(self.read(idx), (Header.MSG_A_STATE_CHANGED, 'P-1;3;Lamp;1;On;;1.5'))
+
+        # only to the given targets
+        first = str(self.clients[0][0].getsockname())
+        targets = [ t for t in self.handler.broadcast_targets() if t.address == first ]
+        self.handler.broadcast_states([ StateUpdate('P-1', 3, 'Lamp', entity) ], targets)
+        self.handler.broadcast(Header.MSG_A_STATE_CHANGED, 'changed')
+        self.assertEquals(self.read(0), (Header.MSG_A_STATE_CHANGED, 'P-1;3;Lamp;1;On;;1.5'))
+        for idx in xrange(4):
+            self.assertEquals(self.read(idx), (Header.MSG_A_STATE_CHANGED, 'changed'))
+
+    def testSessionCache(self):
+        validated = []
+        def validator(session_id):
+            validated.append(session_id)
+            if session_id == 'S-slow':
+                time.sleep(1.0)
+            return True
+
+        timeout, WorkerTCPHandler.PARENT_TIMEOUT = WorkerTCPHandler.PARENT_TIMEOUT, 0.2
+        handler = PreforkTCPHandler('127.0.0.1', 0, application, workers=1,
+                                    local_headers=(Header.MSG_A_LIST_DEVICES, ))
+        try:
+            handler.session_validator = validator
+            handler.start()
+            idx = self.connect(handler)
+
+            # the parent is asked once, the accepted session is cached in the worker
+            self.request(idx, Header.MSG_A_LOGIN, 'cached:pass')
+            for x in xrange(3):  # @UnusedVariable
+                self.assertEquals(self.request(idx, Header.MSG_A_LIST_DEVICES, 'list')[1].split(':')[1], 'list')
+            self.assertEquals(validated, [ 'S-cached' ])
+
+            # revoked by the parent: asked again
+            handler.revoke_sessions([ 'S-cached' ])
+            self.request(idx, Header.MSG_A_LIST_DEVICES, 'list')
+            self.assertEquals(validated, [ 'S-cached', 'S-cached' ])
+
+            # the parent is not waited for longer than the timeout
+            self.request(idx, Header.MSG_A_LOGIN, 'slow:pass')
+            started = time.time()
+            self.assertEquals(self.request(idx, Header.MSG_A_LIST_DEVICES, 'list'), (Header.MSG_A_ERROR_INVALID_SESSION, ''))
+            self.assertTrue(time.time() - started < 0.9)
+        finally:
+            WorkerTCPHandler.PARENT_TIMEOUT = timeout
+            handler.stop()
+
+    def testForkBeforeStart(self):
+        handler = PreforkTCPHandler('127.0.0.1', 0, application, workers=2)
+        handler.fork_workers()
+        try:
+            pids = [ w.pid for w in handler._PreforkTCPHandler__workers ]
+            self.assertEquals(len(pids), 2)
+            handler.start()     # the workers forked before are used
+            self.assertEquals([ w.pid for w in handler._PreforkTCPHandler__workers ], pids)
+
+            self.assertEquals(self.request(self.connect(handler), Header.MSG_A_LOGIN, 'user:pass')[1],
+                              str(os.getpid()) + ':user:pass')
+        finally:
+            handler.stop()
+
+    def testStopHungWorker(self):
+        handler = PreforkTCPHandler('127.0.0.1', 0, application, workers=2)
+        handler.start()
+        workers = handler._PreforkTCPHandler__workers
+        os.kill(workers[0].pid, signal.SIGSTOP)
+
+        timeout, PreforkTCPHandler.STOP_TIMEOUT = PreforkTCPHandler.STOP_TIMEOUT, 0.5
+        try:
+            started = time.time()
+            handler.stop()
+            self.assertTrue(time.time() - started < 3.0)
+        finally:
+            PreforkTCPHandler.STOP_TIMEOUT = timeout
+        for worker in workers:
+            self.assertRaises(OSError, os.kill, worker.pid, 0)  # killed and reaped
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,250 @@
+'''
+Created on Oct 19, 2026
+
+@author: Viktor Adam
+'''
+
+import time
+import unittest
+
+from modules.radio import NRF24L01P, SpiCommand, Register, Bits
+from modules.rf.devices import VirtualDevice
+from modules.rf.simulator import Ether, SimulatedNRF24L01P
+from modules.rf.transport import GpioTransport
+from util.clock import monotonic
+
+ADDRESS = [ 0x12 ] * 5
+
+def configure(chip, receiver):
+    ''' Configures the simulated transceiver like the driver does. '''
+    chip.xfer([ SpiCommand.W_REGISTER | Register.SETUP_RETR, Bits.Setup_Retr_ARD_250us | Bits.Setup_Retr_ARC_Upto_3RT ])
+    chip.xfer([ SpiCommand.W_REGISTER | Register.RX_PW_P0, 8 ])
+    chip.xfer([ SpiCommand.W_REGISTER | Register.RX_ADDR_P0 ] + ADDRESS)
+    chip.xfer([ SpiCommand.W_REGISTER | Register.TX_ADDR ] + ADDRESS)
+    chip.xfer([ SpiCommand.W_REGISTER | Register.CONFIG,
+                Bits.Config_EN_CRC | Bits.Config_PWR_UP | (Bits.Config_PRIM_RX if receiver else 0) ])
+    chip.output(12, GpioTransport.HIGH if receiver else GpioTransport.LOW)
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.005)
+    return False
+
+class Receiver(object):
+    ''' Collects the messages dispatched by the driver. '''
+
+    def __init__(self):
+        self.described = { }
+        self.states    = { }
+
+    def describe(self, address, unique_id, data):
+        self.described[unique_id] = data[0]
+
+    def receive(self, address, unique_id, flags, data):
+        self.states[unique_id] = data[0]
+
+class CountingTransceiver(SimulatedNRF24L01P):
+    ''' Counts the SPI transfers of the driver. '''
+
+    def __init__(self, ether):
+        SimulatedNRF24L01P.__init__(self, ether)
+        self.transfers = 0
+
+    def xfer(self, data):
+        self.transfers += 1
+        return SimulatedNRF24L01P.xfer(self, data)
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.ether = Ether(seed=1)
+        self.ether.start()
+
+    def tearDown(self):
+        self.ether.stop()
+
+    def testRegisters(self):
+        chip = SimulatedNRF24L01P(self.ether)
+        chip.xfer([ SpiCommand.W_REGISTER | Register.TX_ADDR, 1, 2, 3, 4, 5 ])
+        self.assertEquals(chip.xfer([ SpiCommand.R_REGISTER | Register.TX_ADDR ] + [ SpiCommand.NOP ] * 5),
+                          [ 0x0E, 1, 2, 3, 4, 5 ])   # STATUS: RX FIFO empty
+
+        for x in xrange(4):  # @UnusedVariable
+            chip.xfer([ SpiCommand.W_TX_PAYLOAD ] + [ x ] * 8)
+        self.assertEquals(chip.readbytes(1)[0] & Bits.Stat_TX_Full, Bits.Stat_TX_Full)
+        fifo = chip.xfer([ SpiCommand.R_REGISTER | Register.FIFO_STATUS, SpiCommand.NOP ])[1]
+        self.assertEquals(fifo, Bits.FifoStat_TX_FULL | Bits.FifoStat_RX_EMPTY)
+
+        chip.xfer([ SpiCommand.FLUSH_TX ])
+        fifo = chip.xfer([ SpiCommand.R_REGISTER | Register.FIFO_STATUS, SpiCommand.NOP ])[1]
+        self.assertEquals(fifo, Bits.FifoStat_TX_EMPTY | Bits.FifoStat_RX_EMPTY)
+
+    def testAutoAcknowledge(self):
+        sender, receiver = SimulatedNRF24L01P(self.ether), SimulatedNRF24L01P(self.ether)
+        configure(sender, False)
+        configure(receiver, True)
+
+        sender.xfer([ SpiCommand.W_TX_PAYLOAD ] + range(8))
+        sender.output(12, GpioTransport.HIGH)
+        self.assertTrue(wait_for(lambda: sender.event_detected(11)))
+        self.assertEquals(sender.readbytes(1)[0] & Bits.Stat_TX_DS, Bits.Stat_TX_DS)
+
+        self.assertTrue(receiver.event_detected(11))
+        self.assertEquals(receiver.input(11), GpioTransport.LOW)
+        self.assertEquals(receiver.xfer([ SpiCommand.R_RX_PAYLOAD ] + [ SpiCommand.NOP ] * 8)[1:], range(8))
+        receiver.xfer([ SpiCommand.W_REGISTER | Register.STATUS, Bits.Stat_RX_DR ])
+        self.assertEquals(receiver.input(11), GpioTransport.HIGH)
+
+        # nobody listens: retransmitted 3 times, then MAX_RT with the packet kept in the FIFO
+        receiver.output(12, GpioTransport.LOW)
+        sender.xfer([ SpiCommand.W_REGISTER | Register.STATUS, Bits.Stat_TX_DS ])
+        sender.xfer([ SpiCommand.W_TX_PAYLOAD ] + range(8))
+        self.assertTrue(wait_for(lambda: sender.event_detected(11)))
+        self.assertEquals(sender.readbytes(1)[0] & (Bits.Stat_MAX_RT | Bits.Stat_TX_DS), Bits.Stat_MAX_RT)
+        self.assertEquals(sender.xfer([ SpiCommand.R_REGISTER | Register.OBSERVE_TX, SpiCommand.NOP ])[1], 0x13)
+        fifo = sender.xfer([ SpiCommand.R_REGISTER | Register.FIFO_STATUS, SpiCommand.NOP ])[1]
+        self.assertFalse(fifo & Bits.FifoStat_TX_EMPTY)
+
+    def testEdgeCallback(self):
+        sender, receiver = SimulatedNRF24L01P(self.ether), SimulatedNRF24L01P(self.ether)
+        edges = []
+        receiver.add_edge_callback(11, edges.append)
+        configure(sender, False)
+        configure(receiver, True)
+
+        for x in xrange(2):  # @UnusedVariable
+            sender.xfer([ SpiCommand.W_TX_PAYLOAD ] + range(8))
+        sender.output(12, GpioTransport.HIGH)
+        self.assertTrue(wait_for(lambda: len(edges) == 1))
+
+        # the line stays low until RX_DR is cleared: one edge for both packets
+        time.sleep(0.05)
+        self.assertEquals(edges, [ 11 ])
+        for x in xrange(2):  # @UnusedVariable
+            self.assertEquals(receiver.xfer([ SpiCommand.R_RX_PAYLOAD ] + [ SpiCommand.NOP ] * 8)[1:], range(8))
+        receiver.xfer([ SpiCommand.W_REGISTER | Register.STATUS, Bits.Stat_RX_DR ])
+        sender.xfer([ SpiCommand.W_TX_PAYLOAD ] + range(8))
+        self.assertTrue(wait_for(lambda: len(edges) == 2))
+
+    def checkDevices(self, loss):
+        self.ether.loss = loss
+        transceiver = SimulatedNRF24L01P(self.ether)
+        radio = NRF24L01P(spi=transceiver, gpio=transceiver)
+        receiver = Receiver()
+        radio.register_message_receiver(receiver)
+
+        devices = [ VirtualDevice(self.ether, 'V%04d' % idx, 101 if idx % 2 else 100, interval=0.2)
+                    for idx in xrange(5) ]
+        radio.start()
+        for device in devices:
+            device.start()
+        try:
+            self.assertTrue(wait_for(lambda: len(receiver.states) == len(devices), timeout=30.0))
+            self.assertEquals(receiver.described, dict( (d.serial, d.type_id) for d in devices ))
+
+            for device in devices:
+                radio.send_message(device.serial, [ chr(0x00), chr(0x01) ])
+            self.assertTrue(wait_for(lambda: all(receiver.states[d.serial] == d.ON_STATES[d.type_id] for d in devices),
+                                     timeout=30.0))
+        finally:
+            for device in devices:
+                device.stop()
+            radio.stop()
+            time.sleep(0.5)
+
+    def testDevices(self):
+        self.checkDevices(0.0)
+
+    def testLossyDevices(self):
+        self.checkDevices(0.1)
+
+    def testScene(self):
+        transceiver = SimulatedNRF24L01P(self.ether)
+        radio = NRF24L01P(spi=transceiver, gpio=transceiver)
+        receiver = Receiver()
+        radio.register_message_receiver(receiver)
+        devices = [ VirtualDevice(self.ether, 'V%04d' % idx, interval=0.5) for idx in xrange(12) ]
+        radio.start()
+        for device in devices:
+            device.start()
+        try:
+            self.assertTrue(wait_for(lambda: len(receiver.states) == len(devices), timeout=15.0))
+
+            # more commands than the window, two of them to the same device
+            for device in devices:
+                radio.send_message(device.serial, [ chr(0x00), chr(0x01) ])
+            radio.send_message(devices[0].serial, [ chr(0x00), chr(0x02), chr(0x80) ])
+            self.assertTrue(wait_for(lambda: all(receiver.states[d.serial] == 0xFF for d in devices[1:]) and
+                                             receiver.states[devices[0].serial] == 0x80, timeout=5.0))
+
+            # each command was acknowledged at the first time
+            time.sleep(0.5)
+            self.assertEquals([ d.commands for d in devices ], [ 2 ] + [ 1 ] * (len(devices) - 1))
+        finally:
+            for device in devices:
+                device.stop()
+            radio.stop()
+            time.sleep(0.1)
+
+    def testMessageIds(self):
+        transceiver = SimulatedNRF24L01P(self.ether)
+        radio = NRF24L01P(spi=transceiver, gpio=transceiver)
+        try:
+            outstanding = radio._NRF24L01P__outstanding
+            generate = radio._NRF24L01P__generate_next_message_id
+            outstanding[2] = outstanding[3] = outstanding[1] = [ 0x01, [], 0, None ]
+
+            ids = [ generate() for x in xrange(300) ]  # @UnusedVariable
+            self.assertEquals(ids[:3], [ 4, 5, 6 ])
+            self.assertEquals(ids[250:254], [ 254, 4, 5, 6 ])   # wrapped, the unacknowledged ones skipped
+        finally:
+            radio.cleanup()
+
+    def testMonotonicDeadlines(self):
+        transceiver = SimulatedNRF24L01P(self.ether)
+        radio = NRF24L01P(spi=transceiver, gpio=transceiver)
+        device = VirtualDevice(self.ether, 'V0001', interval=10.0)
+        device.start()
+        try:
+            outstanding = radio._NRF24L01P__outstanding
+            outstanding[1] = [ 0x01, [], 0, None ]
+            radio._NRF24L01P__transmit([ (1, [ 0x01, 1, 0x00 ] + [ 0x00 ] * 5) ])
+
+            # acknowledged by the radio of the device: waiting for the software acknowledge
+            self.assertEquals(outstanding[1][2], 1)
+            remaining = outstanding[1][3] - monotonic()
+            self.assertTrue(0 < remaining <= NRF24L01P.ACK_TIMEOUT)
+        finally:
+            device.stop()
+            radio.cleanup()
+
+    def testIdle(self):
+        transceiver = CountingTransceiver(self.ether)
+        radio = NRF24L01P(spi=transceiver, gpio=transceiver)
+        receiver = Receiver()
+        radio.register_message_receiver(receiver)
+        device = VirtualDevice(self.ether, 'V0001', interval=10.0)
+        radio.start()
+        device.start()
+        try:
+            self.assertTrue(wait_for(lambda: 'V0001' in receiver.states, timeout=15.0))
+
+            # without traffic the handler sleeps instead of polling the transceiver
+            time.sleep(0.1)
+            transfers = transceiver.transfers
+            time.sleep(0.5)
+            self.assertTrue(transceiver.transfers - transfers <= 2)
+
+            # woken up by a queued message and by the interrupt of the state report
+            radio.send_message('V0001', [ chr(0x00), chr(0x01) ])
+            self.assertTrue(wait_for(lambda: receiver.states['V0001'] == 0xFF, timeout=2.0))
+        finally:
+            device.stop()
+            radio.stop()
+            time.sleep(0.1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+'''
+Created on Oct 19, 2026
+
+@author: Viktor Adam
+'''
+
+import time
+import unittest
+
+from modules.comm.reassembly import ReassemblyBuffer
+
+class Test(unittest.TestCase):
+
+    def testMerge(self):
+        buf = ReassemblyBuffer()
+        self.assertEquals(buf.add('s1', 1, 'single', True, now=0.0), 'single')
+
+        self.assertIsNone(buf.add('s1', 1, 'ab', False, now=0.0))
+        self.assertIsNone(buf.add('s2', 1, '12', False, now=0.0))
+        self.assertIsNone(buf.add('s1', 2, 'xy', False, now=0.0))
+        self.assertIsNone(buf.add('s1', 1, 'cd', False, now=0.0))
+        self.assertEquals(buf.size(), 8)
+
+        self.assertEquals(buf.add('s1', 1, 'ef', True, now=0.0), 'abcdef')
+        self.assertEquals(buf.add('s2', 1, '34', True, now=0.0), '1234')
+        self.assertEquals(buf.size(), 2)
+        self.assertEquals(len(buf), 1)
+
+    def testSenderBudget(self):
+        buf = ReassemblyBuffer(max_per_sender=10)
+        buf.add('s1', 1, 'x' * 6, False, now=0.0)
+        buf.add('s1', 1, 'x' * 6, False, now=0.0)    # above the budget: dropped
+        self.assertEquals( (buf.dropped, buf.size()), (1, 0) )
+
+        # the rest of the dropped message is ignored
+        self.assertIsNone(buf.add('s1', 1, 'x', False, now=0.0))
+        self.assertIsNone(buf.add('s1', 1, 'end', True, now=0.0))
+        self.assertEquals(buf.add('s1', 1, 'new', True, now=0.0), 'new')
+
+    def testGlobalBudget(self):
+        buf = ReassemblyBuffer(max_bytes=10, max_per_sender=10)
+        buf.add('s1', 1, 'a' * 4, False, now=0.0)
+        buf.add('s2', 1, 'b' * 4, False, now=1.0)
+        buf.add('s3', 1, 'c' * 4, False, now=2.0)    # evicts the oldest message
+        self.assertEquals( (buf.evicted, buf.size()), (1, 8) )
+
+        self.assertIsNone(buf.add('s1', 1, 'end', True, now=2.0))
+        self.assertEquals(buf.add('s2', 1, 'end', True, now=2.0), 'bbbbend')
+
+    def testExpiry(self):
+        buf = ReassemblyBuffer(ttl=5.0)
+        buf.add('s1', 1, 'old', False, now=0.0)
+        buf.add('s2', 1, 'new', False, now=3.0)
+
+        buf.add('s3', 1, 'x', True, now=6.0)
+        self.assertEquals( (buf.expired, len(buf), buf.size()), (1, 1, 3) )
+        self.assertEquals(buf.add('s1', 1, 'end', True, now=6.0), 'end')
+
+        buf.discard('s2')
+        self.assertEquals( (len(buf), buf.size()), (0, 0) )
+
+    def testWallClockStep(self):
+        buf = ReassemblyBuffer(ttl=5.0)
+        buf.add('s1', 1, 'ab', False)
+
+        original = time.time
+        time.time = lambda: original() + 3600.0     # NTP sets the clock forward
+        try:
+            self.assertEquals(buf.add('s1', 1, 'cd', True), 'abcd')
+            self.assertEquals(buf.expired, 0)
+        finally:
+            time.time = original
+
+if __name__ == "__main__":
+    unittest.main()
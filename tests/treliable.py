@@ -0,0 +1,162 @@
+'''
+Created on Oct 19, 2026
+
+@author: Viktor Adam
+'''
+
+import random
+import socket
+import time
+import unittest
+
+from modules.comm import Header, ClientOptions
+from modules.comm.payload import Payload
+from modules.comm.reliable import RetransmitWindow, ReliableReceiver, SEQUENCE, encode_nack, decode_nack
+from modules.comm.udp import UDPHandler, Flags
+
+class LossySocket(object):
+    ''' Client socket stand-in dropping the given ratio of the datagrams in both directions. '''
+
+    def __init__(self, drop_rate, seed):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind( ('127.0.0.1', 0) )
+        self.socket.settimeout(0.01)
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.dropped = 0
+
+    def __lost(self):
+        if self.random.random() < self.drop_rate:
+            self.dropped += 1
+            return True
+        return False
+
+    def sendto(self, data, destination):
+        if not self.__lost():
+            self.socket.sendto(data, destination)
+
+    def recv(self):
+        ''' Returns the next datagram not dropped or None on timeout. '''
+        while True:
+            try:
+                data = self.socket.recv(65536)
+            except socket.timeout:
+                return None
+            if not self.__lost():
+                return data
+
+SESSION = 'S' * 32
+
+class Test(unittest.TestCase):
+
+    MESSAGES = 30
+
+    def testNack(self):
+        self.assertEquals(decode_nack(encode_nack(7, [ 1, 4 ])), (7, [ 1, 4 ]))
+        self.assertEquals(decode_nack(encode_nack(0xFFFFFFFF)), (0xFFFFFFFF, []))
+
+    def testWindow(self):
+        window = RetransmitWindow(max_messages=2, max_bytes=100)
+        window.store('a', 1, [ 'x' * 10, 'y' * 10 ])
+        window.store('a', 2, [ 'z' * 10 ])
+        window.store('a', 3, [ 'w' * 10 ])          # above the message limit of the destination
+        self.assertEquals(window.get('a', 1), [])
+        self.assertEquals(window.get('a', 2, [ 0 ]), [ 'z' * 10 ])
+
+        window.store('b', 1, [ 'v' * 90 ])          # above the byte budget: the oldest are evicted
+        self.assertEquals( (window.evicted, window.size()), (1, 100) )
+        window.discard('a')
+        window.discard('b')
+        self.assertEquals(window.size(), 0)
+
+    def testWrap(self):
+        nacks = []
+        receiver = ReliableReceiver(nacks.append, nack_delay=0.05, first=0xFFFFFFFE)
+        datagram = lambda sequence: chr(Header.MSG_A_LIST_DEVICES) + chr(Flags.SEQUENCED) + SEQUENCE.pack(sequence, 0, 1) + 'x'
+
+        self.assertEquals(receiver.receive(datagram(0xFFFFFFFE), now=0), (Header.MSG_A_LIST_DEVICES, Flags.SEQUENCED, 'x'))
+        self.assertIsNotNone(receiver.receive(datagram(1), now=0))          # 0xFFFFFFFF and 0 lost
+        self.assertEquals(receiver.pending(), 2)
+        self.assertEquals(receiver.poll(now=0.1), 2)
+        self.assertEquals(sorted(decode_nack(nack)[0] for nack in nacks), [ 0, 0xFFFFFFFF ])
+
+        self.assertIsNotNone(receiver.receive(datagram(0xFFFFFFFF), now=0.1))
+        self.assertIsNone(receiver.receive(datagram(0xFFFFFFFE), now=0.1))  # delivered before the wrap
+        self.assertEquals(receiver.pending(), 1)
+        receiver.poll(now=0.2, awaiting=True)
+        self.assertEquals(decode_nack(nacks[-1]), (0, []))
+
+    def testNackSession(self):
+        handler = UDPHandler('127.0.0.1', 0, lambda h, s, header, data: None)
+        handler.start()
+        client = LossySocket(0.0, seed=0)
+        try:
+            address = client.socket.getsockname()
+            handler.authentication_succeeded(SESSION, address)
+            handler.set_options(address, ClientOptions.parse(ClientOptions.RELIABLE))
+            handler.send(Header.MSG_A_LIST_DEVICES, 'devices', address)
+            self.assertIsNotNone(client.recv())
+
+            nack = chr(Header.MSG_A_NACK) + chr(0)
+            client.sendto(nack + 'X' * 32 + encode_nack(0), ('127.0.0.1', handler.port))
+            client.sendto(nack + encode_nack(0), ('127.0.0.1', handler.port))
+            time.sleep(0.2)
+            self.assertIsNone(client.recv())
+            self.assertEquals(handler.retransmit.retransmitted, 0)
+
+            client.sendto(nack + SESSION + encode_nack(0), ('127.0.0.1', handler.port))
+            time.sleep(0.2)
+            datagram = client.recv()
+            self.assertEquals( (SEQUENCE.unpack_from(datagram, 2)[0], datagram[2 + SEQUENCE.size:]), (0, 'devices') )
+        finally:
+            client.socket.close()
+            handler.stop()
+
+    def checkDelivery(self, drop_rate):
+        handler = UDPHandler('127.0.0.1', 0, lambda h, s, header, data: None)
+        handler.start()
+        client = LossySocket(drop_rate, seed=int(drop_rate * 100))
+        try:
+            address = client.socket.getsockname()
+            handler.authentication_succeeded(SESSION, address)
+            handler.set_options(address, ClientOptions.parse(ClientOptions.RELIABLE + ',' + ClientOptions.ZLIB))
+
+            messages = [ ''.join(chr(65 + (idx * 7 + pos) % 26) for pos in xrange(idx * 300))
+                         for idx in xrange(Test.MESSAGES) ]   # up to 6 datagrams each
+            for idx, message in enumerate(messages):
+                handler.send(Header.MSG_A_LIST_DEVICES, message, address)
+
+            receiver = ReliableReceiver(lambda nack: client.sendto(chr(Header.MSG_A_NACK) + chr(0) + SESSION + nack,
+                                                                   ('127.0.0.1', handler.port)))
+            received = []
+            deadline = time.time() + 20.0
+            while len(received) < Test.MESSAGES and time.time() < deadline:
+                datagram = client.recv()
+                if datagram is not None:
+                    self.assertTrue(ord(datagram[1]) & Flags.SEQUENCED)
+                    complete = receiver.receive(datagram)
+                    if complete is not None:
+                        header, flags, content = complete
+                        if flags & Flags.COMPRESSED:
+                            content = Payload.decompress(content)
+                        received.append(content)
+                receiver.poll(awaiting=True)
+
+            self.assertEquals(sorted(received), sorted(messages))
+            if drop_rate:
+                self.assertTrue(handler.retransmit.retransmitted > 0)
+        finally:
+            client.socket.close()
+            handler.stop()
+
+    def testNoLoss(self):
+        self.checkDelivery(0.0)
+
+    def testLowLoss(self):
+        self.checkDelivery(0.05)
+
+    def testHighLoss(self):
+        self.checkDelivery(0.3)
+
+if __name__ == "__main__":
+    unittest.main()
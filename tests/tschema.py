@@ -0,0 +1,73 @@
+'''
+Created on Oct 19, 2026
+
+@author: Viktor Adam
+'''
+
+import unittest
+
+from util.database import Database
+Database.TEST_USE_IN_MEMORY_AS_DEFAULT = True
+
+from entities import Entity, EntityType, EntityHistory, COMMAND_ON, COMMAND_OFF
+from entities import STATE_ON, STATE_OFF
+from modules.comm import schema
+
+class Test(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        EntityType.register(198, 'SchemaTestEntity', Entity, [COMMAND_ON, COMMAND_OFF], '#00FF00', 'test.png')
+        cls.etype = EntityType.find(198)
+        cls.entities = [ Entity('S-1', cls.etype, 'First',  STATE_ON, 30, 1389000000.5),
+                         Entity('S-2', cls.etype, 'Second', STATE_OFF) ]
+        cls.history = [ EntityHistory(1389000000.25, 'S-1', 'First', 'State changed to On', EntityHistory.Type_State),
+                        EntityHistory(1389000001.0,  'S-2', 'Second', 'Turning off', EntityHistory.Type_Command) ]
+
+    def testTextMatchesSerialize(self):
+        for e in self.entities:
+            self.assertEquals(schema.TEXT.encode(schema.ENTITY, e), e.serialize())
+        self.assertEquals(schema.TEXT.encode(schema.ENTITY_TYPE, self.etype), self.etype.serialize())
+        self.assertEquals(schema.TEXT.encode(schema.ENTITY_LIST, []), '[]')
+        self.assertEquals(schema.TEXT.encode(schema.HISTORY_LIST, self.history[:1]),
+                          '#1389000000.25;S-1;First;State changed to On;state')
+
+    def testTextDecode(self):
+        types = schema.TEXT.decode(schema.TYPE_LIST, schema.TEXT.encode(schema.TYPE_LIST, [ self.etype, self.etype ]))
+        self.assertEquals(len(types), 2)
+        self.assertEquals([ c['id'] for c in types[1]['commands'] ], [ COMMAND_ON.id, COMMAND_OFF.id ])
+
+        request = schema.TEXT.decode(schema.COMMAND_REQUEST, 'S-1#100;30')
+        self.assertEquals(request, { 'entity_id': 'S-1', 'command_id': 100, 'parameter': '30' })
+        request = schema.TEXT.decode(schema.COMMAND_REQUEST, 'S-1#1')
+        self.assertEquals(request['parameter'], None)
+
+    def testBinaryRoundTrip(self):
+        for list_schema, items in ( (schema.ENTITY_LIST, self.entities),
+                                    (schema.HISTORY_LIST, self.history),
+                                    (schema.TYPE_LIST, [ self.etype ]) ):
+            text    = schema.TEXT.decode(list_schema, schema.TEXT.encode(list_schema, items))
+            binary  = schema.BINARY.decode(list_schema, schema.BINARY.encode(list_schema, items))
+            self.assertEquals(len(binary), len(items))
+            for record in binary:
+                for key in record:
+                    if key not in ('state_value', 'commands', 'last_checkin'):
+                        self.assertEquals(unicode(record[key]), unicode(text[binary.index(record)][key]))
+
+        decoded = schema.BINARY.decode(schema.ENTITY_LIST, schema.BINARY.encode(schema.ENTITY_LIST, self.entities))
+        self.assertEquals(decoded[0]['state_value'], '30')
+        self.assertEquals(decoded[1]['state_value'], None)
+
+        request = { 'entity_id': u'S-\xe9', 'command_id': 100, 'parameter': None }
+        self.assertEquals(schema.BINARY.decode(schema.COMMAND_REQUEST, schema.BINARY.encode(schema.COMMAND_REQUEST, request)), request)
+
+    def testZeroStateValue(self):
+        entity = Entity('S-3', self.etype, 'Third', STATE_OFF, 0, 1389000002.0)
+        text   = schema.TEXT.decode(schema.ENTITY, schema.TEXT.encode(schema.ENTITY, entity))
+        binary = schema.BINARY.decode(schema.ENTITY_LIST, schema.BINARY.encode(schema.ENTITY_LIST, [ entity ]))[0]
+        self.assertEquals(schema.TEXT.encode(schema.ENTITY, entity), entity.serialize())
+        self.assertEquals(text['state_value'], binary['state_value'])
+        self.assertEquals(binary['state_value'], None)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+'''
+Created on Oct 19, 2026
+
+@author: Viktor Adam
+'''
+
+import time
+import unittest
+
+from modules.comm import ClientOptions
+from modules.comm.sessions import SessionTable
+from modules.comm.subscription import Subscription
+from modules.comm.udp import UDPHandler
+
+SESSION = 'a' * 32
+
+class Test(unittest.TestCase):
+
+    def testTable(self):
+        table = SessionTable()
+        table.add( ('10.0.0.1', 1000), SESSION )
+        self.assertTrue(table.touch( ('10.0.0.1', 1000), SESSION ))
+        self.assertFalse(table.touch( ('10.0.0.1', 1000), 'b' * 32 ))
+        self.assertFalse(table.touch( ('10.0.0.2', 1000), SESSION ))
+
+        self.assertIsNone(table.rebind( ('10.0.0.2', 1000), 'b' * 32 ))
+        self.assertEquals(table.rebind( ('10.0.0.2', 1000), SESSION ), [ ('10.0.0.1', 1000) ])
+        self.assertEquals(table.addresses(), [ ('10.0.0.2', 1000) ])
+        self.assertEquals(table.session_of( ('10.0.0.2', 1000) ), SESSION)
+        self.assertEquals(table.rebound, 1)
+
+        self.assertEquals(table.remove( ('10.0.0.2', 1000) ), SESSION)
+        self.assertEquals(len(table), 0)
+
+    def testExpiry(self):
+        table = SessionTable(idle_timeout=0.3, tick=0.05)
+        table.add('idle', SESSION)
+        table.add('active', 'b' * 32)
+
+        expired = []
+        for x in xrange(12):  # @UnusedVariable
+            time.sleep(0.05)
+            table.touch('active', 'b' * 32)
+            expired.extend(table.expire())
+
+        self.assertEquals(expired, [ 'idle' ])
+        self.assertEquals( (table.expired, table.addresses()), (1, [ 'active' ]) )
+
+    def testHandler(self):
+        handler = UDPHandler('127.0.0.1', 0, lambda h, s, header, data: None, session_timeout=0.5)
+        handler.start()
+        try:
+            old, new, idle = ('127.0.0.1', 1001), ('127.0.0.1', 1002), ('127.0.0.1', 1003)
+            handler.authentication_succeeded(SESSION, old)
+            handler.authentication_succeeded('b' * 32, idle)
+            handler.set_options(old, ClientOptions.parse(ClientOptions.ZLIB))
+            handler.subscribe(old, Subscription(type_ids=[ 3 ]))
+
+            self.assertTrue(handler.is_valid_session(SESSION + 'message', new))   # roaming client
+            self.assertFalse(handler.is_valid_session('c' * 32 + 'message', new))
+            self.assertTrue(handler.options_of(new).compression())
+            self.assertFalse(handler.options_of(old).compression())
+            self.assertTrue(handler.subscriptions.is_filtered(new))
+            self.assertFalse(handler.subscriptions.is_filtered(old))
+
+            for x in xrange(10):  # @UnusedVariable
+                time.sleep(0.25)
+                handler.is_valid_session(SESSION, new)
+            self.assertEquals(handler.broadcast_targets(), [ new ])
+        finally:
+            handler.stop()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+'''
+Created on Oct 19, 2026
+
+@author: Viktor Adam
+'''
+
+import unittest
+
+from modules.comm import CommunicationHandler, StateUpdate, ClientOptions
+from modules.comm import schema
+from modules.comm.subscription import Subscription
+from modules.comm.payload import Payload
+
+class RecordingHandler(CommunicationHandler):
+    ''' Communication handler recording the sent messages. '''
+
+    def __init__(self, targets):
+        CommunicationHandler.__init__(self, 'localhost', 0, None)
+        self.targets = targets
+        self.sent = []
+
+    def send(self, header, data, destination):
+        self.sent.append( (destination, Payload.wrap(data).data) )
+
+    def broadcast(self, header, message):
+        for target in self.targets:
+            self.send(header, message, target)
+
+    def broadcast_targets(self):
+        return self.targets
+
+def create_update(unique_id, type_id, name):
+    ''' Creates a state update for an entity described by a dictionary. '''
+    entity = { 'unique_id': unique_id, 'type_id': type_id, 'name': name, 'state_id': 2,
+               'state_name': 'On', 'state_value': None, 'last_checkin': 0 }
+    return StateUpdate(unique_id, type_id, name, entity)
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.light   = create_update('L-1', 101, 'Kitchen light')
+        self.power   = create_update('P-1', 100, 'Kitchen plug')
+        self.bedroom = create_update('L-2', 101, 'Bedroom light')
+
+    def testNoSubscriptions(self):
+        handler = RecordingHandler(['a', 'b'])
+        handler.broadcast_states([self.light])
+        self.assertEquals(handler.sent, [ ('a', self.light.encoded(schema.TEXT)), ('b', self.light.encoded(schema.TEXT)) ])
+
+    def testFilters(self):
+        handler = RecordingHandler(['all', 'lights', 'plug', 'kitchen'])
+        for target in handler.targets:
+            handler.set_options(target, ClientOptions([ ClientOptions.BATCH ]))
+        handler.subscribe('lights',  Subscription(type_ids=[101]))
+        handler.subscribe('plug',    Subscription(entity_ids=['P-1']))
+        handler.subscribe('kitchen', Subscription(name_pattern='kitchen%'))
+
+        handler.broadcast_states([self.light, self.power, self.bedroom])
+        sent = dict(handler.sent)
+
+        self.assertEquals(sent['all'],     StateUpdate.join([self.light, self.power, self.bedroom]))
+        self.assertEquals(sent['lights'],  StateUpdate.join([self.light, self.bedroom]))
+        self.assertEquals(sent['plug'],    self.power.encoded(schema.TEXT))
+        self.assertEquals(sent['kitchen'], StateUpdate.join([self.light, self.power]))
+
+    def testWithoutBatch(self):
+        handler = RecordingHandler(['v1', 'lights'])
+        handler.subscribe('lights', Subscription(type_ids=[101]))
+
+        handler.broadcast_states([self.light, self.power, self.bedroom])
+        self.assertEquals(handler.sent, [ ('v1',     self.light.encoded(schema.TEXT)),
+                                          ('v1',     self.power.encoded(schema.TEXT)),
+                                          ('v1',     self.bedroom.encoded(schema.TEXT)),
+                                          ('lights', self.light.encoded(schema.TEXT)),
+                                          ('lights', self.bedroom.encoded(schema.TEXT)) ])
+
+    def testMixedCodecs(self):
+        handler = RecordingHandler(['text', 'binary'])
+        handler.set_options('binary', ClientOptions([ ClientOptions.BINARY ]))
+        handler.broadcast_states([self.light])
+        sent = dict(handler.sent)
+
+        self.assertEquals(sent['text'], 'L-1;101;Kitchen light;2;On;;0')
+        decoded = schema.BINARY.decode(schema.ENTITY_LIST, sent['binary'])
+        self.assertEquals(decoded, [ self.light.entity ])
+
+    def testNotInterested(self):
+        handler = RecordingHandler(['plug'])
+        handler.subscribe('plug', Subscription(entity_ids=['P-1']))
+        handler.broadcast_states([self.bedroom])
+        self.assertEquals(handler.sent, [])
+
+    def testRenameAndUnsubscribe(self):
+        handler = RecordingHandler(['kitchen'])
+        handler.subscribe('kitchen', Subscription(name_pattern='Kitchen_light'))
+
+        handler.broadcast_states([self.light])
+        renamed = create_update('L-1', 101, 'Hall light')
+        handler.broadcast_states([renamed])
+        self.assertEquals(len(handler.sent), 1)
+
+        handler.unsubscribe('kitchen')
+        handler.broadcast_states([renamed])
+        self.assertEquals(handler.sent[-1], ('kitchen', renamed.encoded(schema.TEXT)))
+
+if __name__ == "__main__":
+    unittest.main()
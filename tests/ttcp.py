@@ -0,0 +1,149 @@
+'''
+Created on Oct 19, 2026
+
+@author: Viktor Adam
+'''
+
+import socket
+import struct
+import threading
+import time
+import unittest
+
+from modules.comm import Header
+from modules.comm.tcp import TCPHandler
+
+def frame(header, data, request_id=None):
+    if request_id is not None:
+        data = chr(0x02) + struct.pack('!I', request_id) + chr(header) + data
+        header = Header.MSG_X_EXTENDED
+    return chr(header) + struct.pack('!H', len(data)) + data
+
+def read_frames(sock, count, timeout=10.0):
+    ''' Reads the given number of frames: (header, data, request_id) tuples. '''
+    sock.settimeout(timeout)
+    buf, frames = '', []
+    while len(frames) < count:
+        if len(buf) >= 3 and len(buf) >= 3 + struct.unpack('!H', buf[1:3])[0]:
+            length = struct.unpack('!H', buf[1:3])[0]
+            header, data, buf = ord(buf[0]), buf[3:3 + length], buf[3 + length:]
+            request_id = None
+            if header == Header.MSG_X_EXTENDED:
+                request_id = struct.unpack('!I', data[1:5])[0]
+                header, data = ord(data[5]), data[6:]
+            frames.append( (header, data, request_id) )
+        else:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            buf += chunk
+    return frames
+
+def application(handler, sender, header, data):
+    ''' Logs in slowly, answers the requests of valid sessions only,
+        sends no response to renames and fails on commands. '''
+    if header == Header.MSG_A_LOGIN:
+        time.sleep(0.05)
+        handler.authentication_succeeded('S-' + data, sender)
+        handler.send(header, 'welcome', sender)
+    elif not handler.is_valid_session(data, sender):
+        handler.send(Header.MSG_A_ERROR_INVALID_SESSION, '', sender)
+    elif header == Header.MSG_A_RENAME_DEVICE:
+        pass
+    elif header == Header.MSG_A_SEND_COMMAND:
+        raise ValueError('unknown device')
+    else:
+        handler.send(header, 'list:' + data, sender)
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = TCPHandler('127.0.0.1', 0, application, workers=4)
+        self.handler.session_validator = lambda session_id: session_id is not None
+        self.handler.start()
+        self.port = self.handler._TCPHandler__server_socket.getsockname()[1]
+        self.clients = []
+
+    def tearDown(self):
+        for c in self.clients:
+            c.close()
+        self.handler.stop()
+
+    def connect(self):
+        c = socket.create_connection( ('127.0.0.1', self.port) )
+        self.clients.append(c)
+        return c
+
+    def testPipelinedLogin(self):
+        for idx in xrange(5):
+            c = self.connect()
+            c.sendall(frame(Header.MSG_A_LOGIN, 'user', 1) +
+                      ''.join(frame(Header.MSG_A_LIST_DEVICES, str(r), r) for r in xrange(2, 10)))
+            frames = read_frames(c, 9)
+            self.assertEquals(frames[0], (Header.MSG_A_LOGIN, 'welcome', 1))
+            self.assertEquals(sorted(frames[1:]), [ (Header.MSG_A_LIST_DEVICES, 'list:' + str(r), r) for r in xrange(2, 10) ])
+
+    def testEveryRequestAnswered(self):
+        c = self.connect()
+        c.sendall(frame(Header.MSG_A_LOGIN, 'user', 1) +
+                  frame(Header.MSG_A_RENAME_DEVICE, 'lamp', 2) +
+                  frame(Header.MSG_A_SEND_COMMAND, 'cmd', 3) +
+                  frame(Header.MSG_A_LIST_DEVICES, 'all', 4))
+        self.assertEquals(sorted(read_frames(c, 4), key=lambda f: f[2]),
+                          [ (Header.MSG_A_LOGIN, 'welcome', 1),
+                            (Header.MSG_A_RENAME_DEVICE, '', 2),     # acknowledged without content
+                            (Header.MSG_A_ERROR, 'unknown device', 3),
+                            (Header.MSG_A_LIST_DEVICES, 'list:all', 4) ])
+
+    def testThreadPerConnection(self):
+        clients = [ self.connect() for x in xrange(3) ]  # @UnusedVariable
+        for idx, c in enumerate(clients):
+            c.sendall(frame(Header.MSG_A_LOGIN, 'user', 1) + frame(Header.MSG_A_LIST_DEVICES, str(idx), 2))
+            self.assertEquals(read_frames(c, 2)[1], (Header.MSG_A_LIST_DEVICES, 'list:' + str(idx), 2))
+
+        # a receiver thread for each connection, the responses are sent by the workers
+        addresses = [ str(c.getsockname()) for c in clients ]
+        self.assertEquals(sorted(t.name for t in threading.enumerate() if t.name.split('|')[-1] in addresses),
+                          sorted('TCP|Receiver|' + address for address in addresses))
+
+    def testUnidentifiedRequests(self):
+        c = self.connect()
+        c.sendall(frame(Header.MSG_A_LIST_DEVICES, 'early') + frame(Header.MSG_A_LOGIN, 'user') +
+                  frame(Header.MSG_A_RENAME_DEVICE, 'lamp') + frame(Header.MSG_A_LIST_DEVICES, 'all'))
+        self.assertEquals(read_frames(c, 3), [ (Header.MSG_A_ERROR_INVALID_SESSION, '', None),
+                                               (Header.MSG_A_LOGIN, 'welcome', None),
+                                               (Header.MSG_A_LIST_DEVICES, 'list:all', None) ])
+
+    def testMaxPending(self):
+        handled = []
+        def respond(handler, sender, header, data):
+            handled.append(header)
+            handler.send(header, 'r' * 65000, sender)
+
+        handler = TCPHandler('127.0.0.1', 0, respond, max_pending=8)
+        handler.start()
+        c = socket.create_connection( ('127.0.0.1', handler._TCPHandler__server_socket.getsockname()[1]) )
+        self.clients.append(c)
+        try:
+            requests = ''.join(frame(Header.MSG_A_LIST_HISTORY, 'q' * 4000, r) for r in xrange(200))
+            writer = threading.Thread(target=c.sendall, args=(requests, ))
+            writer.start()
+            time.sleep(1.0)
+            stalled = len(handled)
+            time.sleep(0.5)
+
+            # the client does not read: once the socket buffers are full
+            # the handler stops reading its requests
+            self.assertEquals(len(handled), stalled)
+            self.assertTrue(stalled < 200)
+            (sender, ) = handler.broadcast_targets()
+            self.assertTrue(len(sender.queue) <= 8 + 65536 / 4000)   # the limit and the requests of one read
+
+            frames = read_frames(c, 200)
+            writer.join()
+            self.assertEquals(sorted(f[2] for f in frames), range(200))
+        finally:
+            handler.stop()
+
+if __name__ == "__main__":
+    unittest.main()
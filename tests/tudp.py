@@ -0,0 +1,131 @@
+'''
+Created on Oct 19, 2026
+
+@author: Viktor Adam
+'''
+
+import socket
+import time
+import unittest
+
+from modules.comm import Header, ClientOptions, StateUpdate
+from modules.comm.payload import Payload
+from modules.comm.udp import UDPHandler, Flags, GroupSigner
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.received = []
+        self.handler = UDPHandler('127.0.0.1', 0, lambda h, s, header, data: self.received.append( (header, data) ),
+                                  buffer_size=100)
+        self.handler.start()
+        self.port = self.handler._UDPHandler__udp_socket.getsockname()[1]
+        self.clients = []
+
+    def tearDown(self):
+        for c in self.clients:
+            c.close()
+        self.handler.stop()
+
+    def client(self):
+        c = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        c.bind( ('127.0.0.1', 0) )
+        c.settimeout(5.0)
+        self.clients.append(c)
+        return c
+
+    def receive(self, c):
+        ''' Receives and merges the datagrams of a message. '''
+        content = ''
+        while True:
+            datagram = c.recv(1500)
+            flags = ord(datagram[1])
+            content += datagram[2:]
+            if not flags & Flags.MORE_FOLLOWS:
+                return ord(datagram[0]), flags, content
+
+    def testFragments(self):
+        parts = self.handler.fragments(Header.MSG_A_LIST_DEVICES, 'x' * 98 * 2 + 'yz', False)
+        self.assertEquals([ str(p) for p in parts ],
+                          [ chr(Header.MSG_A_LIST_DEVICES) + chr(Flags.MORE_FOLLOWS) + 'x' * 98 ] * 2 +
+                          [ chr(Header.MSG_A_LIST_DEVICES) + chr(0) + 'yz' ])
+
+        parts = self.handler.fragments(Header.MSG_A_KEEPALIVE, None, False)
+        self.assertEquals([ str(p) for p in parts ], [ chr(Header.MSG_A_KEEPALIVE) + chr(0) ])
+
+    def testSendAndBroadcast(self):
+        plain, compressed = self.client(), self.client()
+        for c in (plain, compressed):
+            self.handler.authentication_succeeded('session', c.getsockname())
+        self.handler.set_options(compressed.getsockname(), ClientOptions.parse(ClientOptions.ZLIB))
+
+        message = ''.join(chr(65 + idx % 26) for idx in xrange(2000))
+        self.handler.send(Header.MSG_A_LIST_DEVICES, message, plain.getsockname())
+        self.assertEquals(self.receive(plain), (Header.MSG_A_LIST_DEVICES, 0, message))
+
+        self.handler.broadcast(Header.MSG_A_STATE_CHANGED, message)
+        self.assertEquals(self.receive(plain), (Header.MSG_A_STATE_CHANGED, 0, message))
+        header, flags, content = self.receive(compressed)
+        self.assertEquals( (header, flags, Payload.decompress(content)),
+                           (Header.MSG_A_STATE_CHANGED, Flags.COMPRESSED, message) )
+
+        sender = self.client()
+        for part in self.handler.fragments(Header.MSG_A_SEND_COMMAND, message, False):
+            sender.sendto(part, ('127.0.0.1', self.port))
+        sender.sendto(chr(Header.MSG_A_KEEPALIVE) + chr(0), ('127.0.0.1', self.port))
+        for x in xrange(100):  # @UnusedVariable
+            if len(self.received) == 2:
+                break
+            time.sleep(0.02)
+        self.assertEquals(self.received, [ (Header.MSG_A_SEND_COMMAND, message), (Header.MSG_A_KEEPALIVE, '') ])
+
+    def testGroupSend(self):
+        received = []
+        handler = UDPHandler('127.255.255.255', 0, lambda h, s, header, data: received.append( (header, data) ),
+                             broadcast=True, group_send=True)
+        handler.start()
+        try:
+            # receives the datagrams sent to the group address
+            listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind( ('', handler.port) )
+            listener.settimeout(5.0)
+            self.clients.append(listener)
+
+            group, plain = self.client(), self.client()
+            for c in (group, plain):
+                handler.authentication_succeeded('session', c.getsockname())
+            handler.set_options(group.getsockname(), ClientOptions.parse(ClientOptions.GROUP))
+
+            entity = { 'unique_id': 'U-1', 'type_id': 3, 'name': 'Lamp', 'state_id': 1,
+                       'state_name': 'On', 'state_value': None, 'last_checkin': 1.5 }
+            handler.broadcast_states([ StateUpdate('U-1', 3, 'Lamp', entity) ])
+
+            datagram = listener.recv(1500)
+            self.assertEquals( (ord(datagram[0]), ord(datagram[1])), (Header.MSG_A_STATE_CHANGED, Flags.GROUP) )
+            signer = GroupSigner(handler.group_key().decode('hex'))
+            self.assertEquals(signer.verify(datagram), (1, 'U-1;3;Lamp;1;On;;1.5'))
+            self.assertIsNone(signer.verify(datagram[:-1] + 'x'))
+            self.assertIsNone(GroupSigner().verify(datagram))
+
+            self.assertEquals(self.receive(plain), (Header.MSG_A_STATE_CHANGED, 0, 'U-1;3;Lamp;1;On;;1.5'))
+
+            # given targets receive unicast datagrams only
+            handler.broadcast_states([ StateUpdate('U-1', 3, 'Lamp', entity) ], [ group.getsockname() ])
+            self.assertEquals(self.receive(group), (Header.MSG_A_STATE_CHANGED, 0, 'U-1;3;Lamp;1;On;;1.5'))
+            plain.settimeout(0.2)
+            self.assertRaises(socket.timeout, plain.recv, 1500)
+
+            # its own group datagrams are ignored by the source address, not by the flag alone
+            listener.close() # would receive the unicast datagrams to the shared port
+            group.sendto(chr(Header.MSG_A_KEEPALIVE) + chr(Flags.GROUP), ('127.0.0.1', handler.port))
+            for x in xrange(100):  # @UnusedVariable
+                if received:
+                    break
+                time.sleep(0.02)
+            self.assertEquals(received, [ (Header.MSG_A_KEEPALIVE, '') ])
+        finally:
+            handler.stop()
+
+if __name__ == "__main__":
+    unittest.main()